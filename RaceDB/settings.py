@@ -55,6 +55,7 @@ MIDDLEWARE = [
 'django.contrib.auth.middleware.AuthenticationMiddleware',
 'django.contrib.messages.middleware.MessageMiddleware',
 'django.middleware.clickjacking.XFrameOptionsMiddleware',
+'core.request_cache.RequestCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'RaceDB.urls'
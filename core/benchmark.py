@@ -0,0 +1,78 @@
+#-----------------------------------------------------------------------
+# Support for the *_benchmark management commands.
+#
+# Benchmarks run on a new, empty database created the way manage.py test creates one,
+# which is deleted afterwards.  The data they create never touches the configured database,
+# even if a benchmark is interrupted.
+#
+import os
+import datetime
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+from .models import LicenseHolder
+
+@contextmanager
+def benchmark_database():
+	test_settings = connection.settings_dict['TEST']
+	name, test_name = connection.settings_dict['NAME'], test_settings.get('NAME')
+	if connection.vendor == 'sqlite':
+		# On disk as in use, not the in-memory test database.
+		test_settings['NAME'] = os.path.join( tempfile.gettempdir(), 'RaceDB_benchmark_{}.sqlite3'.format(os.getpid()) )
+	try:
+		connection.creation.create_test_db( verbosity=0, autoclobber=True, serialize=False )
+		try:
+			yield
+		finally:
+			connection.creation.destroy_test_db( name, verbosity=0 )
+	finally:
+		test_settings['NAME'] = test_name
+
+#-----------------------------------------------------------------------
+# Synthetic license holders.
+#
+Syllables = (
+	'ma', 'ri', 'an', 'to', 'ber', 'son', 'ka', 'li', 'ne', 'van', 'der', 'mi', 'chel', 'os', 'ta', 'ro', 'sch', 'ul', 'zen', 'ko',
+	'vic', 'pe', 'tr', 'lu', 'gi', 'bo', 'dra', 'fen', 'gu', 'hal', 'jo', 'kin', 'lam', 'mor', 'nu', 'ple', 'quin', 'rus', 'sel', 'tho',
+	'ur', 'vel', 'wi', 'xa', 'yo', 'zo', 'bre', 'cas', 'dun', 'esk', 'fro', 'gla', 'hu', 'ing', 'jas', 'kro', 'lev', 'mun', 'nor', 'oy',
+)
+FirstNames = (
+	'John', 'Marie', 'Pierre', 'Anna', 'Luca', 'Sofia', 'Jan', 'Eva', 'Mark', 'Julie', 'Tomas', 'Ines', 'Peter', 'Lena', 'Marco', 'Sara',
+	'David', 'Emma', 'Paul', 'Chloe', 'Ravi', 'Mei', 'Olaf', 'Greta', 'Hugo', 'Alice', 'Ivan', 'Nadia', 'Kenji', 'Lucia', 'Sean', 'Zoe',
+)
+Cities = ('Toronto', 'Montreal', 'Ottawa', 'Calgary', 'Vancouver', 'Halifax', 'Quebec', 'Guelph', 'Milton', 'Victoria')
+
+BulkSize = 5000
+
+def add_arguments( parser, sizes='10000,100000' ):
+	parser.add_argument('--sizes', dest='sizes', default=sizes, help='Comma separated numbers of license holders to test, eg. 10000,100000,500000')
+	parser.add_argument('--seed', dest='seed', type=int, default=1, help='Random seed')
+
+def get_sizes( options ):
+	return sorted( int(s) for s in options['sizes'].split(',') if s.strip() )
+
+def get_last_name( rng ):
+	return u''.join( rng.choice(Syllables) for i in range(rng.randint(2, 4)) ).capitalize()
+
+def get_license_code( i ):
+	return u'L{}'.format( i )
+
+def get_license_holder( rng, i ):
+	return LicenseHolder(
+		last_name=get_last_name(rng), first_name=rng.choice(FirstNames),
+		date_of_birth=datetime.date(1950 + i % 60, 1 + i % 12, 1 + i % 28),
+		license_code=get_license_code(i), city=rng.choice(Cities),
+	)
+
+def add_license_holders( license_holders ):
+	# Bulk create the holders as an import would (not indexed, see license_holder_index.py).
+	batch = []
+	for lh in license_holders:
+		lh.search_text = lh.get_search_text()[:LicenseHolder.SearchTextLength]
+		batch.append( lh )
+		if len(batch) >= BulkSize:
+			LicenseHolder.objects.bulk_create( batch )
+			batch = []
+	LicenseHolder.objects.bulk_create( batch )
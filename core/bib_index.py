@@ -0,0 +1,355 @@
+#-----------------------------------------------------------------------
+# In-process bib occupancy index.
+#
+# Participant.get_available_numbers and get_bib_auto used to rebuild the free bibs from the
+# CategoryNumbers, the Participants, the NumberSetEntries and past Participants on every call.
+# This index loads that state once per Competition (and NumberSet), keeps it current from the
+# model signals, and answers "available numbers" and "next free bib" with bitsets
+# (Python ints where bit n is bib n).
+#
+# Bibs handed out by next_free_bib are reserved for a short time so desks registering at the
+# same moment get different bibs.  The database is still the final word - the index is dropped
+# and rebuilt if a bib it thinks is free is already taken.
+#
+import time
+import threading
+from collections import defaultdict
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import *
+
+ReservationSeconds = 60
+
+def to_bits( bibs ):
+	bits = bytearray( (max(bibs, default=0) >> 3) + 1 )
+	for bib in bibs:
+		bits[bib >> 3] |= 1 << (bib & 7)
+	return int.from_bytes( bits, 'little' )
+
+def lowest_bit( bits ):
+	return (bits & -bits).bit_length() - 1 if bits else None
+
+lock = threading.RLock()
+competition_indexes = {}	# Key: competition_id
+number_set_indexes = {}		# Key: number_set_id
+
+class NumberSetBibs( object ):
+	def __init__( self, number_set ):
+		self.version = 0
+		self.has_ranges = bool( number_set.get_range_events() )
+		self.bib_max = number_set.get_bib_max_count_all() if self.has_ranges else {}
+
+		self.entries = {}					# Key: NumberSetEntry pk, Data: (license_holder_id, bib, date_lost)
+		self.used = defaultdict( int )		# Key: bib, Data: count of entries
+		self.current = defaultdict( set )	# Key: license_holder_id, Data: bibs held (not lost)
+		self.lost = defaultdict( dict )		# Key: bib, Data: {pk: date_lost}
+		for pk, license_holder_id, bib, date_lost in number_set.numbersetentry_set.values_list(
+				'pk', 'license_holder', 'bib', 'date_lost'):
+			self.add_entry( pk, license_holder_id, bib, date_lost )
+
+		# Past Participants in Competitions using this NumberSet.
+		self.previous = {}						# Key: participant pk, Data: (category_id, bib, license_holder_id, start_date)
+		self.previous_category = defaultdict( dict )	# Key: category_id, Data: {participant pk: (bib, license_holder_id, start_date)}
+		for pk, category_id, bib, license_holder_id, start_date in Participant.objects.filter(
+				competition__number_set=number_set, bib__isnull=False, category__isnull=False).values_list(
+				'pk', 'category', 'bib', 'license_holder', 'competition__start_date'):
+			self.add_previous( pk, category_id, bib, license_holder_id, start_date )
+
+	def bib_max_get( self, bib ):
+		# Matches get_bib_max_count_all().get(bib, 0).
+		return self.bib_max.get( bib, 0 )
+
+	def bib_available( self, bib ):
+		# Matches get_bib_available_all().get(bib, -1) for a bib with entries.
+		return (self.bib_max.get(bib, 0) if self.has_ranges else 1) - self.used[bib]
+
+	def add_entry( self, pk, license_holder_id, bib, date_lost ):
+		self.entries[pk] = (license_holder_id, bib, date_lost)
+		self.used[bib] += 1
+		if date_lost is None:
+			self.current[license_holder_id].add( bib )
+		else:
+			self.lost[bib][pk] = date_lost
+
+	def remove_entry( self, pk ):
+		if pk not in self.entries:
+			return
+		license_holder_id, bib, date_lost = self.entries.pop( pk )
+		self.used[bib] -= 1
+		if date_lost is None:
+			# A license holder may hold the same bib more than once.
+			if not any( e[0] == license_holder_id and e[1] == bib and e[2] is None for e in self.entries.values() ):
+				self.current[license_holder_id].discard( bib )
+		else:
+			self.lost[bib].pop( pk, None )
+
+	def add_previous( self, pk, category_id, bib, license_holder_id, start_date ):
+		self.previous[pk] = (category_id, bib, license_holder_id, start_date)
+		self.previous_category[category_id][pk] = (bib, license_holder_id, start_date)
+
+	def remove_previous( self, pk ):
+		if pk in self.previous:
+			category_id, bib, license_holder_id, start_date = self.previous.pop( pk )
+			self.previous_category[category_id].pop( pk, None )
+
+class CategoryBibs( object ):
+	# The allocation state of the categories sharing a CategoryNumbers.
+	def __init__( self, index, number_set_bibs, category_ids, numbers ):
+		allocated = {}
+		lost = {}
+		candidates = defaultdict( list )
+		if numbers:
+			for category_id in category_ids:
+				for bib, license_holder_id in index.category_bibs[category_id].values():
+					if bib in numbers:
+						allocated[bib] = license_holder_id
+
+			nsb = number_set_bibs
+			if nsb:
+				# A license holder with only one bib in these numbers owns it if it cannot be shared.
+				current = {}
+				for license_holder_id, bibs in nsb.current.items():
+					bibs = bibs & numbers
+					if bibs:
+						current[license_holder_id] = bibs
+						if len(bibs) == 1:
+							bib = next(iter(bibs))
+							if nsb.bib_max_get(bib) == 1:
+								allocated[bib] = license_holder_id
+
+				# Past participants in these categories own the bibs they still hold, most recent first.
+				previous = sorted(
+					(start_date, license_holder_id, bib)
+						for category_id in category_ids
+							for bib, license_holder_id, start_date in nsb.previous_category[category_id].values()
+								if bib in numbers and bib not in allocated and bib in current.get(license_holder_id, ())
+				)
+				for start_date, license_holder_id, bib in reversed(previous):
+					if license_holder_id not in candidates[bib]:
+						candidates[bib].append( license_holder_id )
+
+				for bib, dates_lost in nsb.lost.items():
+					if dates_lost and bib in numbers and nsb.bib_available(bib) == 0:
+						lost[bib] = max( dates_lost.values() )
+
+		self.allocated = allocated
+		self.candidates = dict( candidates )
+		self.lost = lost
+		self.taken_bits = to_bits( list(allocated.keys()) + list(lost.keys()) )
+		self.candidate_bits = to_bits( list(candidates.keys()) )
+
+		# Bibs only taken because of this license holder's own history.
+		self.own_bits = defaultdict( int )
+		for bib, license_holder_ids in candidates.items():
+			if len(license_holder_ids) == 1:
+				self.own_bits[license_holder_ids[0]] |= 1 << bib
+
+	def get_taken_bits( self, license_holder_id ):
+		return self.taken_bits | (self.candidate_bits & ~self.own_bits.get(license_holder_id, 0))
+
+	def get_allocated( self, license_holder_id ):
+		allocated = dict( self.allocated )
+		for bib, license_holder_ids in self.candidates.items():
+			for lh_id in license_holder_ids:
+				if lh_id != license_holder_id:
+					allocated[bib] = lh_id
+					break
+		return allocated
+
+class CompetitionBibs( object ):
+	def __init__( self, competition ):
+		self.version = 0
+		self.number_set_id = competition.number_set_id
+
+		self.numbers = {}			# Key: CategoryNumbers pk, Data: (category_ids, bibs, sorted bibs, bits)
+		self.category_group = {}	# Key: category_id, Data: CategoryNumbers pk
+		for category_numbers in CategoryNumbers.objects.filter( competition=competition ).order_by('pk').prefetch_related('categories'):
+			category_numbers.competition = competition
+			category_ids = tuple( c.pk for c in category_numbers.categories.all() )
+			numbers = category_numbers.get_numbers()
+			self.numbers[category_numbers.pk] = (category_ids, numbers, sorted(numbers), to_bits(numbers))
+			for category_id in category_ids:
+				self.category_group.setdefault( category_id, category_numbers.pk )
+
+		self.participants = {}		# Key: participant pk, Data: (category_id, bib, license_holder_id)
+		self.category_bibs = defaultdict( dict )	# Key: category_id, Data: {participant pk: (bib, license_holder_id)}
+		for pk, category_id, bib, license_holder_id in Participant.objects.filter(
+				competition=competition, bib__isnull=False, category__isnull=False).values_list(
+				'pk', 'category', 'bib', 'license_holder'):
+			self.add_participant( pk, category_id, bib, license_holder_id )
+
+		self.states = {}				# Key: CategoryNumbers pk, Data: (version, CategoryBibs)
+		self.reserved = defaultdict( dict )	# Key: CategoryNumbers pk, Data: {bib: (license_holder_id, expiry)}
+
+	def add_participant( self, pk, category_id, bib, license_holder_id ):
+		self.participants[pk] = (category_id, bib, license_holder_id)
+		self.category_bibs[category_id][pk] = (bib, license_holder_id)
+
+	def remove_participant( self, pk ):
+		if pk in self.participants:
+			category_id, bib, license_holder_id = self.participants.pop( pk )
+			self.category_bibs[category_id].pop( pk, None )
+
+	def get_number_set_bibs( self ):
+		if not self.number_set_id:
+			return None
+		nsb = number_set_indexes.get( self.number_set_id )
+		if nsb is None:
+			nsb = number_set_indexes[self.number_set_id] = NumberSetBibs( NumberSet.objects.get(pk=self.number_set_id) )
+		return nsb
+
+	def get_state( self, category_numbers_id ):
+		nsb = self.get_number_set_bibs()
+		version = (self.version, nsb.version if nsb else 0)
+		state = self.states.get( category_numbers_id )
+		if state is None or state[0] != version:
+			category_ids, numbers, available, bits = self.numbers[category_numbers_id]
+			state = self.states[category_numbers_id] = (version, CategoryBibs(self, nsb, category_ids, numbers))
+		return state[1]
+
+	def get_reserved_bits( self, category_numbers_id, license_holder_id ):
+		now = time.time()
+		reserved = self.reserved[category_numbers_id]
+		bits = 0
+		for bib, (lh_id, expiry) in list(reserved.items()):
+			if expiry < now:
+				del reserved[bib]
+			elif lh_id != license_holder_id:
+				bits |= 1 << bib
+		return bits
+
+#-----------------------------------------------------------------------
+
+def get_competition_bibs( competition ):
+	index = competition_indexes.get( competition.pk )
+	if index is None:
+		index = competition_indexes[competition.pk] = CompetitionBibs( competition )
+	return index
+
+def invalidate( competition_id=None, number_set_id=None ):
+	# Drop the indexes after changes that bypass the signals (bulk updates).
+	with lock:
+		if competition_id is None and number_set_id is None:
+			competition_indexes.clear()
+			number_set_indexes.clear()
+			return
+		competition_indexes.pop( competition_id, None )
+		if number_set_id is not None:
+			number_set_indexes.pop( number_set_id, None )
+			for pk, index in list(competition_indexes.items()):
+				if index.number_set_id == number_set_id:
+					del competition_indexes[pk]
+
+def get_available_numbers( participant ):
+	# Returns (available_numbers, allocated_numbers, lost_bibs, category_numbers_defined) like Participant.get_available_numbers.
+	with lock:
+		index = get_competition_bibs( participant.competition )
+		category_numbers_id = index.category_group.get( participant.category_id )
+		if category_numbers_id is None:
+			return [], {}, {}, False
+		available = index.numbers[category_numbers_id][2]
+		state = index.get_state( category_numbers_id )
+		allocated = state.get_allocated( participant.license_holder_id )
+		lost = dict( state.lost )
+	license_holders = LicenseHolder.objects.in_bulk( list(set(allocated.values())) )
+	return list(available), {bib:license_holders[lh_id] for bib, lh_id in allocated.items()}, lost, True
+
+def next_free_bib( participant, reserve=True ):
+	# Returns the lowest free bib and reserves it for this license holder.
+	for attempt in range(2):
+		with lock:
+			index = get_competition_bibs( participant.competition )
+			category_numbers_id = index.category_group.get( participant.category_id )
+			if category_numbers_id is None:
+				return None
+			category_ids = index.numbers[category_numbers_id][0]
+			free = index.numbers[category_numbers_id][3] & ~(
+				index.get_state(category_numbers_id).get_taken_bits(participant.license_holder_id) |
+				index.get_reserved_bits(category_numbers_id, participant.license_holder_id)
+			)
+			bib = lowest_bit( free )
+			if bib is None:
+				return None
+			if reserve:
+				index.reserved[category_numbers_id][bib] = (participant.license_holder_id, time.time() + ReservationSeconds)
+
+		# Check the database in case the index missed a change (rolled back transaction, another process).
+		if not Participant.objects.filter( competition=participant.competition, category__in=category_ids, bib=bib ).exclude(
+				license_holder=participant.license_holder_id).exists():
+			return bib
+		invalidate( participant.competition_id )
+	return None
+
+#-----------------------------------------------------------------------
+# Keep the indexes current.
+#
+@receiver( post_save, sender=Participant )
+@receiver( post_delete, sender=Participant )
+def update_participant( sender, **kwargs ):
+	participant = kwargs['instance']
+	if not competition_indexes and not number_set_indexes:
+		return
+	bib = participant.bib if participant.category_id and kwargs.get('signal') == post_save else None
+	with lock:
+		index = competition_indexes.get( participant.competition_id )
+		if index:
+			index.remove_participant( participant.pk )
+			if bib:
+				index.add_participant( participant.pk, participant.category_id, bib, participant.license_holder_id )
+				# The reservation is now an allocation.
+				category_numbers_id = index.category_group.get( participant.category_id )
+				if category_numbers_id is not None:
+					index.reserved[category_numbers_id].pop( bib, None )
+			index.version += 1
+
+		for nsb in number_set_indexes.values():
+			if participant.pk in nsb.previous:
+				nsb.remove_previous( participant.pk )
+				nsb.version += 1
+		if bib and number_set_indexes:
+			competition = participant.competition
+			nsb = number_set_indexes.get( competition.number_set_id )
+			if nsb:
+				nsb.add_previous( participant.pk, participant.category_id, bib, participant.license_holder_id, competition.start_date )
+				nsb.version += 1
+
+@receiver( post_save, sender=NumberSetEntry )
+@receiver( post_delete, sender=NumberSetEntry )
+def update_number_set_entry( sender, **kwargs ):
+	nse = kwargs['instance']
+	with lock:
+		nsb = number_set_indexes.get( nse.number_set_id )
+		if nsb:
+			nsb.remove_entry( nse.pk )
+			if kwargs.get('signal') == post_save:
+				nsb.add_entry( nse.pk, nse.license_holder_id, nse.bib, nse.date_lost )
+			nsb.version += 1
+
+@receiver( post_save, sender=NumberSet )
+@receiver( post_delete, sender=NumberSet )
+def update_number_set( sender, **kwargs ):
+	if competition_indexes or number_set_indexes:
+		invalidate( number_set_id=kwargs['instance'].pk )
+
+@receiver( post_save, sender=Competition )
+@receiver( post_delete, sender=Competition )
+def update_competition( sender, **kwargs ):
+	# The NumberSet or the start date may have changed.
+	if competition_indexes or number_set_indexes:
+		invalidate()
+
+@receiver( post_save, sender=CategoryNumbers )
+@receiver( post_delete, sender=CategoryNumbers )
+def update_category_numbers( sender, **kwargs ):
+	if competition_indexes:
+		invalidate( kwargs['instance'].competition_id )
+
+@receiver( m2m_changed, sender=CategoryNumbers.categories.through )
+def update_category_numbers_categories( sender, **kwargs ):
+	if competition_indexes:
+		if kwargs.get('reverse', False):
+			invalidate()		# Changed from the Category side.
+		else:
+			invalidate( kwargs['instance'].competition_id )
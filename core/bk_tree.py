@@ -0,0 +1,94 @@
+#-----------------------------------------------------------------------
+# Levenshtein distance and a Burkhard-Keller tree for finding similar names.
+#
+# levenshtein.py is a standalone script (it reads a dictionary when run), so it cannot be imported.
+#
+def levenshtein(a,b):
+	"Calculates the Levenshtein distance between a and b."
+	if len(a) < len(b):
+		a,b = b,a
+	return levenshtein_from( b )( a )
+
+def levenshtein_from( pattern ):
+	"Returns a function that calculates the Levenshtein distance from pattern to a string."
+	# Bit-parallel algorithm (Myers 1999, Hyyro 2001).
+	# Bit i of the vectors is row i of the edit distance table, so each column is a few int operations.
+	m = len(pattern)
+	if not m:
+		return len
+
+	peq = {}
+	for i, c in enumerate(pattern):
+		peq[c] = peq.get(c, 0) | (1 << i)
+
+	full = (1 << m) - 1
+	last = 1 << (m - 1)
+	def distance( text ):
+		pv, mv, score = full, 0, m
+		for c in text:
+			eq = peq.get(c, 0)
+			xv = eq | mv
+			xh = (((eq & pv) + pv) ^ pv) | eq
+			ph = mv | ~(xh | pv)
+			mh = pv & xh
+			if ph & last:
+				score += 1
+			elif mh & last:
+				score -= 1
+			ph = (ph << 1) | 1
+			mh <<= 1
+			pv = (mh | ~(xv | ph)) & full
+			mv = ph & xv & full
+		return score
+	return distance
+
+#----------------------------------------------------------------------------
+
+class BKTree( object ):
+	"Burkhard-Keller tree.  Finds all keys within a distance of a key without comparing to every key."
+
+	def __init__( self, distance=levenshtein, distance_from=levenshtein_from ):
+		self.distance = distance
+		self.distance_from = distance_from		# Returns a function for the distance from one key to others.
+		self.root = None		# (key, {distance:child})
+		self.count = 0
+
+	def __len__( self ):
+		return self.count
+
+	def add( self, key ):
+		# Returns True if the key was not in the tree.
+		if self.root is None:
+			self.root = (key, {})
+			self.count += 1
+			return True
+
+		node = self.root
+		while True:
+			d = self.distance( key, node[0] )
+			if d == 0:
+				return False
+			child = node[1].get( d )
+			if child is None:
+				node[1][d] = (key, {})
+				self.count += 1
+				return True
+			node = child
+
+	def search( self, key, max_distance ):
+		# Returns [(distance, key)] of the keys within max_distance, closest first.
+		distance = self.distance_from( key )
+		results = []
+		nodes = [self.root] if self.root is not None else []
+		while nodes:
+			node_key, children = nodes.pop()
+			d = distance( node_key )
+			if d <= max_distance:
+				results.append( (d, node_key) )
+			# By the triangle inequality, only children at distance d +/- max_distance can match.
+			for child_d in range(max(d - max_distance, 1), d + max_distance + 1):
+				child = children.get( child_d )
+				if child is not None:
+					nodes.append( child )
+		results.sort()
+		return results
@@ -0,0 +1,147 @@
+#-----------------------------------------------------------------------
+# In-process category/event matrix.
+#
+# Registration asks which categories a license holder can still enter and whether a set of
+# categories would race in the same event.  Both only depend on the waves of the Competition,
+# so the wave categories are read once (one query for each wave type) and kept until a wave,
+# event, category or the Competition changes.
+#
+import threading
+from collections import defaultdict
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import *
+
+lock = threading.RLock()
+competition_matrices = {}
+
+class EventCategories( object ):
+	def __init__( self, EventClass, event_id, option_id ):
+		self.EventClass = EventClass
+		self.event_id = event_id
+		self.option_id = option_id
+		self.category_ids = set()		# Categories in any wave.
+		self.categories = []			# Categories of the Competition's CategoryFormat in any wave, sorted by sequence.
+		self.format_category_ids = frozenset()
+
+	def get_event( self ):
+		return self.EventClass.objects.get( pk=self.event_id )
+
+	def is_participating( self, participant, option_ids ):
+		# Like Event.is_participating with the participant's option_ids already read.
+		return (
+			participant.category_id in self.category_ids and
+			(not self.option_id or self.option_id in option_ids)
+		)
+
+class CategoryMatrix( object ):
+	def __init__( self, competition ):
+		format_categories = { c.pk:c for c in Category.objects.filter(format_id=competition.category_format_id) }
+
+		self.events = []			# In the order of Competition.get_events.
+		for EventClass, WaveClass in ((EventMassStart, Wave), (EventTT, WaveTT)):
+			events = {}
+			for event_id, option_id in EventClass.objects.filter(competition=competition).order_by('date_time').values_list('pk', 'option_id'):
+				events[event_id] = EventCategories( EventClass, event_id, option_id )
+				self.events.append( events[event_id] )
+
+			for event_id, category_id in WaveClass.categories.through.objects.filter(
+					**{WaveClass.__name__.lower() + '__event__competition':competition}
+				).values_list( WaveClass.__name__.lower() + '__event', 'category' ):
+				events[event_id].category_ids.add( category_id )
+
+			for e in events.values():
+				e.format_category_ids = frozenset( e.category_ids & set(format_categories.keys()) )
+				e.categories = sorted( (format_categories[pk] for pk in e.format_category_ids), key=lambda c: c.sequence )
+
+	def get_conflict( self, category_ids ):
+		# Returns the first event where more than one of the categories would race.
+		for e in self.events:
+			if len(category_ids & e.format_category_ids) > 1:
+				return e
+		return None
+
+#-----------------------------------------------------------------------
+
+def get_category_matrix( competition ):
+	with lock:
+		matrix = competition_matrices.get( competition.pk )
+		if matrix is None:
+			matrix = competition_matrices[competition.pk] = CategoryMatrix( competition )
+		return matrix
+
+def invalidate( competition_id=None ):
+	with lock:
+		if competition_id is None:
+			competition_matrices.clear()
+		else:
+			competition_matrices.pop( competition_id, None )
+
+def get_available_categories( competition, license_holder, gender=None, participant_exclude=None ):
+	categories_remaining = Category.objects.filter( format=competition.category_format )
+	if gender is None:
+		gender = license_holder.gender
+	if gender != -1:
+		categories_remaining = categories_remaining.filter( Q(gender=2) | Q(gender=gender) )
+
+	participants = list( Participant.objects.filter(competition=competition, role=Participant.Competitor, license_holder=license_holder) )
+	if not participants:
+		return list(categories_remaining)
+
+	# Only return categories that are not in the same event.
+	categories_remaining = set( categories_remaining )
+
+	if participant_exclude:
+		categories_remaining.discard( participant_exclude.category )
+
+	participants = [p for p in participants if p != participant_exclude and p.category_id]
+	option_ids = defaultdict( set )
+	for participant_id, option_id in ParticipantOption.objects.filter(
+			competition=competition, participant__in=participants).values_list('participant', 'option_id'):
+		option_ids[participant_id].add( option_id )
+
+	for e in get_category_matrix( competition ).events:
+		if any( e.is_participating(p, option_ids[p.pk]) for p in participants ):
+			categories_remaining.difference_update( e.categories )
+	return sorted( categories_remaining, key=lambda c: c.sequence )
+
+def is_category_conflict( competition, categories ):
+	# Returns (is_conflict, event, event_categories) like Competition.is_category_conflict.
+	if len(categories) > 1:
+		e = get_category_matrix( competition ).get_conflict( set(c.pk for c in categories) )
+		if e:
+			return True, e.get_event(), list(e.categories)
+	return False, None, None
+
+#-----------------------------------------------------------------------
+# Keep the matrices current.
+#
+@receiver( post_save, sender=EventMassStart )
+@receiver( post_delete, sender=EventMassStart )
+@receiver( post_save, sender=EventTT )
+@receiver( post_delete, sender=EventTT )
+def update_event( sender, **kwargs ):
+	if competition_matrices:
+		invalidate( kwargs['instance'].competition_id )
+
+@receiver( post_save, sender=Competition )
+@receiver( post_delete, sender=Competition )
+def update_competition( sender, **kwargs ):
+	# The CategoryFormat may have changed.
+	if competition_matrices:
+		invalidate( kwargs['instance'].pk )
+
+@receiver( post_save, sender=Wave )
+@receiver( post_delete, sender=Wave )
+@receiver( post_save, sender=WaveTT )
+@receiver( post_delete, sender=WaveTT )
+@receiver( m2m_changed, sender=Wave.categories.through )
+@receiver( m2m_changed, sender=WaveTT.categories.through )
+@receiver( post_save, sender=Category )
+@receiver( post_delete, sender=Category )
+def update_waves( sender, **kwargs ):
+	# Waves are deleted with their events, so do not look up the Competition.
+	if competition_matrices:
+		invalidate()
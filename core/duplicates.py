@@ -0,0 +1,257 @@
+#-----------------------------------------------------------------------
+# Duplicate license holder detection.
+#
+# Comparing every license holder to every other does not scale, so each holder gets a few
+# blocking keys (normalized name and birth year, phonetic last name and birth year, date of birth
+# and first initial, UCI ID) in LicenseHolderDuplicateKey.  Only holders that share a key are
+# compared.  The pairs that score as likely duplicates are kept in LicenseHolderDuplicate.
+#
+# The keys and pairs are kept current with the other license holder indexes (see license_holder_index.py).
+#
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Q, Count
+
+from .models import LicenseHolder, LicenseHolderDuplicateKey, LicenseHolderDuplicate, Participant, invalid_date_of_birth
+from . import utils
+from .bk_tree import levenshtein
+
+MinScore = 0.7			# Lowest score kept as a duplicate.
+MinNameSimilarity = 0.7	# Less similar names are different people unless the UCI IDs match.
+MaxBlockSize = 100		# Holders sharing a key with more than this are not compared (eg. a placeholder date of birth).
+BatchSize = 500			# Keep the query parameters under the SQLite limit.
+
+KeyLength = LicenseHolderDuplicateKey._meta.get_field('key').max_length
+ReasonsLength = LicenseHolderDuplicate._meta.get_field('reasons').max_length
+
+reNonAlphaNum = re.compile( r'[^A-Z0-9]' )
+def normalize( s ):
+	return reNonAlphaNum.sub( u'', utils.removeDiacritic(s or u'').upper() )
+
+SoundexCodes = { c:str(d) for d, letters in enumerate(('AEIOUYHW', 'BFPV', 'CGJKQSXZ', 'DT', 'L', 'MN', 'R')) for c in letters }
+def soundex( s ):
+	s = u''.join( c for c in normalize(s) if c.isalpha() )
+	if not s:
+		return u''
+	code, previous = [s[0]], SoundexCodes[s[0]]
+	for c in s[1:]:
+		d = SoundexCodes[c]
+		if d != '0' and d != previous:
+			code.append( d )
+		if c not in 'HW':		# H and W do not separate letters with the same code.
+			previous = d
+	return (u''.join(code) + u'000')[:4]
+
+def get_blocking_keys( last_name, first_name, date_of_birth, uci_id ):
+	last, first = normalize( last_name ), normalize( first_name )
+	keys = set()
+	if uci_id:
+		keys.add( u'U:{}'.format(uci_id) )
+	if last:
+		year = date_of_birth.year if date_of_birth != invalid_date_of_birth else u''
+		keys.add( u'N:{}:{}:{}'.format(last, first[:1], year) )
+		keys.add( u'P:{}:{}:{}'.format(soundex(last), first[:1], year) )
+	if date_of_birth != invalid_date_of_birth:
+		keys.add( u'D:{}:{}'.format(date_of_birth.isoformat(), first[:1]) )
+	return set( k[:KeyLength] for k in keys )
+
+#-----------------------------------------------------------------------
+# Scoring.
+#
+HolderFields = ('pk', 'last_name', 'first_name', 'gender', 'date_of_birth', 'uci_id')
+IndexFields = HolderFields[1:]
+
+def similarity( a, b ):
+	if a == b:
+		return 1.0
+	if not a or not b:
+		return 0.0
+	return max( 0.0, 1.0 - levenshtein(a, b) / float(max(len(a), len(b))) )
+
+def first_name_similarity( a, b ):
+	if not a or not b:
+		return 0.5
+	if a.startswith(b) or b.startswith(a):		# Initial or short form.
+		return 1.0
+	return similarity( a, b )
+
+def date_of_birth_similarity( a, b ):
+	if a == invalid_date_of_birth or b == invalid_date_of_birth:
+		return 0.5, u''
+	if a == b:
+		return 1.0, u'date of birth'
+	if a.year == b.year:
+		if a.month == b.day and a.day == b.month:
+			return 0.9, u'day/month swapped'
+		if a.month == b.month or a.day == b.day:
+			return 0.6, u'date of birth close'
+		return 0.3, u''
+	return 0.0, u''
+
+def score_pair( a, b ):
+	# a and b are tuples of HolderFields.  Returns (score, reasons).
+	reasons = []
+	last = similarity( normalize(a[1]), normalize(b[1]) )
+	first = first_name_similarity( normalize(a[2]), normalize(b[2]) )
+	name = 0.6 * last + 0.4 * first
+	if name == 1.0:
+		reasons.append( u'name' )
+	elif name >= 0.7:
+		reasons.append( u'similar name' )
+	dob, dob_reason = date_of_birth_similarity( a[4], b[4] )
+	if dob_reason:
+		reasons.append( dob_reason )
+	gender = 1.0 if a[3] == b[3] else 0.0
+	if not gender:
+		reasons.append( u'different gender' )
+	score = 0.5 * name + 0.35 * dob + 0.15 * gender if name >= MinNameSimilarity else 0.0
+	if a[5] and b[5]:
+		if a[5] == b[5]:
+			score = max( score, 0.95 )
+			reasons.insert( 0, u'UCIID' )
+		else:
+			score *= 0.8
+			reasons.append( u'different UCIID' )
+	return score, u', '.join( reasons )[:ReasonsLength]
+
+#-----------------------------------------------------------------------
+# Candidate pairs.
+#
+def batches( items ):
+	items = list( items )
+	for i in range(0, len(items), BatchSize):
+		yield items[i:i+BatchSize]
+
+def get_blocks( keys ):
+	# Returns {key: [license_holder_id]} for the keys, without the blocks too large to compare.
+	blocks = defaultdict( list )
+	for b in batches( keys ):
+		for key, pk in LicenseHolderDuplicateKey.objects.filter( key__in=b ).values_list('key', 'license_holder_id'):
+			blocks[key].append( pk )
+	return { key:pks for key, pks in blocks.items() if len(pks) <= MaxBlockSize }
+
+def get_candidate_pairs( pks, keys ):
+	# Returns the (lower pk, higher pk) pairs sharing a key where one of the pair is in pks.
+	pks = set( pks )
+	pairs = set()
+	for block in get_blocks( keys ).values():
+		block.sort()
+		for i, pk in enumerate(block):
+			for other in block[i+1:]:
+				if pk in pks or other in pks:
+					pairs.add( (pk, other) )
+	return pairs
+
+def get_holder_fields( pks ):
+	holders = {}
+	for b in batches( pks ):
+		for h in LicenseHolder.objects.filter( pk__in=b ).values_list(*HolderFields):
+			holders[h[0]] = h
+	return holders
+
+def update_pairs( pks, keys ):
+	# Replace the pairs of the holders in pks from the holders sharing keys with them.
+	pairs = get_candidate_pairs( pks, keys )
+	holders = get_holder_fields( set(pk for pair in pairs for pk in pair) )
+	duplicates = []
+	for pk, other in pairs:
+		score, reasons = score_pair( holders[pk], holders[other] )
+		if score >= MinScore:
+			duplicates.append( LicenseHolderDuplicate(license_holder_id=pk, duplicate_id=other, score=score, reasons=reasons) )
+	for b in batches( pks ):
+		LicenseHolderDuplicate.objects.filter( Q(license_holder__in=b) | Q(duplicate__in=b) ).delete()
+	LicenseHolderDuplicate.objects.bulk_create( duplicates, ignore_conflicts=True )
+
+def index_license_holder( license_holder ):
+	keys = get_blocking_keys( license_holder.last_name, license_holder.first_name, license_holder.date_of_birth, license_holder.uci_id )
+	existing = set( LicenseHolderDuplicateKey.objects.filter(license_holder=license_holder).values_list('key', flat=True) )
+	if existing - keys:
+		LicenseHolderDuplicateKey.objects.filter( license_holder=license_holder, key__in=list(existing - keys) ).delete()
+	if keys - existing:
+		LicenseHolderDuplicateKey.objects.bulk_create(
+			[LicenseHolderDuplicateKey(license_holder=license_holder, key=k) for k in keys - existing]
+		)
+	update_pairs( [license_holder.pk], keys )
+
+def index_chunk( license_holders ):
+	pks = [lh.pk for lh in license_holders]
+	for b in batches( pks ):
+		LicenseHolderDuplicateKey.objects.filter( license_holder__in=b ).delete()
+	rows = [(lh.pk, k) for lh in license_holders for k in get_blocking_keys(lh.last_name, lh.first_name, lh.date_of_birth, lh.uci_id)]
+	sql = 'INSERT INTO {} (license_holder_id, {}) VALUES (%s, %s)'.format(
+		LicenseHolderDuplicateKey._meta.db_table, connection.ops.quote_name('key') )
+	with connection.cursor() as cursor:
+		cursor.executemany( sql, rows )
+	update_pairs( pks, set(k for pk, k in rows) )
+
+def clear():
+	LicenseHolderDuplicate.objects.all().delete()
+	LicenseHolderDuplicateKey.objects.all().delete()
+
+#-----------------------------------------------------------------------
+# Groups of duplicates for the Manage Duplicates page.
+#
+def get_competition_counts( pks ):
+	counts = {}
+	for b in batches( pks ):
+		counts.update( Participant.objects.filter(license_holder__in=b).values('license_holder')
+			.annotate(competition_count=Count('competition', distinct=True)).values_list('license_holder', 'competition_count') )
+	return counts
+
+def get_duplicates():
+	# import this here to avoid a circular dependency.
+	from .license_holder_index import index_license_holders
+	index_license_holders()
+
+	# Join the pairs into groups (union-find).
+	parent = {}
+	def find( pk ):
+		root = pk
+		while parent.get(root, root) != root:
+			root = parent[root]
+		while pk != root:
+			parent[pk], pk = root, parent[pk]
+		return root
+
+	pairs = list( LicenseHolderDuplicate.objects.values_list('license_holder_id', 'duplicate_id', 'score', 'reasons') )
+	for pk, other, score, reasons in pairs:
+		parent.setdefault( pk, pk )
+		parent.setdefault( other, other )
+		a, b = find( pk ), find( other )
+		if a != b:
+			parent[max(a, b)] = min( a, b )
+
+	groups = defaultdict( lambda: {'pks':set(), 'score':0.0, 'reasons':u''} )
+	for pk, other, score, reasons in pairs:
+		g = groups[find(pk)]
+		g['pks'].update( (pk, other) )
+		if score > g['score']:
+			g['score'], g['reasons'] = score, reasons
+
+	license_holders = {}
+	for b in batches( parent.keys() ):
+		license_holders.update( LicenseHolder.objects.in_bulk(b) )
+	competition_counts = get_competition_counts( parent.keys() )
+	for pk, lh in license_holders.items():
+		lh.competition_count_value = competition_counts.get( pk, 0 )
+
+	duplicates = []
+	for g in groups.values():
+		lhs = sorted( (license_holders[pk] for pk in g['pks'] if pk in license_holders), key=lambda lh: lh.search_text )
+		if len(lhs) < 2:
+			continue
+		lh = lhs[0]
+		name_initial = u'{}, {}'.format(utils.removeDiacritic(lh.last_name).upper(), utils.removeDiacritic(lh.first_name[:1]).upper())
+		duplicates.append( {
+			'key': (name_initial,),
+			'score': g['score'],
+			'reasons': g['reasons'],
+			'duplicateIds': u','.join(u'{}'.format(lh.pk) for lh in lhs),
+			'license_holders': lhs,
+			'license_holders_len': len(lhs),
+		} )
+
+	duplicates.sort( key=lambda r: r['key'] )
+	return duplicates
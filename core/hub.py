@@ -1,20 +1,77 @@
 import re
+import time
 import datetime
 import operator
+import hashlib
+from functools import wraps
 from collections import defaultdict
 
 from django.utils.translation import ugettext_lazy as _
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.core.cache import cache
 
 from .views_common import *
 from .models import *
 
 from .views import license_holders_from_search_text
 from .results import get_payload_for_result
+from . import series_standings
 
 ItemsPerPage = 25
 
+#------------------------------------------------------------------------------------
+# Hub result pages are versioned by the ResultsVersion counters of what they show.
+# Browsers revalidate with the ETag and get a 304 if nothing has changed.
+# Rendered pages are also kept in the cache so a spectator refresh does not re-query the results.
+# Changes that do not bump a version (e.g. a LicenseHolder name) show up after HubCacheSeconds,
+# as the ETag and Last-Modified also change at the start of each HubCacheSeconds period.
+#
+HubCacheSeconds = 10*60
+
+def hub_cache( get_version_keys ):
+	def decorator( decorated_func ):
+		@wraps( decorated_func )
+		def wrap( request, *args, **kwargs ):
+			if request.method not in ('GET', 'HEAD'):
+				return decorated_func( request, *args, **kwargs )
+			
+			versions = ResultsVersion.get_versions( get_version_keys(**kwargs) )
+			path = request.get_full_path()
+			period = int( time.time() // HubCacheSeconds )
+			etag = quote_etag( hashlib.md5(
+				u'{} {} {}'.format(path, period, u' '.join(u'{}:{}'.format(key, version) for key, version, updated in versions)).encode()
+			).hexdigest() )
+			last_modified = max( max(updated for key, version, updated in versions).timestamp(), period * HubCacheSeconds )
+			
+			response = get_conditional_response( request, etag=etag, last_modified=last_modified )
+			if response is None:
+				cache_key = u'hub:{}'.format( etag )
+				response = cache.get( cache_key )
+				if response is None:
+					response = decorated_func( request, *args, **kwargs )
+					if response.status_code == 200:
+						cache.set( cache_key, response, HubCacheSeconds )
+			
+			if response.status_code in (200, 304):
+				response['ETag'] = etag
+				response['Last-Modified'] = http_date( last_modified )
+				patch_cache_control( response, no_cache=True, must_revalidate=True )
+			return response
+		return wrap
+	return decorator
+
+def competition_version_keys( competitionId, **kwargs ):
+	return [ResultsVersion.competition_key(int(competitionId))]
+
+def event_version_keys( eventId, eventType, **kwargs ):
+	return [ResultsVersion.event_key(int(eventType), int(eventId))]
+
+def series_version_keys( seriesId, **kwargs ):
+	return [ResultsVersion.series_key(int(seriesId))]
+
 def competitions_with_results( competitions=None ):
 	if competitions is None:
 		competitions = Competition.objects.all()
@@ -123,6 +180,7 @@ def SearchCompetitions( request ):
 	exclude_breadcrumbs = True
 	return render( request, 'hub_competitions_list.html', locals() )
 
+@hub_cache( competition_version_keys )
 def CompetitionResults( request, competitionId ):
 	competition = get_object_or_404( Competition, pk=competitionId )
 	events = competition.get_events()
@@ -177,6 +235,7 @@ def CompetitionResults( request, competitionId ):
 	exclude_breadcrumbs = True
 	return render( request, 'hub_events_list.html', locals() )
 
+@hub_cache( event_version_keys )
 def CategoryResults( request, eventId, eventType, categoryId ):
 	eventType = int(eventType)
 	event = get_object_or_404( (EventMassStart,EventTT)[eventType], pk=eventId )
@@ -212,6 +271,7 @@ def CategoryResults( request, eventId, eventType, categoryId ):
 	show_category = wave.rank_categories_together
 	return render( request, 'hub_results_list.html', locals() )
 
+@hub_cache( event_version_keys )
 def CustomCategoryResults( request, eventId, eventType, customCategoryId ):
 	eventType = int(eventType)
 	event = get_object_or_404( (EventMassStart, EventTT)[eventType], pk=eventId )
@@ -237,6 +297,7 @@ def LicenseHolderResults( request, licenseHolderId ):
 	exclude_breadcrumbs = True
 	return render( request, 'hub_license_holder_results.html', locals() )
 
+@hub_cache( event_version_keys )
 def ResultAnalysis( request, eventId, eventType, resultId ):
 	eventType = int(eventType)
 	event = get_object_or_404( (EventMassStart,EventTT)[eventType], pk=eventId )
@@ -321,7 +382,7 @@ def SearchLicenseHolders( request ):
 		if search_type == 0:
 			search_fields = search_text.split(',')[:2]
 			st = utils.get_search_text([f.strip() for f in search_fields])[:-1]
-			license_holders = LicenseHolder.objects.filter( search_text__startswith=st )
+			license_holders = LicenseHolder.objects.filter( get_search_query([st]), search_text__startswith=st )
 		elif search_type == 1:
 			license_holders = LicenseHolder.objects.filter( license_code=search_text.upper() )
 		elif search_type == 2:
@@ -360,6 +421,9 @@ def SeriesList( request ):
 def SeriesCategories( request, seriesId ):
 	series = get_object_or_404( Series, pk=seriesId )
 	
+	# Compute the standings for all categories in one pass so the category pages are ready.
+	series_standings.update_stale_standings( series )
+	
 	gender_categories = [[],[],[]]
 	for c in series.get_categories():
 		gender_categories[c.gender].append( c )
@@ -371,8 +435,8 @@ def SeriesCategories( request, seriesId ):
 
 #------------------------------------------------------------------------------------
 
-from . import series_results
 
+@hub_cache( series_version_keys )
 def SeriesCategoryResults( request, seriesId, categoryId, customCategoryIndex=None ):
 	series = get_object_or_404( Series, pk=seriesId )
 	categoryId = int(categoryId)
@@ -380,13 +444,13 @@ def SeriesCategoryResults( request, seriesId, categoryId, customCategoryIndex=No
 	if categoryId:
 		category = get_object_or_404( Category, pk=categoryId )
 		custom_category_name = None
-		results, events = series_results.get_results_for_category( series, category )
+		results, events = series_standings.get_results_for_category( series, category )
 		group_categories = series.get_group_related_categories( category )
 		is_custom_category = False
 	else:
 		category = None
 		custom_category_name = series.custom_category_names.split(',\n')[int(customCategoryIndex)]
-		results, events = series_results.get_results_for_custom_category_name( series, custom_category_name )
+		results, events = series_standings.get_results_for_custom_category_name( series, custom_category_name )
 		for e in events:
 			e.custom_category_cur = e.get_custom_category_set().filter( name=custom_category_name ).first()
 		group_categories = []
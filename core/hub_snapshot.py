@@ -0,0 +1,194 @@
+#-----------------------------------------------------------------------------------------------
+# Export the Hub pages as static files.
+#
+# Each page is written as <url>/index.html with a precompressed index.html.gz beside it.
+# A manifest records the ResultsVersion signature of every exported page so later exports
+# only re-render pages whose results have changed.
+#
+import os
+import re
+import json
+import gzip
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.db import connections
+
+from .models import *
+from .hub import competitions_with_results_or_prereg, ItemsPerPage
+
+ManifestName = 'hub_snapshot.json'
+
+# Paginated pages are exported as <url>page/<n>/ (page 1 is <url>) as a static server ignores ?page=<n>.
+SearchCompetitionsUrl = '/RaceDB/Hub/SearchCompetitions/'
+rePageUrl = re.compile( r'^(?P<url>.*/)page/(?P<page>\d+)/$' )
+rePageLink = re.compile( r'href="\?page=(?P<page>\d+)"' )
+
+def get_page_url( url, page ):
+	return url if page == 1 else '{}page/{}/'.format( url, page )
+
+def get_request_url( url ):
+	m = rePageUrl.match( url )
+	return '{}?page={}'.format( m.group('url'), m.group('page') ) if m else url
+
+def fix_page_links( url, content ):
+	# Point the pagination links to the exported pages.
+	m = rePageUrl.match( url )
+	base_url = m.group('url') if m else url
+	return rePageLink.sub(
+		lambda m: 'href="{}"'.format(get_page_url(base_url, int(m.group('page')))), content.decode()
+	).encode()
+
+def get_hub_pages( competitions=None ):
+	'''
+		Returns [(url, [version keys])] for all the Hub pages to export.
+	'''
+	# The SearchCompetitions listing always shows every Competition, even when exporting a subset.
+	competition_keys = [ResultsVersion.competition_key(pk) for pk in competitions_with_results_or_prereg().values_list('pk', flat=True)]
+	pages = [(get_page_url(SearchCompetitionsUrl, page), competition_keys) for page in range(1, max((len(competition_keys) + ItemsPerPage - 1) // ItemsPerPage, 1) + 1)]
+
+	competitions = list( competitions_with_results_or_prereg(competitions).order_by('-start_date') )
+	competition_ids = set( c.pk for c in competitions )
+	for competition in competitions:
+		pages.append( ('/RaceDB/Hub/CompetitionResults/{}/'.format(competition.pk), [ResultsVersion.competition_key(competition.pk)]) )
+		for event in competition.get_events():
+			keys = [ResultsVersion.event_key(event.event_type, event.pk)]
+			for wave in event.get_wave_set().all():
+				if wave.has_results():
+					category_ids = set( wave.get_results().values_list('participant__category__pk',flat=True) )
+				else:
+					category_ids = set( p.category.pk for p in wave.get_participants() if p.category )
+				for category_id in sorted( c for c in category_ids if c is not None ):
+					pages.append( ('/RaceDB/Hub/CategoryResults/{}/{}/{}/'.format(event.pk, event.event_type, category_id), keys) )
+			for cc in event.get_custom_categories():
+				pages.append( ('/RaceDB/Hub/CustomCategoryResults/{}/{}/{}/'.format(event.pk, event.event_type, cc.pk), keys) )
+
+	# License holders with results depend on the Competitions they raced in.
+	# Their pages link to the ResultAnalysis page of each result.
+	license_holder_competitions = defaultdict( set )
+	for event_type, ResultClass in enumerate((ResultMassStart, ResultTT)):
+		for result_id, event_id, license_holder_id, competition_id in (ResultClass.objects
+				.filter( event__competition__in=competition_ids )
+				.values_list('pk', 'event', 'participant__license_holder', 'event__competition')
+				.order_by('event', 'pk')):
+			license_holder_competitions[license_holder_id].add( competition_id )
+			pages.append( ('/RaceDB/Hub/ResultAnalysis/{}/{}/{}/'.format(event_id, event_type, result_id), [ResultsVersion.event_key(event_type, event_id)]) )
+	for license_holder_id, ids in sorted( license_holder_competitions.items() ):
+		pages.append( ('/RaceDB/Hub/LicenseHolderResults/{}/'.format(license_holder_id), [ResultsVersion.competition_key(i) for i in sorted(ids)]) )
+
+	series_all = list( Series.objects.exclude(name__startswith='_') )
+	pages.append( ('/RaceDB/Hub/Series/', [ResultsVersion.series_key(s.pk) for s in series_all]) )
+	for series in series_all:
+		keys = [ResultsVersion.series_key(series.pk)]
+		pages.append( ('/RaceDB/Hub/SeriesCategories/{}/'.format(series.pk), keys) )
+		for category in series.get_categories():
+			pages.append( ('/RaceDB/Hub/SeriesCategoryResults/{}/{}/'.format(series.pk, category.pk), keys) )
+		for i, custom_category_name in enumerate(series.get_custom_category_names()):
+			pages.append( ('/RaceDB/Hub/SeriesCategoryResults/{}/0/{}/'.format(series.pk, i), keys) )
+
+	# Remove duplicates so two processes never render the same page.
+	seen = set()
+	return [(url, keys) for url, keys in pages if not (url in seen or seen.add(url))]
+
+def get_signatures( pages ):
+	versions = {}
+	for key, version, updated in ResultsVersion.get_versions( sorted(set(key for url, keys in pages for key in keys)) ):
+		versions[key] = version
+	return {
+		url: hashlib.md5( u' '.join(u'{}:{}'.format(key, versions[key]) for key in keys).encode() ).hexdigest()
+			for url, keys in pages
+	}
+
+def get_page_fname( output_dir, url ):
+	return os.path.join( output_dir, *(url.strip('/').split('/') + ['index.html']) )
+
+def write_file( fname, content ):
+	# Write to a temp file and rename so a web server never sees a partial page.
+	fname_tmp = fname + '.tmp'
+	with open(fname_tmp, 'wb') as f:
+		f.write( content )
+	os.replace( fname_tmp, fname )
+
+#-----------------------------------------------------------------------
+# Render process.
+#
+client = None
+
+def init_render_process():
+	global client
+	if not apps.ready:
+		django.setup()
+	from django.test import Client
+	client = Client()
+
+def render_page( output_dir, url ):
+	response = client.get( get_request_url(url) )
+	if response.status_code != 200:
+		return url, response.status_code, 0
+	content = response.content
+	if url.startswith( SearchCompetitionsUrl ):
+		content = fix_page_links( url, content )
+	fname = get_page_fname( output_dir, url )
+	os.makedirs( os.path.dirname(fname), exist_ok=True )
+	write_file( fname, content )
+	write_file( fname + '.gz', gzip.compress(content, compresslevel=9, mtime=0) )
+	return url, response.status_code, len(content)
+
+#-----------------------------------------------------------------------
+
+def export_hub( output_dir, competitions=None, processes=None, force=False, progress=None ):
+	'''
+		Returns (rendered, unchanged, removed, errors).
+	'''
+	manifest_fname = os.path.join( output_dir, ManifestName )
+	try:
+		with open(manifest_fname, 'r') as f:
+			manifest = json.load( f )
+	except (IOError, ValueError):
+		manifest = {}
+
+	pages = get_hub_pages( competitions )
+	signatures = get_signatures( pages )
+
+	unchanged = [
+		url for url, signature in signatures.items()
+			if not force and manifest.get(url) == signature and os.path.exists(get_page_fname(output_dir, url))
+	]
+	unchanged_set = set( unchanged )
+	to_render = [url for url, keys in pages if url not in unchanged_set]
+
+	# Remove pages that no longer exist (only when exporting everything).
+	removed = []
+	if competitions is None:
+		for url in manifest.keys():
+			if url not in signatures:
+				for fname in (get_page_fname(output_dir, url), get_page_fname(output_dir, url) + '.gz'):
+					if os.path.exists(fname):
+						os.remove( fname )
+				removed.append( url )
+
+	manifest_new = {url:manifest[url] for url in manifest.keys() if url not in removed}
+	manifest_new.update( (url, signatures[url]) for url in unchanged )
+
+	errors = []
+	rendered = []
+	if to_render:
+		# Do not share database connections with the render processes.
+		connections.close_all()
+		with ProcessPoolExecutor( max_workers=processes, initializer=init_render_process ) as executor:
+			for url, status_code, size in executor.map( render_page, [output_dir]*len(to_render), to_render, chunksize=8 ):
+				if status_code == 200:
+					rendered.append( url )
+					manifest_new[url] = signatures[url]
+				else:
+					errors.append( (url, status_code) )
+					manifest_new.pop( url, None )
+				if progress:
+					progress( url, status_code, size )
+
+	os.makedirs( output_dir, exist_ok=True )
+	write_file( manifest_fname, json.dumps(manifest_new, indent=1, sort_keys=True).encode() )
+	return rendered, unchanged, removed, errors
@@ -123,6 +123,7 @@ def init_oca( fname, message_stream=sys.stdout ):
 			
 			team_name = ur.club or ur.trade_team
 			TeamHint.objects.filter( license_holder=lh ).delete()
+			RegistrationProfile.invalidate( [lh] )
 			if team_name:
 				team_names = [t.strip() for t in team_name.split(',') if t.strip()]
 				for count, team_name in enumerate(team_names):
@@ -149,6 +149,7 @@ def init_usac( fname=None, states='' ):
 			th_delete = set( teams.values() ) - th_used
 			if th_delete:
 				TeamHint.objects.filter( id__in = [th.id for th in th_delete] ).delete()
+				RegistrationProfile.invalidate( [lh] )
 
 	ur_records = []
 	with open(fname, 'r', errors='replace') as fp:
@@ -120,6 +120,7 @@ def license_holder_import_excel(
 				for d in disciplines:
 					team_hints.append( TeamHint(license_holder=lh, team=t, discipline=d, effective_date=effective_date) )
 			TeamHint.objects.bulk_create( team_hints )
+			RegistrationProfile.invalidate( list(license_holder_team.keys()) )
 			license_holder_team.clear()
 		
 	license_holder_discipline_team = {}		# Key: (license_holder, discipline), Data: team.
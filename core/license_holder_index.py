@@ -0,0 +1,47 @@
+#-----------------------------------------------------------------------
+# Indexes kept for every LicenseHolder.
+#
+# The search trigrams (search_index.py) and the duplicate keys (duplicates.py) are kept current
+# by LicenseHolder.save.  Holders written some other way (bulk_create, raw SQL, an existing
+# database after a migration) have indexed=False.  index_license_holders adds them to every index
+# in chunks, and is run by fix data, by get_duplicates and by the build_license_holder_indexes command.
+# Searches use the original scan while any holder is not indexed.
+#
+# Each index module has IndexFields (the LicenseHolder fields it is built from), index_license_holder
+# (one holder, from save), index_chunk (a list of holders not in the index) and clear (remove everything).
+#
+from django.db import transaction
+
+from .models import LicenseHolder
+from . import search_index, duplicates
+
+Indexes = (search_index, duplicates)
+IndexFields = LicenseHolder.IndexFields
+BatchSize = 500			# Keep the query parameters under the SQLite limit.
+
+def index_license_holder( license_holder, fields_changed=None ):
+	# Update the indexes built from the fields changed (all of them if None).
+	for index in Indexes:
+		if fields_changed is None or not fields_changed.isdisjoint( index.IndexFields ):
+			index.index_license_holder( license_holder )
+
+def index_license_holders( rebuild=False, chunk_size=2000 ):
+	# Index the holders not in the indexes yet (all of them if rebuild).  Returns the number indexed.
+	if rebuild:
+		for index in Indexes:
+			index.clear()
+		LicenseHolder.objects.filter( indexed=True ).update( indexed=False )
+
+	count = 0
+	while True:
+		with transaction.atomic():
+			license_holders = list( LicenseHolder.objects.filter(indexed=False).order_by('pk').only(*IndexFields)[:chunk_size] )
+			if not license_holders:
+				break
+			for index in Indexes:
+				index.index_chunk( license_holders )
+			pks = [lh.pk for lh in license_holders]
+			for i in range(0, len(pks), BatchSize):
+				LicenseHolder.objects.filter( pk__in=pks[i:i+BatchSize] ).update( indexed=True )
+		count += len(license_holders)
+	return count
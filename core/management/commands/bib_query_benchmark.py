@@ -0,0 +1,129 @@
+import time
+import random
+import datetime
+
+from django.db import connection, OperationalError
+from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import *
+from core.benchmark import benchmark_database, get_license_code, add_license_holders
+from core.utils import safe_print
+
+#-----------------------------------------------------------------------
+# The original query builder, used as the reference.
+#
+def get_bib_query_reference( bibs ):
+	if not bibs:
+		return Q( bib=999999 )
+
+	bibs = sorted( set(bibs) )
+	standalone_bibs = []	# List of individual bibs not in a range.
+
+	def add_range( query, a, b ):
+		if a == b:
+			standalone_bibs.append( a )
+			return query
+		try:
+			return query | Q(bib__range=(a,b))
+		except TypeError:
+			return Q(bib__range=(a,b))
+
+	query = None
+	a = b = bibs[0]
+	for n in bibs[1:]:
+		if n - 1 == b: # Part of the group, bump the end
+			b = n
+		else: # Not part of the group, process current group and start a new
+			query = add_range( query, a, b )
+			a = b = n
+	query = add_range( query, a, b )
+
+	if standalone_bibs:
+		q = Q( bib=standalone_bibs[0] ) if len(standalone_bibs) == 1 else Q( bib__in=standalone_bibs )
+		try:
+			query |= q
+		except TypeError:
+			query = q
+
+	return query
+
+#-----------------------------------------------------------------------
+
+def get_shapes( rng ):
+	return (
+		('contiguous',     set(range(1, 20001))),
+		('blocks',         set(n for b in range(0, 20000, 100) for n in range(b+1, b+51))),
+		('pairs',          set(n for b in range(0, 20000, 10) for n in (b+1, b+2))),
+		('scattered',      set(rng.sample(range(1, 100000), 3000))),
+		('alternate',      set(range(1, 20001, 2))),
+		('holes',          set(range(1, 100000)) - set(rng.sample(range(1, 100000), 3000))),
+		('ranges+scatter', set(n for b in range(0, 99000, 1000) for n in range(b+1, b+200)) | set(rng.sample(range(1, 100000), 2000))),
+	)
+
+def make_data( entries, seed ):
+	rng = random.Random( seed )
+	name = 'Bib Query {}'.format( seed )
+	number_set = NumberSet.objects.create( name=name )
+	add_license_holders(
+		LicenseHolder( last_name='Bib{}'.format(i), first_name='Query', date_of_birth=datetime.date(1980,1,1), license_code=get_license_code(i) )
+			for i in range(entries)
+	)
+	license_holder_ids = LicenseHolder.objects.values_list('pk', flat=True)
+	bibs = rng.sample( range(1, 100000), entries )
+	NumberSetEntry.objects.bulk_create( [
+		NumberSetEntry(number_set=number_set, license_holder_id=lh_id, bib=bib) for lh_id, bib in zip(license_holder_ids, bibs)
+	] )
+	return number_set
+
+def run_query( number_set, query, repeat ):
+	qs = NumberSetEntry.objects.filter( number_set=number_set ).filter( query )
+	sql, params = qs.query.sql_with_params()
+	chars = len(sql) + sum( len(str(p)) - 2 for p in params )	# With the parameters filled in.
+	try:
+		best = None
+		for i in range(repeat):
+			t = time.perf_counter()
+			count = qs.count()
+			best = min( best or 1.0e9, time.perf_counter() - t )
+	except OperationalError as e:
+		return chars, len(params), None, None, u'{}'.format(e)
+	return chars, len(params), count, best, None
+
+class Command(BaseCommand):
+
+	help = 'Compare the SQL size and speed of the bib query builder with the original'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--entries', dest='entries', type=int, default=20000, help='Number of number set entries to query (at most 99999)')
+		parser.add_argument('--repeat', dest='repeat', type=int, default=3, help='Times to run each query (the best is reported)')
+		parser.add_argument('--seed', dest='seed', type=int, default=1, help='Random seed')
+
+	def handle(self, *args, **options):
+		entries, repeat, seed = min(options['entries'], 99999), max(options['repeat'], 1), options['seed']
+		failed = False
+		with benchmark_database():
+			number_set = make_data( entries, seed )
+			safe_print( u'{} number set entries, {} database'.format(entries, connection.vendor) )
+			safe_print( u'{:<15} {:<9} {:>9} {:>7} {:>10} {:>7}'.format('Shape', 'Builder', 'SQL chars', 'Params', 'ms', 'Count') )
+			for shape, bibs in get_shapes( random.Random(seed) ):
+				counts = {}
+				for builder, get_query in (('Original', get_bib_query_reference), ('Ranges', get_bib_query)):
+					t = time.perf_counter()
+					query = get_query( bibs )
+					t_build = time.perf_counter() - t
+					chars, params, count, seconds, error = run_query( number_set, query, repeat )
+					if error:
+						safe_print( u'{:<15} {:<9} {:>9} {:>7}   Error: {}'.format(shape, builder, chars, params, error) )
+						failed |= (builder == 'Ranges')
+						continue
+					counts[builder] = count
+					safe_print( u'{:<15} {:<9} {:>9} {:>7} {:>10.2f} {:>7}'.format(
+						shape, builder, chars, params, (t_build + seconds) * 1000.0, count) )
+				expected = sum( 1 for bib in NumberSetEntry.objects.filter(number_set=number_set).values_list('bib', flat=True) if bib in bibs )
+				if counts.get('Ranges') != expected:
+					safe_print( u'{:<15} Mismatch: expected {}, got {}'.format(shape, expected, counts.get('Ranges')) )
+					failed = True
+
+		if failed:
+			raise CommandError( 'Bib query benchmark failed' )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import LicenseHolderTrigram, LicenseHolderDuplicateKey, LicenseHolderDuplicate
+from core.license_holder_index import index_license_holders
+from core.utils import safe_print
+
+class Command(BaseCommand):
+
+	help = 'Build the license holder search and duplicate indexes'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--rebuild',
+			action='store_true',
+			dest='rebuild',
+			default=False,
+			help='Index all license holders again, not just the ones missing from the indexes')
+
+	def handle(self, *args, **options):
+		t = time.perf_counter()
+		count = index_license_holders( rebuild=options['rebuild'] )
+		safe_print( u'{} license holders indexed, {} trigrams, {} keys, {} duplicate pairs ({:.1f} seconds)'.format(
+			count, LicenseHolderTrigram.objects.count(), LicenseHolderDuplicateKey.objects.count(),
+			LicenseHolderDuplicate.objects.count(), time.perf_counter() - t) )
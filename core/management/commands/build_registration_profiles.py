@@ -0,0 +1,57 @@
+import time
+import datetime
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import Competition, Participant, RegistrationProfile
+from core.utils import safe_print
+
+def get_season_keys( year ):
+	# Profiles for everyone who raced this season or last, in the disciplines and category formats of this season.
+	category_formats = defaultdict( set )
+	for discipline, category_format in Competition.objects.filter( start_date__year=year ).values_list(
+			'discipline', 'category_format').distinct():
+		category_formats[discipline].add( category_format )
+
+	license_holder_disciplines = Participant.objects.filter(
+		competition__start_date__gte=datetime.date(year-1, 1, 1),
+		competition__start_date__lte=datetime.date(year, 12, 31),
+		competition__discipline__in=list(category_formats.keys()),
+	).values_list('license_holder', 'competition__discipline').distinct()
+
+	return [
+		(license_holder, discipline, category_format)
+			for license_holder, discipline in license_holder_disciplines
+				for category_format in category_formats[discipline]
+	]
+
+class Command(BaseCommand):
+
+	help = 'Build the registration profiles (default team, category, role and speed) for a season'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--season',
+			dest='season',
+			type=int,
+			default=None,
+			help='Year of the season to build profiles for (default: this year)')
+		parser.add_argument('--rebuild',
+			action='store_true',
+			dest='rebuild',
+			default=False,
+			help='Delete all existing profiles first')
+
+	def handle(self, *args, **options):
+		year = options['season'] or timezone.localtime(timezone.now()).year
+		if not Competition.objects.filter( start_date__year=year ).exists():
+			raise CommandError( 'No Competitions in {}'.format(year) )
+
+		t = time.perf_counter()
+		if options['rebuild']:
+			RegistrationProfile.objects.all().delete()
+		keys = get_season_keys( year )
+		created = RegistrationProfile.build_missing( keys )
+		safe_print( u'Season {}: {} profiles, {} built ({:.1f} seconds)'.format(
+			year, len(keys), created, time.perf_counter() - t) )
@@ -0,0 +1,140 @@
+import time
+import random
+import datetime
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import LicenseHolder, LicenseHolderDuplicateKey, LicenseHolderDuplicate
+from core.license_holder_index import index_license_holders
+from core.duplicates import get_duplicates
+from core.benchmark import (
+	add_arguments, get_sizes, get_last_name, get_license_code, add_license_holders, benchmark_database, FirstNames
+)
+from core import utils
+from core.utils import safe_print
+
+def add_typo( rng, s ):
+	p = rng.randrange( len(s) - 1 )
+	return s[:p] + s[p+1] + s[p] + s[p+2:]		# Swap two letters.
+
+def get_duplicate( rng, lh, i ):
+	# A second record for the same person with one of the usual mistakes.
+	d = LicenseHolder( last_name=lh.last_name, first_name=lh.first_name, gender=lh.gender, date_of_birth=lh.date_of_birth )
+	mistake = i % 5
+	if mistake == 0:
+		d.last_name = add_typo( rng, lh.last_name )
+	elif mistake == 1 and lh.date_of_birth.day <= 12:
+		d.date_of_birth = datetime.date( lh.date_of_birth.year, lh.date_of_birth.day, lh.date_of_birth.month )
+	elif mistake == 2:
+		d.gender = 1 - lh.gender
+	elif mistake == 3:
+		d.first_name = lh.first_name[:1]
+	else:
+		lh.uci_id = lh.uci_id or u'{}'.format(20000000000 + i)
+		d.last_name, d.uci_id = u'{}-{}'.format(lh.last_name, get_last_name(rng)), lh.uci_id
+	return d
+
+def get_license_holders( rng, start, end, injected ):
+	# Adds the (original, duplicate) license codes to injected.
+	for i in range(start, end):
+		lh = LicenseHolder(
+			last_name=get_last_name(rng), first_name=rng.choice(FirstNames), gender=rng.randint(0, 1),
+			date_of_birth=datetime.date(1950 + rng.randrange(60), rng.randint(1, 12), rng.randint(1, 28)),
+			uci_id=u'{}'.format(10000000000 + i) if i % 2 else u'',
+			license_code=get_license_code(i),
+		)
+		d = get_duplicate( rng, lh, i // 100 ) if i % 100 == 0 else None
+		yield lh
+		if d:
+			d.license_code = lh.license_code + u'D'
+			injected.append( (lh.license_code, d.license_code) )
+			yield d
+
+def get_duplicates_original():
+	# The original LicenseHolder.get_duplicates, reading the holders for each group as the page does.
+	duplicates = defaultdict( list )
+	for last_name, first_name, gender, date_of_birth, uci_id, pk in LicenseHolder.objects.values_list(
+			'last_name','first_name','gender','date_of_birth','uci_id','pk'):
+		name_initial = u'{}, {}'.format(utils.removeDiacritic(last_name).upper(), utils.removeDiacritic(first_name[:1]).upper())
+		key = (name_initial, gender, date_of_birth)
+		duplicates[key].append( pk )
+		if uci_id:
+			duplicates[(u'{} UCIID'.format(u' '.join( uci_id[i:i+3] for i in range(0, len(uci_id), 3) )),None,None)].append( pk )
+		if date_of_birth.day != date_of_birth.month and date_of_birth.day <= 12:
+			key = (name_initial, gender, datetime.date(year=date_of_birth.year, month=date_of_birth.day, day=date_of_birth.month))
+			if key in duplicates:
+				duplicates[key].append( pk )
+		key = (name_initial, 1 - gender, date_of_birth)
+		if key in duplicates:
+			duplicates[key].append( pk )
+	groups = []
+	for key, pks in duplicates.items():
+		if len(pks) > 1:
+			license_holders = list( LicenseHolder.objects.filter(pk__in=pks).order_by('search_text') )
+			for lh in license_holders:
+				lh.competition_count
+			groups.append( [lh.pk for lh in license_holders] )
+	return groups
+
+def get_pairs( groups ):
+	return set( (a, b) for pks in groups for a in pks for b in pks if a < b )
+
+def time_saves( count ):
+	license_holders = list( LicenseHolder.objects.all()[:count] )
+	t = time.perf_counter()
+	for lh in license_holders:
+		lh.city = u'Kingston'
+		lh.save()
+	return (time.perf_counter() - t) / max( len(license_holders), 1 )
+
+class Command(BaseCommand):
+
+	help = 'Compare the duplicate license holder index with the original duplicate check'
+
+	def add_arguments(self, parser):
+		add_arguments( parser )
+
+	def handle(self, *args, **options):
+		sizes = get_sizes( options )
+		rng = random.Random( options['seed'] )
+
+		failed = False
+		with benchmark_database():
+			count = 0
+			injected = []
+			for size in sizes:
+				add_license_holders( get_license_holders(rng, count, size, injected) )
+				count = size
+
+				t = time.perf_counter()
+				indexed = index_license_holders()
+				t_index = time.perf_counter() - t
+
+				t = time.perf_counter()
+				groups_original = get_duplicates_original()
+				t_original = time.perf_counter() - t
+
+				t = time.perf_counter()
+				groups = get_duplicates()
+				t_index_groups = time.perf_counter() - t
+
+				pairs_original = get_pairs( groups_original )
+				pairs = get_pairs( [[lh.pk for lh in g['license_holders']] for g in groups] )
+				pks = dict( LicenseHolder.objects.all().values_list('license_code', 'pk') )
+				pairs_injected = set( tuple(sorted((pks[a], pks[b]))) for a, b in injected )
+
+				safe_print( u'' )
+				safe_print( u'{} license holders: indexed {} in {:.1f}s, {} keys, {} pairs'.format(
+					size, indexed, t_index, LicenseHolderDuplicateKey.objects.count(), LicenseHolderDuplicate.objects.count()) )
+				safe_print( u'Original: {:.2f}s, {} groups, found {} of {} injected duplicates'.format(
+					t_original, len(groups_original), len(pairs_injected & pairs_original), len(pairs_injected)) )
+				safe_print( u'Index:    {:.2f}s, {} groups, found {} of {} injected duplicates, {} of {} original pairs'.format(
+					t_index_groups, len(groups), len(pairs_injected & pairs), len(pairs_injected), len(pairs_original & pairs), len(pairs_original)) )
+				safe_print( u'LicenseHolder.save: {:.2f} ms'.format(time_saves(200) * 1000.0) )
+				if len(pairs_injected & pairs) < len(pairs_injected & pairs_original):
+					safe_print( u'The index found fewer injected duplicates than the original' )
+					failed = True
+
+		if failed:
+			raise CommandError( 'Duplicates benchmark failed' )
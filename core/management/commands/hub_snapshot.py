@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Competition
+from core.utils import safe_print
+from core.hub_snapshot import export_hub
+
+class Command(BaseCommand):
+
+	help = 'Export the Hub pages as static files (with precompressed .gz files) for a plain web server'
+
+	def add_arguments(self, parser):
+		parser.add_argument('output_dir',
+			help='Directory to write the pages to.  Serve it as the web server root (also serve /static/ from collectstatic).')
+		parser.add_argument('--competition',
+			dest='competition',
+			type=int,
+			action='append',
+			default=None,
+			help='Competition id to export (may be repeated, default: all Competitions)')
+		parser.add_argument('--processes',
+			dest='processes',
+			type=int,
+			default=None,
+			help='Number of render processes (default: number of cpus)')
+		parser.add_argument('--force',
+			action='store_true',
+			dest='force',
+			default=False,
+			help='Re-render all pages, even if the results have not changed')
+
+	def handle(self, *args, **options):
+		competitions = None
+		if options['competition']:
+			competitions = Competition.objects.filter( pk__in=options['competition'] )
+			missing = set(options['competition']) - set(competitions.values_list('pk', flat=True))
+			if missing:
+				raise CommandError( 'Competition {} does not exist'.format(', '.join(str(pk) for pk in sorted(missing))) )
+
+		verbosity = options['verbosity']
+		def progress( url, status_code, size ):
+			if verbosity > 1:
+				safe_print( u'{} {} {}'.format(status_code, size, url) )
+
+		t = time.perf_counter()
+		rendered, unchanged, removed, errors = export_hub(
+			options['output_dir'], competitions, processes=options['processes'], force=options['force'], progress=progress
+		)
+		for url, status_code in errors:
+			safe_print( u'Error: {} returned {}'.format(url, status_code) )
+		safe_print( u'Rendered: {}  Unchanged: {}  Removed: {}  Errors: {}  ({:.1f} seconds)'.format(
+			len(rendered), len(unchanged), len(removed), len(errors), time.perf_counter() - t) )
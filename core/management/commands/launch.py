@@ -21,6 +21,7 @@ from core.create_users import create_users
 from core.print_bib import reset_font_cache
 from core.views_common import set_hub_mode
 from core.init_data import init_data_if_necessary
+from core import name_index
 
 def check_connection( host, port ):
 	safe_print( u'Checking web server connection {}:{}'.format(host,port) )
@@ -85,6 +86,7 @@ def launch_server( command, **options ):
 	
 	create_users()
 	models_fix_data()
+	name_index.warm()
 	try:
 		reset_font_cache()
 	except:
@@ -0,0 +1,92 @@
+import time
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import LicenseHolder
+from core.bk_tree import levenshtein_from
+from core.name_index import NameIndex
+from core.benchmark import add_arguments, get_sizes, get_license_holder, get_license_code, add_license_holders, benchmark_database
+from core.utils import safe_print
+
+def add_typos( rng, s, count ):
+	for i in range(count):
+		p = rng.randrange( len(s) )
+		edit = rng.randrange( 3 )
+		if edit == 0:
+			s = s[:p] + s[p+1:]									# Delete.
+		elif edit == 1:
+			s = s[:p] + rng.choice('aeioulnrst') + s[p:]		# Insert.
+		else:
+			s = s[:p] + rng.choice('aeioulnrst') + s[p+1:]		# Change.
+	return s
+
+def get_searches( rng, count ):
+	searches = []
+	for lh in LicenseHolder.objects.filter( license_code__in=[get_license_code(rng.randrange(count)) for i in range(10)] ):
+		searches.append( ('last', add_typos(rng, lh.last_name, 1)) )
+		searches.append( ('last first', u'{} {}'.format(add_typos(rng, lh.last_name, 2), lh.first_name)) )
+		searches.append( ('first last', u'{} {}'.format(lh.first_name, add_typos(rng, lh.last_name, 1))) )
+	return searches
+
+class BruteForce( object ):
+	# Same interface as the BKTree, compares to every key.
+	def __init__( self, keys ):
+		self.keys = list( keys )
+
+	def search( self, key, max_distance ):
+		distance = levenshtein_from( key )
+		results = [(d, k) for d, k in ((distance(k), k) for k in self.keys) if d <= max_distance]
+		results.sort()
+		return results
+
+class Command(BaseCommand):
+
+	help = 'Compare the fuzzy name index with comparing every name'
+
+	def add_arguments(self, parser):
+		add_arguments( parser )
+
+	def handle(self, *args, **options):
+		sizes = get_sizes( options )
+		rng = random.Random( options['seed'] )
+
+		failed = False
+		with benchmark_database():
+			count = 0
+			for size in sizes:
+				add_license_holders( get_license_holder(rng, i) for i in range(count, size) )
+				count = size
+
+				t = time.perf_counter()
+				name_index = NameIndex()
+				t_build = time.perf_counter() - t
+				tree = name_index.tree
+				brute_force = BruteForce( name_index.last_names.keys() )
+
+				safe_print( u'' )
+				safe_print( u'{} license holders ({} total): {} last names, index built in {:.1f}s'.format(
+					size, len(name_index.holders), len(tree), t_build) )
+				safe_print( u'{:<11} {:<24} {:>10} {:>10} {:>7}'.format('Search', 'Text', 'BK-tree ms', 'Scan ms', 'Found') )
+				totals = [0.0, 0.0]
+				searches = get_searches( rng, count )
+				for name, search_text in searches:
+					timings = []
+					results = []
+					for i, t_index in enumerate((tree, brute_force)):
+						name_index.tree = t_index
+						t = time.perf_counter()
+						results.append( name_index.search(search_text) )
+						timings.append( time.perf_counter() - t )
+						totals[i] += timings[-1]
+					name_index.tree = tree
+					safe_print( u'{:<11} {:<24} {:>10.2f} {:>10.2f} {:>7}'.format(
+						name, search_text, timings[0] * 1000.0, timings[1] * 1000.0, len(results[0])) )
+					if results[0] != results[1]:
+						safe_print( u'{:<11} Mismatch: {} found by the BK-tree, {} by the scan'.format(name, len(results[0]), len(results[1])) )
+						failed = True
+				safe_print( u'Average: BK-tree {:.2f} ms, scan {:.2f} ms'.format(
+					totals[0] * 1000.0 / len(searches), totals[1] * 1000.0 / len(searches)) )
+
+		if failed:
+			raise CommandError( 'Name index benchmark failed' )
@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import EventMassStart, EventTT, Competition, pack_floats, unpack_floats
+from core.DurationField import formatted_timedelta
+from core.utils import safe_print
+
+def pack_event( event ):
+	Result, RaceTime = event.get_result_class(), event.get_race_time_class()
+	with transaction.atomic():
+		results = list( Result.objects.filter(event=event, race_times_packed__isnull=True) )
+		if not results:
+			return 0
+		race_times = defaultdict( list )
+		for result_id, race_time, lap_kmh in (RaceTime.objects
+				.filter( result__event=event, result__race_times_packed__isnull=True )
+				.order_by( 'result_id', 'race_time', 'pk' )
+				.values_list( 'result_id', 'race_time', 'lap_kmh' )):
+			race_times[result_id].append( (race_time.total_seconds(), lap_kmh or 0.0) )
+		for result in results:
+			rts = race_times.get( result.pk, [] )
+			result.race_times_packed = pack_floats( [rt for rt, lk in rts] )
+			result.lap_kmh_packed = pack_floats( [0.0 if i == 0 else lk for i, (rt, lk) in enumerate(rts)] )
+		Result.objects.bulk_update( results, ['race_times_packed', 'lap_kmh_packed'] )
+		RaceTime.objects.filter( result__event=event ).delete()
+	return len(results)
+
+def unpack_event( event ):
+	Result, RaceTime = event.get_result_class(), event.get_race_time_class()
+	with transaction.atomic():
+		results = list( Result.objects.filter(event=event, race_times_packed__isnull=False) )
+		if not results:
+			return 0
+		rtcs = []
+		for result in results:
+			for race_time, lap_kmh in zip(result.get_packed_race_times(), result.get_packed_lap_kmh()):
+				rtcs.append( RaceTime(result=result, race_time=formatted_timedelta(seconds=race_time), lap_kmh=lap_kmh) )
+			result.race_times_packed = result.lap_kmh_packed = None
+		Result.objects.bulk_update( results, ['race_times_packed', 'lap_kmh_packed'] )
+		RaceTime.objects.bulk_create( rtcs )
+	return len(results)
+
+class Command(BaseCommand):
+
+	help = 'Move existing race times into packed storage in the Results (or back to RaceTime rows with --unpack)'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--unpack',
+			action='store_true',
+			dest='unpack',
+			default=False,
+			help='Move packed race times back to RaceTime rows')
+		parser.add_argument('--competition',
+			dest='competition',
+			type=int,
+			default=None,
+			help='Competition id to convert (default: all Competitions)')
+
+	def handle(self, *args, **options):
+		convert = unpack_event if options['unpack'] else pack_event
+		for EventClass in (EventMassStart, EventTT):
+			events = EventClass.objects.all().select_related('competition')
+			if options['competition'] is not None:
+				if not Competition.objects.filter( pk=options['competition'] ).exists():
+					raise CommandError( 'Competition {} does not exist'.format(options['competition']) )
+				events = events.filter( competition_id=options['competition'] )
+			for event in events:
+				count = convert( event )
+				if count:
+					safe_print( u'{}-{}: {} {} Results'.format(
+						event.competition.name, event.name, 'Unpacked' if options['unpack'] else 'Packed', count) )
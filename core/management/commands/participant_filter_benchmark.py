@@ -0,0 +1,249 @@
+import time
+import random
+import datetime
+import itertools
+
+from django.db import connection
+from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import *
+from core import utils
+from core.utils import safe_print
+from core.views import get_annotated_waves
+from core.benchmark import benchmark_database
+
+class QueryCounter( object ):
+	def __init__( self ):
+		self.count = 0
+
+	def __call__( self, execute, sql, params, many, context ):
+		self.count += 1
+		return execute( sql, params, many, context )
+
+FirstNames = ('Jean', 'Zoë', 'Ana', 'Émile', 'Li', 'Mary-Kate', 'Bob', 'Søren', 'Élodie', 'Max')
+LastNames = ('Tremblay', 'Côté', 'Smith', "O'Brien", 'Nguyen', 'Müller', 'St. Pierre', 'Larsen', 'García', 'Ng')
+Cities = ('Montréal', 'Toronto', 'Québec', 'Ottawa', 'St. John\'s', 'Trois-Rivières', '')
+
+def make_competition( riders, seed ):
+	rng = random.Random( seed )
+	discipline = Discipline.objects.first() or Discipline.objects.create( name='Road' )
+	race_class = RaceClass.objects.first() or RaceClass.objects.create( name='Club' )
+	category_format = CategoryFormat.objects.create( name='Benchmark {}'.format(seed) )
+	categories = [Category.objects.create(format=category_format, code=code, gender=0, sequence=i) for i, code in enumerate('ABCDEF')]
+	legal_entity = LegalEntity.objects.create( name='Benchmark', waiver_expiry_date=datetime.date(2020,3,1) )
+	report_label = ReportLabel.objects.create( name='Benchmark' )
+	teams = [Team.objects.create(name='Team {}'.format(i)) for i in range(20)]
+
+	competition = Competition.objects.create(
+		name='Benchmark {}'.format(seed), category_format=category_format, organizer='Benchmark',
+		start_date=datetime.date(2020,6,1), discipline=discipline, race_class=race_class,
+		legal_entity=legal_entity, report_label_license_check=report_label,
+	)
+	for i, category in enumerate(categories):
+		CompetitionCategoryOption.objects.create( competition=competition, category=category, license_check_required=(i % 2 == 0) )
+
+	# A mandatory mass start, an optional mass start with an option and a TT.
+	date_time = timezone.make_aware( datetime.datetime(2020,6,1,10) )
+	event = EventMassStart.objects.create( competition=competition, name='Road Race', date_time=date_time )
+	Wave.objects.create( event=event, name='W1' ).categories.set( categories[:4] )
+	event = EventMassStart.objects.create( competition=competition, name='Crit', date_time=date_time, optional=True )
+	Wave.objects.create( event=event, name='W1' ).categories.set( categories[1:5] )
+	event.option_id = 17
+	EventMassStart.objects.filter( pk=event.pk ).update( option_id=event.option_id )
+	event = EventTT.objects.create( competition=competition, name='TT', date_time=date_time, optional=True, group_size_gap=datetime.timedelta(minutes=5) )
+	WaveTT.objects.create( event=event, name='W1' ).categories.set( categories[2:] )
+	option_ids = (17, EventTT.objects.get(pk=event.pk).option_id)
+
+	now = timezone.now()
+	license_holders = []
+	for i in range(riders):
+		lh = LicenseHolder(
+			last_name=u'{}{}'.format(rng.choice(LastNames), i), first_name=rng.choice(FirstNames) if rng.random() < 0.95 else u'',
+			date_of_birth=datetime.date(1970 + i % 40, 1 + i % 12, 1 + i % 28),
+			license_code=rng.choice((u'L{}-{}', u'TEMP{}-{}', u'_{}-{}', u'temp{}-{}')).format(seed, i),
+			city=rng.choice(Cities), state_prov=rng.choice((u'ON', u'QC', u'Québec', u'')), nationality=rng.choice((u'Canadian', u'Français', u'')),
+			eligible=rng.random() < 0.9,
+			ineligible_on_date_time=rng.choice((None, now - datetime.timedelta(days=1), now + datetime.timedelta(days=1))),
+			existing_tag=rng.choice((None, u'{:06X}'.format(i))),
+			emergency_contact_name=rng.choice((u'', u'Mom')), emergency_contact_phone=rng.choice((u'', u'555-1212')),
+		)
+		lh.search_text = lh.get_search_text()[:LicenseHolder.SearchTextLength]
+		license_holders.append( lh )
+	LicenseHolder.objects.bulk_create( license_holders )
+	license_holders = list( LicenseHolder.objects.filter(license_code__regex=r'^(L|TEMP|_|temp){}-'.format(seed)).order_by('pk') )
+
+	Waiver.objects.bulk_create( [
+		Waiver(license_holder=lh, legal_entity=legal_entity, date_signed=rng.choice((datetime.date(2020,1,1), datetime.date(2020,4,1))))
+			for lh in license_holders if rng.random() < 0.7
+	] )
+	LicenseCheckState.objects.bulk_create( [
+		LicenseCheckState(license_holder=lh, category=rng.choice(categories), discipline=discipline,
+			report_label_license_check=report_label, check_date=rng.choice((datetime.date(2019,5,1), datetime.date(2020,5,1))))
+			for lh in license_holders if rng.random() < 0.3
+	] )
+
+	roles = [Participant.Competitor] * 20 + [120, 130, 210, 310, 410]
+	participants = []
+	for i, lh in enumerate(license_holders):
+		role = rng.choice( roles )
+		participants.append( Participant(
+			competition=competition, license_holder=lh, role=role,
+			category=rng.choice(categories + [None]),
+			team=rng.choice(teams + [None]),
+			bib=rng.choice((None, i + 1)),
+			tag=rng.choice((None, u'{:06X}'.format(i))), tag_checked=rng.random() < 0.5,
+			license_checked=rng.random() < 0.2, paid=rng.random() < 0.8,
+			signature=rng.choice((u'', u'signed')), est_kmh=rng.choice((0.0, 40.0)),
+		) )
+	Participant.objects.bulk_create( participants )
+	participants = list( Participant.objects.filter(competition=competition) )
+	ParticipantOption.objects.bulk_create( [
+		ParticipantOption(competition=competition, participant=p, option_id=option_id)
+			for p in participants for option_id in option_ids if rng.random() < 0.5
+	] )
+	return competition
+
+CompetitionSettings = (
+	# using_tags, use_existing_tags, do_tag_validation, show_signature, legal_entity, report_label_license_check
+	(False, False, False, False, False, False),
+	(True,  False, True,  True,  True,  True),
+	(True,  True,  False, True,  True,  True),
+	(True,  True,  True,  False, False, True),
+)
+
+class Command(BaseCommand):
+
+	help = 'Check and time the Participant filter and can_start queries against the Python checks (on a synthetic competition in a throwaway database)'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--participants', dest='participants', type=int, default=5000, help='Number of participants')
+		parser.add_argument('--seed', dest='seed', type=int, default=1, help='Random seed')
+
+	def handle(self, *args, **options):
+		mismatches = []
+		with benchmark_database():
+			competition = make_competition( options['participants'], options['seed'] )
+			for settings in CompetitionSettings:
+				mismatches.extend( self.check_settings(competition, settings) )
+
+		if mismatches:
+			raise CommandError( u'Mismatches:\n' + u'\n'.join(mismatches) )
+
+	def check_settings( self, competition, settings ):
+		using_tags, use_existing_tags, do_tag_validation, show_signature, legal_entity, report_label_license_check = settings
+		competition.using_tags = using_tags
+		competition.use_existing_tags = use_existing_tags
+		competition.do_tag_validation = do_tag_validation
+		competition.show_signature = show_signature
+		competition.legal_entity = LegalEntity.objects.filter( name='Benchmark' ).first() if legal_entity else None
+		competition.report_label_license_check = ReportLabel.objects.filter( name='Benchmark' ).first() if report_label_license_check else None
+		Competition.objects.filter( pk=competition.pk ).update(
+			using_tags=using_tags, use_existing_tags=use_existing_tags, do_tag_validation=do_tag_validation,
+			show_signature=show_signature, legal_entity=competition.legal_entity, report_label_license_check=competition.report_label_license_check,
+		)
+		safe_print( u'' )
+		safe_print( u'using_tags={} use_existing_tags={} do_tag_validation={} show_signature={} legal_entity={} license_check={}'.format(*settings) )
+
+		participants = Participant.objects.filter( competition=competition )
+		mismatches = []
+
+		# Evaluate every check in Python (the old way).
+		t = time.perf_counter()
+		python_checks = {}
+		checks = list( Participant.get_check_queries(competition).keys() ) + ['can_start', 'is_done', 'has_any_events']
+		for p in participants.select_related('license_holder', 'competition', 'category', 'team'):
+			for check in checks:
+				if check == 'is_done':
+					value = p.is_done
+				elif check == 'can_start':
+					value = p.can_start()
+				elif check == 'has_any_events':
+					value = p.has_any_events()
+				else:
+					value = getattr(p, check)()
+				python_checks.setdefault( check, set() )
+				if value:
+					python_checks[check].add( p.pk )
+		python_seconds = time.perf_counter() - t
+
+		counter = QueryCounter()
+		with connection.execute_wrapper(counter):
+			t = time.perf_counter()
+			event_queries = Participant.get_event_queries( competition )
+			check_queries = Participant.get_check_queries( competition, event_queries )
+			check_queries['can_start'] = Participant.get_can_start_query( competition, check_queries )
+			check_queries['is_done'] = Participant.get_is_done_query( competition, check_queries )
+			check_queries['has_any_events'] = Participant.get_has_any_events_query( competition, event_queries )
+			sql_checks = { check: set(participants.filter(q).values_list('pk', flat=True)) for check, q in check_queries.items() }
+			sql_seconds = time.perf_counter() - t
+
+		safe_print( u'{:<24} {:>8} {:>8} {:>10}'.format('Check', 'Python', 'SQL', 'Identical') )
+		for check in checks:
+			identical = (python_checks[check] == sql_checks[check])
+			safe_print( u'{:<24} {:>8} {:>8} {:>10}'.format(check, len(python_checks[check]), len(sql_checks[check]), str(identical)) )
+			if not identical:
+				mismatches.append( u'{} {}'.format(settings, check) )
+		safe_print( u'Python: {:.3f} seconds   SQL: {:.3f} seconds, {} queries'.format(python_seconds, sql_seconds, counter.count) )
+
+		# The can_start annotations (with reasons) for the whole Competition.
+		counter = QueryCounter()
+		with connection.execute_wrapper(counter):
+			t = time.perf_counter()
+			annotated = list( Participant.annotate_can_start(participants, competition).select_related('license_holder') )
+			annotate_seconds = time.perf_counter() - t
+		annotated_checks = {
+			check: set( p.pk for p in annotated if getattr(p, 'db_' + check) )
+				for check in [check for check, message in Participant.CanStartChecks] + ['can_start', 'is_done']
+		}
+		identical = all( python_checks[check] == pks for check, pks in annotated_checks.items() )
+		safe_print( u'annotate_can_start: {} participants, {:.3f} seconds, {} queries, Identical {}'.format(
+			len(annotated), annotate_seconds, counter.count, identical) )
+		if not identical:
+			mismatches.append( u'{} annotate_can_start'.format(settings) )
+
+		# Wave listings.
+		for event in competition.get_events():
+			counter = QueryCounter()
+			with connection.execute_wrapper(counter):
+				t = time.perf_counter()
+				waves = get_annotated_waves( event )
+				waves_seconds = time.perf_counter() - t
+			safe_print( u'get_annotated_waves {}: {} starters, {} bad starts, {:.3f} seconds, {} queries'.format(
+				event.name, event.get_participants().count(), sum(w.get_bad_start_count for w in waves), waves_seconds, counter.count) )
+
+		# Every combination of the complete and has_events filters with the name and city searches.
+		safe_print( u'{:<10} {:<10} {:<8} {:<8} {:>8} {:>8}'.format('complete', 'has_events', 'name', 'city', 'Count', 'Seconds') )
+		all_pks = set( participants.values_list('pk', flat=True) )
+		for complete, has_events, name_text, city_text in itertools.product( (-1, 0, 1), (-1, 0, 1), (u'', u'cote', u'quebec'), (u'', u'quebec') ):
+			qs = participants
+			expected = set( all_pks )
+			if name_text:
+				qs = qs.annotate( name_search_text=LicenseHolder.get_name_search_text('license_holder__') ).filter(
+					license_holder__search_text__contains=name_text, name_search_text__contains=name_text )
+				expected &= set( p.pk for p in participants.select_related('license_holder')
+					if name_text in utils.removeDiacritic(p.license_holder.full_name()).lower() )
+			if city_text:
+				cities = [v for v in LicenseHolder.objects.filter(participant__competition=competition).values_list('city', flat=True).distinct()
+					if utils.matchSearchFields([city_text], v)]
+				qs = qs.filter( license_holder__city__in=cities )
+				expected &= set( p.pk for p in participants.select_related('license_holder')
+					if utils.matchSearchFields([city_text], p.license_holder.city) )
+			if complete >= 0:
+				qs = qs.filter( check_queries['is_done'] ) if complete else qs.exclude( check_queries['is_done'] )
+				expected &= python_checks['is_done'] if complete else all_pks - python_checks['is_done']
+			if has_events == 0:
+				qs = qs.filter( role=Participant.Competitor ).exclude( check_queries['has_any_events'] )
+				expected &= set( participants.filter(role=Participant.Competitor).values_list('pk', flat=True) ) - python_checks['has_any_events']
+			elif has_events == 1:
+				qs = qs.filter( check_queries['has_any_events'] )
+				expected &= python_checks['has_any_events']
+			t = time.perf_counter()
+			pks = set( qs.values_list('pk', flat=True) )
+			seconds = time.perf_counter() - t
+			safe_print( u'{:<10} {:<10} {:<8} {:<8} {:>8} {:>8.3f}{}'.format(
+				complete, has_events, name_text, city_text, len(pks), seconds, u'' if pks == expected else u'  MISMATCH') )
+			if pks != expected:
+				mismatches.append( u'{} complete={} has_events={} name={} city={}'.format(settings, complete, has_events, name_text, city_text) )
+
+		return mismatches
@@ -0,0 +1,90 @@
+import time
+import random
+
+from django.db import connection
+from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import LicenseHolder, LicenseHolderTrigram
+from core.license_holder_index import index_license_holders
+from core.search_index import get_search_query
+from core.benchmark import (
+	add_arguments, get_sizes, get_last_name, get_license_holder, get_license_code, add_license_holders, benchmark_database, FirstNames
+)
+from core import utils
+from core.utils import safe_print
+
+MaxReturn = 500		# As in views.py.
+
+def get_searches( rng, count ):
+	return (
+		('last name', get_last_name(rng)),
+		('last first', u'{} {}'.format(get_last_name(rng), rng.choice(FirstNames))),
+		('common', u'mar'),
+		('city', u'ottawa'),
+		('license', get_license_code(rng.randrange(count)).lower()),
+		('no match', u'qqzx'),
+		('short', u'jo'),
+	)
+
+def run_search( search_text, use_index, repeat ):
+	search_text = utils.normalizeSearch( search_text )
+	best = None
+	for i in range(repeat):
+		t = time.perf_counter()
+		q = get_search_query( search_text.split() ) if use_index else Q()
+		for n in search_text.split():
+			q &= Q( search_text__contains = n )
+		pks = list( LicenseHolder.objects.filter(q).values_list('pk', flat=True)[:MaxReturn] )
+		best = min( best or 1.0e9, time.perf_counter() - t )
+	return pks, best
+
+def time_saves( count ):
+	license_holders = list( LicenseHolder.objects.all()[:count] )
+	t = time.perf_counter()
+	for lh in license_holders:
+		lh.city = u'Kingston'
+		lh.save()
+	return (time.perf_counter() - t) / max( len(license_holders), 1 )
+
+class Command(BaseCommand):
+
+	help = 'Compare license holder search with and without the trigram index'
+
+	def add_arguments(self, parser):
+		add_arguments( parser )
+		parser.add_argument('--repeat', dest='repeat', type=int, default=3, help='Times to run each search (the best is reported)')
+
+	def handle(self, *args, **options):
+		sizes = get_sizes( options )
+		repeat = max( options['repeat'], 1 )
+		rng = random.Random( options['seed'] )
+
+		failed = False
+		with benchmark_database():
+			count = 0
+			for size in sizes:
+				t = time.perf_counter()
+				add_license_holders( get_license_holder(rng, i) for i in range(count, size) )
+				count = size
+				t_create = time.perf_counter() - t
+
+				t = time.perf_counter()
+				indexed = index_license_holders()
+				t_index = time.perf_counter() - t
+
+				safe_print( u'' )
+				safe_print( u'{} license holders ({} total), {} database: create {:.1f}s, index {} in {:.1f}s, {} trigrams'.format(
+					size, LicenseHolder.objects.count(), connection.vendor, t_create, indexed, t_index, LicenseHolderTrigram.objects.count()) )
+				safe_print( u'{:<11} {:<16} {:>10} {:>10} {:>7}'.format('Search', 'Text', 'Scan ms', 'Index ms', 'Found') )
+				for name, search_text in get_searches( rng, count ):
+					pks_scan, t_scan = run_search( search_text, False, repeat )
+					pks_index, t_index = run_search( search_text, True, repeat )
+					safe_print( u'{:<11} {:<16} {:>10.2f} {:>10.2f} {:>7}'.format(name, search_text, t_scan * 1000.0, t_index * 1000.0, len(pks_index)) )
+					if pks_scan != pks_index:
+						safe_print( u'{:<11} Mismatch: {} found by scan, {} by index'.format(name, len(pks_scan), len(pks_index)) )
+						failed = True
+				safe_print( u'LicenseHolder.save: {:.2f} ms'.format(time_saves(200) * 1000.0) )
+
+		if failed:
+			raise CommandError( 'Search index benchmark failed' )
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import Series
+from core.utils import safe_print
+from core import series_results
+
+class QueryCounter( object ):
+	def __init__( self ):
+		self.count = 0
+
+	def __call__( self, execute, sql, params, many, context ):
+		self.count += 1
+		return execute( sql, params, many, context )
+
+class Command(BaseCommand):
+
+	help = 'Compare query counts and times of per-category and whole-series result extraction'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--series',
+			dest='series',
+			type=int,
+			default=None,
+			help='Series id to benchmark (default: all Series)')
+
+	def handle(self, *args, **options):
+		series_all = Series.objects.all()
+		if options['series'] is not None:
+			series_all = series_all.filter( pk=options['series'] )
+			if not series_all.exists():
+				raise CommandError( 'Series {} does not exist'.format(options['series']) )
+
+		safe_print( u'{:<32} {:>6} {:>6} {:>8} | {:>8} {:>8} | {:>8} {:>8}'.format(
+			'Series', 'Events', 'Groups', 'Results', 'CatQ', 'CatSec', 'BulkQ', 'BulkSec') )
+		for series in series_all:
+			category_groups = series_results.get_category_groups( series )
+
+			category_queries = QueryCounter()
+			with connection.execute_wrapper(category_queries):
+				t = time.perf_counter()
+				for group_categories, related_categories in category_groups:
+					series_results.get_results_for_category( series, group_categories[0] )
+				category_seconds = time.perf_counter() - t
+
+			bulk_queries = QueryCounter()
+			with connection.execute_wrapper(bulk_queries):
+				t = time.perf_counter()
+				series_event_results = series_results.extract_series_event_results( series )
+				series_results.get_results_for_all_categories( series, series_event_results )
+				bulk_seconds = time.perf_counter() - t
+
+			safe_print( u'{:<32} {:>6} {:>6} {:>8} | {:>8} {:>8.3f} | {:>8} {:>8.3f}'.format(
+				series.name[:32], len(series_event_results), len(category_groups),
+				sum( len(results) for sce, category_wave, results in series_event_results ),
+				category_queries.count, category_seconds, bulk_queries.count, bulk_seconds,
+			) )
@@ -0,0 +1,84 @@
+import time
+import random
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Series
+from core.utils import safe_print
+from core import series_results, series_ranking
+
+class FakeLicenseHolder( object ):
+	def __init__( self, pk ):
+		self.pk = pk
+
+class FakeParticipant( object ):
+	def __init__( self, license_holder ):
+		self.license_holder = license_holder
+		self.team = None
+		self.category = None
+
+class FakeEvent( object ):
+	def __init__( self, i ):
+		self.pk = i
+		self.name = 'Event {}'.format(i)
+		self.date_time = datetime.datetime(2020, 1, 1) + datetime.timedelta(days=7*i)
+
+def make_event_results( riders, events, ranking_criteria, seed ):
+	rng = random.Random( seed )
+	participants = [FakeParticipant(FakeLicenseHolder(i)) for i in range(riders)]
+	eventResults = []
+	for e in (FakeEvent(i) for i in range(events)):
+		starters = rng.sample( participants, int(riders * rng.uniform(0.3, 0.9)) )
+		for rank, p in enumerate(starters, 1):
+			status = 0 if ranking_criteria != 0 or rng.random() < 0.9 else 1
+			if ranking_criteria == 0:
+				value_for_rank = float( max(0, 100 - rank) or 1 )
+			elif ranking_criteria == 1:
+				value_for_rank = 3600.0 + rank * rng.choice((1.0, 1.5, 2.25))
+			else:
+				value_for_rank = round( 100.0 * 3600.0 / (3600.0 + rank * 2.0), 3 )
+			eventResults.append( series_results.EventResult.from_fields(status, p, e, rank, len(starters), value_for_rank, None, None, False) )
+	return eventResults
+
+class Command(BaseCommand):
+
+	help = 'Compare the Python and NumPy series ranking on synthetic results'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--riders', dest='riders', type=int, default=10000, help='Number of license holders')
+		parser.add_argument('--events', dest='events', type=int, default=30, help='Number of events')
+		parser.add_argument('--best', dest='best', type=int, default=0, help='Best results to consider')
+		parser.add_argument('--must-have-completed', dest='must_have_completed', type=int, default=0, help='Must have completed')
+		parser.add_argument('--seed', dest='seed', type=int, default=1, help='Random seed')
+
+	def handle(self, *args, **options):
+		if not series_ranking.is_available():
+			raise CommandError( 'NumPy is not installed' )
+
+		safe_print( u'{:<10} {:>8} {:>8} {:>10} {:>10} {:>8} {:>10}'.format(
+			'Criteria', 'Riders', 'Events', 'PythonSec', 'NumPySec', 'Speedup', 'Identical') )
+		for ranking_criteria, criteria_name in Series.RANKING_CRITERIA:
+			series = Series(
+				ranking_criteria=ranking_criteria,
+				best_results_to_consider=options['best'],
+				must_have_completed=options['must_have_completed'],
+			)
+			eventResults = make_event_results( options['riders'], options['events'], ranking_criteria, options['seed'] )
+
+			times, outcomes = [], []
+			for use_numpy in (False, True):
+				for er in eventResults:
+					er.ignored = False
+				t = time.perf_counter()
+				categoryResult, events = series_results.series_results( series, None, list(eventResults), use_numpy=use_numpy )
+				times.append( time.perf_counter() - t )
+				outcomes.append( [
+					(lh.pk, value, gap, [(er.event.pk, er.ignored) for er in results if er])
+						for lh, team, value, gap, results in categoryResult
+				] )
+
+			safe_print( u'{:<10} {:>8} {:>8} {:>10.3f} {:>10.3f} {:>8.1f} {:>10}'.format(
+				str(criteria_name)[:10], options['riders'], options['events'],
+				times[0], times[1], times[0] / max(times[1], 1e-9), str(outcomes[0] == outcomes[1]),
+			) )
@@ -0,0 +1,96 @@
+import time
+import threading
+
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import SystemInfo
+from core import request_cache
+from core.benchmark import benchmark_database
+from core.utils import safe_print
+
+def time_calls( f, calls ):
+	t = time.perf_counter()
+	for i in range(calls):
+		f()
+	return (time.perf_counter() - t) / calls
+
+def get_in_request():
+	request_cache.local.cache = request_cache.RequestCache()
+	try:
+		for i in range(20):
+			SystemInfo.get_singleton()
+	finally:
+		request_cache.local.cache = None
+
+def check_changes():
+	# Returns a list of failures.
+	failures = []
+	system_info = SystemInfo.get_singleton()
+	date_short = system_info.date_short
+	other = 'd/m/Y' if date_short != 'd/m/Y' else 'Y-m-d'
+
+	# A save in another thread is seen immediately.
+	def save_other():
+		s = SystemInfo.read_singleton()
+		s.date_short = other
+		s.save()
+		connection.close()
+	thread = threading.Thread( target=save_other )
+	thread.start()
+	thread.join()
+	if SystemInfo.get_singleton().date_short != other or SystemInfo.get_formats().date_short != other:
+		failures.append( 'save in another thread not seen' )
+
+	# A change by another process is seen when the version is checked.
+	with connection.cursor() as cursor:
+		cursor.execute( 'UPDATE {} SET date_short=%s, version=version+1 WHERE id=%s'.format(SystemInfo._meta.db_table), [date_short, system_info.pk] )
+	check_seconds, SystemInfo.singleton_check_seconds = SystemInfo.singleton_check_seconds, 0.0
+	try:
+		if SystemInfo.get_singleton().date_short != date_short or SystemInfo.get_formats().date_short != date_short:
+			failures.append( 'change by another process not seen' )
+	finally:
+		SystemInfo.singleton_check_seconds = check_seconds
+
+	# Changes to a returned copy do not affect the cached one.
+	SystemInfo.get_singleton().date_short = other
+	if SystemInfo.get_singleton().date_short != date_short:
+		failures.append( 'cached copy was changed' )
+	return failures
+
+class Command(BaseCommand):
+
+	help = 'Measure the cost of SystemInfo.get_singleton and check that changes are seen (in a throwaway database)'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--calls', dest='calls', type=int, default=20000, help='Number of calls to time')
+
+	def handle(self, *args, **options):
+		with benchmark_database():
+			calls = max( options['calls'], 1 )
+			SystemInfo.get_singleton()
+
+			check_seconds = SystemInfo.singleton_check_seconds
+			try:
+				SystemInfo.singleton_check_seconds = 0.0
+				t_check = time_calls( SystemInfo.get_singleton, calls )
+			finally:
+				SystemInfo.singleton_check_seconds = check_seconds
+
+			timings = (
+				('Database read (original)', time_calls(SystemInfo.read_singleton, calls)),
+				('Version check every call', t_check),
+				('Cached', time_calls(SystemInfo.get_singleton, calls)),
+				('Request (20 calls)', time_calls(get_in_request, max(calls // 20, 1)) / 20),
+				('get_formats', time_calls(SystemInfo.get_formats, calls)),
+			)
+			safe_print( u'{} calls, {} database'.format(calls, connection.vendor) )
+			for name, seconds in timings:
+				safe_print( u'{:<26} {:>9.2f} us/call'.format(name, seconds * 1.0e6) )
+
+			failures = check_changes()
+			for f in failures:
+				safe_print( u'Failed: {}'.format(f) )
+			if failures:
+				raise CommandError( 'SystemInfo check failed' )
+			safe_print( u'Changes from other threads and processes are seen.' )
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.13 on 2026-10-17 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_auto_20200521_1644'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesStandings',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_key', models.CharField(max_length=160, verbose_name='Group Key')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Version')),
+                ('is_stale', models.BooleanField(db_index=True, default=True, verbose_name='Stale')),
+                ('standings', models.TextField(blank=True, default='', verbose_name='Standings')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Updated')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Series')),
+            ],
+            options={
+                'verbose_name': 'SeriesStandings',
+                'verbose_name_plural': 'SeriesStandings',
+                'unique_together': {('series', 'group_key')},
+            },
+        ),
+    ]
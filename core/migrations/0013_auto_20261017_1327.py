@@ -0,0 +1,38 @@
+# Generated by Django 2.2.13 on 2026-10-17 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_auto_20261017_1312'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultmassstart',
+            name='lap_kmh_packed',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='resultmassstart',
+            name='race_times_packed',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='resulttt',
+            name='lap_kmh_packed',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='resulttt',
+            name='race_times_packed',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='systeminfo',
+            name='pack_race_times',
+            field=models.BooleanField(default=False, help_text='Store the race times of uploaded results with the result rather than one row per lap', verbose_name='Pack Race Times'),
+        ),
+    ]
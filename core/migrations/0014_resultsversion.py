@@ -0,0 +1,27 @@
+# Generated by Django 2.2.13 on 2026-10-17 17:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_auto_20261017_1327'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultsVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32, unique=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'ResultsVersion',
+                'verbose_name_plural': 'ResultsVersions',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.13 on 2026-10-17 17:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_resultsversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.PositiveSmallIntegerField(null=True)),
+                ('est_kmh', models.FloatField(default=0.0)),
+                ('est_kmh_tt', models.FloatField(null=True)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.Category')),
+                ('category_format', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.CategoryFormat')),
+                ('discipline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Discipline')),
+                ('license_holder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.LicenseHolder')),
+                ('team', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.Team')),
+            ],
+            options={
+                'verbose_name': 'RegistrationProfile',
+                'verbose_name_plural': 'RegistrationProfiles',
+                'unique_together': {('license_holder', 'discipline', 'category_format')},
+            },
+        ),
+    ]
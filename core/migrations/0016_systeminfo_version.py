@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_registrationprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systeminfo',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.13 on 2026-10-17 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_systeminfo_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='licenseholder',
+            name='search_indexed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='LicenseHolderTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('license_holder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.LicenseHolder')),
+            ],
+            options={
+                'unique_together': {('trigram', 'license_holder')},
+            },
+        ),
+    ]
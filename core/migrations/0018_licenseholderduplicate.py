@@ -0,0 +1,43 @@
+# Generated by Django 2.2.13 on 2026-10-17 19:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_licenseholdertrigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='licenseholder',
+            name='duplicates_indexed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='LicenseHolderDuplicateKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=96)),
+                ('license_holder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.LicenseHolder')),
+            ],
+            options={
+                'unique_together': {('key', 'license_holder')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LicenseHolderDuplicate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.CharField(blank=True, default='', max_length=128)),
+                ('duplicate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.LicenseHolder')),
+                ('license_holder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.LicenseHolder')),
+            ],
+            options={
+                'unique_together': {('license_holder', 'duplicate')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.13 on 2026-10-17 19:46
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def set_group_name( apps, schema_editor ):
+    # The group_key becomes a hash of the readable group_name.
+    SeriesStandings = apps.get_model( 'core', 'SeriesStandings' )
+    for ss in SeriesStandings.objects.all():
+        ss.group_name = ss.group_key
+        ss.group_key = hashlib.sha1( ss.group_name.encode() ).hexdigest()
+        ss.save( update_fields=['group_name', 'group_key'] )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_systeminfo_date_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seriesstandings',
+            name='group_name',
+            field=models.TextField(default='', verbose_name='Group Name'),
+        ),
+        migrations.RunPython( set_group_name, migrations.RunPython.noop ),
+        migrations.AlterField(
+            model_name='seriesstandings',
+            name='group_key',
+            field=models.CharField(max_length=40, verbose_name='Group Key'),
+        ),
+    ]
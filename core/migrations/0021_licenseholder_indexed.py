@@ -0,0 +1,29 @@
+# Generated by Django 2.2.13 on 2026-10-17 21:05
+
+from django.db import migrations
+
+
+def merge_indexed( apps, schema_editor ):
+    # A holder is indexed only if it was in both indexes.
+    LicenseHolder = apps.get_model( 'core', 'LicenseHolder' )
+    LicenseHolder.objects.filter( duplicates_indexed=False ).update( search_indexed=False )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_seriesstandings_group_name'),
+    ]
+
+    operations = [
+        migrations.RunPython( merge_indexed, migrations.RunPython.noop ),
+        migrations.RemoveField(
+            model_name='licenseholder',
+            name='duplicates_indexed',
+        ),
+        migrations.RenameField(
+            model_name='licenseholder',
+            old_name='search_indexed',
+            new_name='indexed',
+        ),
+    ]
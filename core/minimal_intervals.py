@@ -1,3 +1,6 @@
+import bisect
+import itertools
+
 def set_to_intervals( s ):
 	if not s:
 		return []
@@ -15,48 +18,114 @@ def set_to_intervals( s ):
 	intervals.append( (nBegin, nLast) )		
 	return intervals
 	
+#-----------------------------------------------------------------------
+# Intervals are (a, b) tuples that include both ends.
+# The functions below take any list of intervals and return sorted, non-overlapping
+# intervals with adjacent intervals merged.
+#
+def normalize( intervals ):
+	merged = []
+	for a, b in sorted( intervals ):
+		if a > b:
+			continue
+		if merged and a <= merged[-1][1] + 1:
+			if b > merged[-1][1]:
+				merged[-1] = (merged[-1][0], b)
+		else:
+			merged.append( (a, b) )
+	return merged
+
+def union( *interval_lists ):
+	return normalize( itertools.chain.from_iterable(interval_lists) )
+
+def intersection( left, right ):
+	left, right = normalize(left), normalize(right)
+	result = []
+	i = j = 0
+	while i < len(left) and j < len(right):
+		a = max( left[i][0], right[j][0] )
+		b = min( left[i][1], right[j][1] )
+		if a <= b:
+			result.append( (a, b) )
+		# Advance the interval that ends first.
+		if left[i][1] < right[j][1]:
+			i += 1
+		else:
+			j += 1
+	return result
+
+def difference( left, right ):
+	left, right = normalize(left), normalize(right)
+	result = []
+	j = 0
+	for a, b in left:
+		while j < len(right) and right[j][1] < a:
+			j += 1
+		k = j
+		while k < len(right) and right[k][0] <= b:
+			if right[k][0] > a:
+				result.append( (a, right[k][0] - 1) )
+			a = max( a, right[k][1] + 1 )
+			k += 1
+		if a <= b:
+			result.append( (a, b) )
+	return result
+
+def contains( intervals, n ):
+	# intervals must be normalized.
+	i = bisect.bisect_right( intervals, (n, float('inf')) ) - 1
+	return i >= 0 and intervals[i][0] <= n <= intervals[i][1]
+
+def coverage_intervals( events, min_count=1 ):
+	# events are sorted (position, count change) pairs.
+	# Returns the intervals covered at least min_count times.
+	intervals = []
+	count = 0
+	for i, (a, v) in enumerate(events):
+		count += v
+		if count >= min_count and i+1 < len(events) and events[i+1][0] > a:
+			intervals.append( (a, events[i+1][0] - 1) )
+	return normalize( intervals )
+
+def interval_numbers( intervals ):
+	return itertools.chain.from_iterable( range(a, b+1) for a, b in intervals )
+
+#-----------------------------------------------------------------------
+
 def minimal_intervals( numbers ):
 	# Input: a list of sets of numbers
 	# Output: a set of intervals expressed as [from,to] for each set that are non-intersecting.
+	# Each set's intervals are widened over the gaps that contain no numbers from the other sets.
 	
 	if not numbers:
 		return []
 	if len(numbers) == 1:
 		return [set_to_intervals(numbers[0])]
 	
-	combineIntervalsTogether = True
-	for n in numbers:
-		if any( bib > 99999 for bib in n ):
-			combineIntervalsTogether = False
-			break
-			
-	intervals = []
+	# Only combine intervals for bib numbers.  Larger numbers are returned as they are.
+	if any( bib > 99999 for n in numbers for bib in n ):
+		return [set_to_intervals(n) for n in numbers]
 	
-	if combineIntervalsTogether:
-		for j, n in enumerate(numbers):
-			if not n:
-				intervals.append( [] )
-				continue
-			
-			other_nums = set.union( *[nn for k, nn in enumerate(numbers) if k != j] )
-			
-			nums = sorted( n )
-			intervalCur = []			
-			nRange = [nums[0], nums[0]]
-			for i in range(1, len(nums)):
-				if other_nums.isdisjoint( range(nums[i-1], nums[i]+1) ):
-					nRange[1] = nums[i]
-				else:
-					if intervalCur and intervalCur[-1][1]+1 == nRange[0]:
-						intervalCur[-1] = ( intervalCur[-1][0], nRange[1] )
-					else:
-						intervalCur.append( tuple(nRange) )
-					nRange = [nums[i], nums[i]]
-			intervalCur.append( tuple(nRange) )
-			
-			intervals.append( intervalCur )
-	else:
-		intervals = [set_to_intervals(n) for n in numbers]
+	# All numbers of all sets, with repeats.
+	# Two consecutive numbers of a set can be joined if they are the only numbers between them.
+	all_nums = sorted( itertools.chain.from_iterable(numbers) )
+	
+	intervals = []
+	for n in numbers:
+		if not n:
+			intervals.append( [] )
+			continue
+		
+		nums = sorted( n )
+		intervalCur = []
+		nBegin = nums[0]
+		for nPrev, nCur in zip(nums, nums[1:]):
+			if bisect.bisect_right(all_nums, nCur) - bisect.bisect_left(all_nums, nPrev) != 2:
+				intervalCur.append( (nBegin, nPrev) )
+				nBegin = nCur
+		intervalCur.append( (nBegin, nums[-1]) )
+		
+		intervals.append( normalize(intervalCur) )
 
 	return intervals
 	
@@ -2,13 +2,20 @@ from . import patch_sqlite_text_factory	# Must be first.
 
 import re
 import os
+import sys
 import math
+import array
 from heapq import heappush
+import time
+import copy
 import datetime
 import base64
 import operator
+import functools
 import random
+import hashlib
 import itertools
+import threading
 from collections import defaultdict
 try:
 	from StringIO import StringIO
@@ -19,7 +26,9 @@ import locale
 
 from django.db import models, connection
 from django.db import transaction, IntegrityError
-from django.db.models import Q, F, Max, Count
+from django.db.models import Q, F, Max, Count, Value, Case, When
+from django.db.models.expressions import Expression
+from django.db.models.functions import Coalesce, Length, Concat, StrIndex, Substr
 
 from django.contrib.contenttypes.models import ContentType
 
@@ -33,7 +42,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.templatetags.static import static
 from django.utils.html import escape
 
-from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_delete, post_save, post_delete
 from django.dispatch import receiver
 
 from . import DurationField
@@ -48,6 +57,7 @@ from .TagFormat import getValidTagFormatStr, getTagFormatStr, getTagFromLicense,
 from .CountryIOC import uci_country_codes_set, ioc_from_country, iso_uci_country_codes, country_from_ioc, province_codes, ioc_from_code
 from .large_delete_all import large_delete_all
 from .WriteLog import writeLog
+from . import minimal_intervals
 
 def get_ids( q, fname=None ):
 	if fname:
@@ -244,6 +254,9 @@ class SystemInfo(models.Model):
 	exclude_empty_categories = models.BooleanField( default = True, verbose_name = _("Exclude Empty Categories from CrossMgr"),
 			 help_text=_('Exclude empty categories from CrossMgr Excel'))
 	
+	pack_race_times = models.BooleanField( default = False, verbose_name = _("Pack Race Times"),
+			 help_text=_('Store the race times of uploaded results with the result rather than one row per lap'))
+	
 	reg_allow_add_multiple_categories = models.BooleanField( default = True, verbose_name = _('Allow "reg" to Add Participants to Multiple Categories'),
 			 help_text=_('If True, reg staff can add participants to Multiple Categories (eg. race up a catgegory).  If False, only "super" can do so.'))
 	
@@ -282,6 +295,9 @@ class SystemInfo(models.Model):
 	)
 	date_Md = models.CharField( max_length=24, default='M d', choices=DATE_MD_CHOICES, verbose_name=_('Month Day Format') )
 	
+	# Bumped on every save so other threads and processes can tell their cached copy is stale.
+	version = models.PositiveIntegerField( default=0, editable=False )
+	
 	def get_cloud_server_url( self, url_ref ):
 		url = self.cloud_server_url
 		i = url.find( 'RaceDB' )
@@ -298,8 +314,37 @@ class SystemInfo(models.Model):
 		tt = '{}######{:02}'.format( rs, datetime.datetime.now().year % 100 )
 		return tt
 	
+	singleton_lock = threading.RLock()
+	singleton_cache = None			# (version, time checked, SystemInfo)
+	singleton_check_seconds = 1.0	# How long to trust the cached copy before checking the version again.
+	formats_cache = None			# (version, FormatCache)
+	
 	@classmethod
 	def get_singleton( cls ):
+		from .request_cache import get_system_info		# import this here to avoid a circular dependency.
+		return get_system_info( cls.get_cached_singleton )
+	
+	@classmethod
+	def get_cached_singleton( cls ):
+		# Returns a copy so callers can change it without affecting other threads.
+		cached = cls.singleton_cache
+		now = time.monotonic()
+		if cached and now - cached[1] < cls.singleton_check_seconds:
+			return copy.copy( cached[2] )
+		
+		with cls.singleton_lock:
+			cached = cls.singleton_cache
+			if cached and now - cached[1] < cls.singleton_check_seconds:
+				return copy.copy( cached[2] )
+			if cached and cls.objects.filter( pk=cached[2].pk ).values_list( 'version', flat=True ).first() == cached[0]:
+				system_info = cached[2]
+			else:
+				system_info = cls.read_singleton()
+			cls.singleton_cache = (system_info.version, now, system_info)
+		return copy.copy( system_info )
+	
+	@classmethod
+	def read_singleton( cls ):
 		system_info = cls.objects.all().first()
 		if system_info is None:
 			system_info = cls( tag_template = cls.get_tag_template_default() )
@@ -314,21 +359,37 @@ class SystemInfo(models.Model):
 	def get_exclude_empty_categories( cls ):
 		return cls.get_singleton().exclude_empty_categories
 	
+	@classmethod
+	def get_pack_race_times( cls ):
+		return cls.get_singleton().pack_race_times
+	
 	def save( self, *args, **kwargs ):
 		self.tag_template = getValidTagFormatStr( self.tag_template )
 		self.rfid_server_host = (self.rfid_server_host or self.RFID_SERVER_HOST_DEFAULT)
 		self.rfid_server_port = (self.rfid_server_port or self.RFID_SERVER_PORT_DEFAULT)
-		SystemInfo.formats = date_transform.FormatCache( self )
-		return super().save( *args, **kwargs )
+		
+		# Increment the version in the database so concurrent saves always get different versions.
+		if self.pk is None:
+			self.version = 1
+		else:
+			self.version = F('version') + 1
+			if kwargs.get('update_fields') is not None:
+				kwargs['update_fields'] = list(kwargs['update_fields']) + ['version']
+		result = super().save( *args, **kwargs )
+		if not isinstance(self.version, int):
+			self.refresh_from_db( fields=['version'] )
+		
+		with SystemInfo.singleton_lock:
+			SystemInfo.singleton_cache = (self.version, time.monotonic(), copy.copy(self))
+		return result
 	
 	@classmethod
 	def get_formats( cls ):
-		try:
-			return cls.formats
-		except AttributeError:
-			pass
-		cls.formats = date_transform.FormatCache( cls.get_singleton() )
-		return cls.formats
+		system_info = cls.get_singleton()
+		formats = cls.formats_cache
+		if formats is None or formats[0] != system_info.version:
+			formats = cls.formats_cache = (system_info.version, date_transform.FormatCache(system_info))
+		return formats[1]
 	
 	class Meta:
 		verbose_name = _('SystemInfo')
@@ -460,6 +521,36 @@ class RaceClass(models.Model):
 		verbose_name_plural = _('Race Classes')
 		ordering = ['sequence', 'name']
 
+@functools.lru_cache( maxsize=1024 )
+def get_range_events( range_str ):
+	if not range_str:
+		return ()
+	range_events = []
+	for r in range_str.split(','):
+		if r.startswith('-'):
+			v = -1
+			r = r[1:]
+		else:
+			v = 1
+		if not r:
+			continue
+			
+		try:
+			a, b = r.split('-')[:2]
+		except ValueError:
+			a = b = r
+		
+		try:
+			a, b = int(a), int(b)
+		except ValueError:
+			continue
+		
+		range_events.append( (a, v) )
+		range_events.append( (b+1, -v) )
+	
+	range_events.sort()
+	return tuple( range_events )
+
 class NumberSet(models.Model):
 	name = models.CharField( max_length = 64, verbose_name = _('Name') )
 	sequence = models.PositiveSmallIntegerField( db_index = True, verbose_name=_('Sequence'), default = 0 )
@@ -471,33 +562,7 @@ class NumberSet(models.Model):
 	description = models.CharField( max_length = 80, default = '', blank = True, verbose_name = _('Description') )
 	
 	def get_range_events( self ):
-		if not self.range_str:
-			return []
-		range_events = []
-		for r in self.range_str.split(','):
-			if r.startswith('-'):
-				v = -1
-				r = r[1:]
-			else:
-				v = 1
-			if not r:
-				continue
-				
-			try:
-				a, b = r.split('-')[:2]
-			except ValueError:
-				a = b = r
-			
-			try:
-				a, b = int(a), int(b)
-			except ValueError:
-				continue
-			
-			range_events.append( (a, v) )
-			range_events.append( (b+1, -v) )
-		
-		range_events.sort()
-		return range_events
+		return list( get_range_events(self.range_str) )
 	
 	def get_bib_max_count( self, bib, range_events = None  ):
 		range_events = range_events or self.get_range_events()
@@ -636,17 +701,24 @@ class NumberSet(models.Model):
 	def __str__( self ):
 		return self.name
 	
-	def validate( self ):
+	def get_excess_entries( self ):
 		# Nulls sort to the beginning.  If we have a lost bib it will have a date_lost.
 		# We want to keep as many lost entries as we can, so we delete everything but the last values.
 		range_events = self.get_range_events()
 		duplicates = defaultdict( list )
-		for nse in self.numbersetentry_set.order_by('bib', 'date_lost'):
-			duplicates[nse.bib].append( nse.pk )
+		for bib, pk in self.numbersetentry_set.order_by('bib', 'date_lost').values_list('bib', 'pk'):
+			duplicates[bib].append( pk )
+		excess = []
 		for bib, pks in duplicates.items():
 			bib_max_count = self.get_bib_max_count(bib, range_events)
 			if len(pks) > bib_max_count:
-				NumberSetEntry.objects.filter( pk__in=pks[:-bib_max_count] ).delete()
+				excess.extend( pks[:-bib_max_count] )
+		return excess
+	
+	def validate( self ):
+		excess = self.get_excess_entries()
+		for i in range(0, len(excess), 500):
+			NumberSetEntry.objects.filter( pk__in=excess[i:i+500] ).delete()
 	
 	class Meta:
 		verbose_name = _('Number Set')
@@ -1112,39 +1184,13 @@ class Competition(models.Model):
 		return False
 			
 	def get_available_categories( self, license_holder, gender=None, participant_exclude=None ):
-		categories_remaining = Category.objects.filter( format=self.category_format )
-		if gender is None:
-			gender = license_holder.gender
-		if gender != -1:
-			categories_remaining = categories_remaining.filter( Q(gender=2) | Q(gender=gender) )
-		
-		participants = list( Participant.objects.filter(competition=self, role=Participant.Competitor, license_holder=license_holder) )
-		if not participants:
-			return list(categories_remaining)
-		
-		# Only return categories that are not in the same event.
-		categories_remaining = set( categories_remaining )
-		
-		if participant_exclude:
-			categories_remaining.discard( participant_exclude.category )
-		
-		for e in self.get_events():
-			for p in participants:
-				if p != participant_exclude and e.is_participating(p):
-					categories_remaining -= set( e.get_categories_with_wave() )
-		return sorted( set(categories_remaining), key=lambda c: c.sequence )
+		from .category_matrix import get_available_categories		# import this here to avoid a circular dependency.
+		return get_available_categories( self, license_holder, gender, participant_exclude )
 		
 	def is_category_conflict( self, categories ):
-		if not isinstance(categories, set):
-			categories = set(categories)
-		if len(categories) > 1:
-			# Check if the set of categories would cause racing in the same event simultaneously in different waves.
-			for e in self.get_events():
-				event_categories = e.get_categories_with_wave()
-				compete_categories = categories & set( event_categories )
-				if len(compete_categories) > 1:
-					return True, e, event_categories
-		return False, None, None
+		# Check if the set of categories would cause racing in the same event simultaneously in different waves.
+		from .category_matrix import is_category_conflict		# import this here to avoid a circular dependency.
+		return is_category_conflict( self, categories )
 	
 	@transaction.atomic
 	def auto_generate_missing_tags( self ):
@@ -1163,57 +1209,150 @@ class Competition(models.Model):
 		participants_changed.sort( key=lambda p: (p.bib or 99999999, p.license_holder.search_text) ) 
 		return participants_changed
 	
-	def apply_number_set( self ):
+	def apply_number_set( self, dry_run=False ):
+		'''
+			Sets the Competitor bibs from the bibs held in the NumberSet.
+			Returns the participants whose bib changes, with the previous bib in bib_last.
+			With dry_run, nothing is saved.
+		'''
 		participants_changed = []
 		if self.number_set:
-			self.number_set.validate()
-			
-			participants = self.get_participants().filter( role=Participant.Competitor )
+			number_set = self.number_set
+			if dry_run:
+				excess = set( number_set.get_excess_entries() )
+			else:
+				number_set.validate()
+				excess = set()
 			
 			category_nums = {}
-			for category_numbers in CategoryNumbers.objects.filter( competition=self ):
+			category_cn = {}
+			for category_numbers in CategoryNumbers.objects.filter( competition=self ).prefetch_related('categories'):
+				category_numbers.competition = self
 				for c in category_numbers.categories.all():
 					category_nums[c.pk] = category_numbers.get_numbers()
-			
-			bib_last = { pk:bib for pk, bib in participants.values_list('pk', 'bib') }
-			participants.update( bib=None )
+					category_cn.setdefault( c.pk, category_numbers.pk )
 			
 			nses = defaultdict( list )
-			for pk, bib in NumberSetEntry.objects.filter(
-					number_set=self.number_set, date_lost=None).values_list(
-					'license_holder__pk', 'bib'):
-				nses[pk].append( bib )
+			for pk, license_holder_id, bib in NumberSetEntry.objects.filter(
+					number_set=number_set, date_lost=None).values_list(
+					'pk', 'license_holder', 'bib'):
+				if pk not in excess:
+					nses[license_holder_id].append( bib )
 				
 			for bibs in nses.values():
 				bibs.sort()
 			
-			with transaction.atomic():
-				for p in participants:
-					bib_category = None
-					if p.category:
-						for bib in nses[p.license_holder.pk]:
-							if p.category.pk in category_nums and bib in category_nums[p.category.pk]:
-								bib_category = bib
-								break
-					if p.bib != bib_category:
-						p.bib = bib_category
-						p.save()
-					if bib_last[p.pk] != p.bib:
-						participants_changed.append( p )
+			participants = list( self.get_participants().filter( role=Participant.Competitor ).select_related('license_holder', 'category', 'team') )
+			bib_tags_last = { p.pk:(p.bib, p.tag, p.tag2) for p in participants }
+			for p in participants:
+				p.bib = None
+				if p.category_id in category_nums:
+					numbers = category_nums[p.category_id]
+					for bib in nses[p.license_holder_id]:
+						if bib in numbers:
+							p.bib = bib
+							break
+			
+			# As Participant.save does with propagate_bib_tag, the participants of a license holder in
+			# the same CategoryNumbers get the bib and tags of the last one with a bib.
+			# save would also call number_set.assign_bib, which does nothing here as each bib is held by the license holder.
+			bib_tag_source = {}
+			for p in participants:
+				if p.bib and p.category_id in category_cn:
+					bib_tag_source[(p.license_holder_id, category_cn[p.category_id])] = p
+			for p in participants:
+				source = bib_tag_source.get( (p.license_holder_id, category_cn.get(p.category_id)) )
+				if source and source is not p:
+					p.bib, p.tag, p.tag2 = source.bib, source.tag, source.tag2
+			
+			participants_update = []
+			for p in participants:
+				if p.bib != bib_tags_last[p.pk][0]:
+					p.bib_last = bib_tags_last[p.pk][0]
+					participants_changed.append( p )
+				if (p.bib, p.tag, p.tag2) != bib_tags_last[p.pk]:
+					participants_update.append( p )
+			
+			if participants_update and not dry_run:
+				pks = [p.pk for p in participants_changed]
+				with transaction.atomic():
+					# Clear the changed bibs first.  A bib moving to another participant in the same category
+					# would otherwise violate the unique (competition, category, bib) constraint part way through the update.
+					for i in range(0, len(pks), 500):
+						Participant.objects.filter( pk__in=pks[i:i+500] ).update( bib=None )
+					Participant.objects.bulk_update( participants_update, ['bib', 'tag', 'tag2'], batch_size=500 )
+				from .bib_index import invalidate		# import this here to avoid a circular dependency.
+				invalidate( self.pk, self.number_set_id )
+				# The bulk updates do not send the Participant signals that bump the Hub versions.
+				ResultsVersion.bump_competition( self.pk )
 		
 		participants_changed.sort( key=lambda p: (p.bib or 99999999, p.license_holder.search_text) ) 
 		return participants_changed
 	
 	@transaction.atomic
 	def initialize_number_set( self ):
-		if self.number_set:
-			large_delete_all( NumberSetEntry, Q(number_set=self.number_set) )
-			NumberSetEntry.objects.bulk_create( [
-					NumberSetEntry(number_set=self.number_set, license_holder=participant.license_holder, bib=participant.bib, date_lost=None)
-						for participant in self.get_participants().filter(role=Participant.Competitor) if participant.bib
-				]
-			)
-			self.number_set.validate()
+		'''
+			Replaces the NumberSet entries with the Competitor bibs in this Competition.
+			Returns the number of entries created, skipped (already in the NumberSet),
+			conflicting (the bib is already used as often as the NumberSet allows) and deleted.
+		'''
+		counts = {'created':0, 'skipped':0, 'conflicting':0, 'deleted':0}
+		if not self.number_set:
+			return counts
+		
+		number_set = self.number_set
+		bib_max_count = number_set.get_bib_max_count_all()
+		
+		wanted = set( self.get_participants().filter(role=Participant.Competitor, bib__isnull=False).values_list('license_holder', 'bib') )
+		
+		# Match the existing entries in one query.  Prefer entries in use to lost ones.
+		found = {}
+		delete = []
+		for pk, license_holder_id, bib, date_lost in sorted(
+				number_set.numbersetentry_set.values_list('pk', 'license_holder', 'bib', 'date_lost'),
+				key=lambda e: (e[3] is not None, e[0]) ):
+			key = (license_holder_id, bib)
+			if key in wanted and key not in found:
+				found[key] = (pk, date_lost)
+			else:
+				delete.append( pk )
+		
+		bib_count = defaultdict( int )
+		for (license_holder_id, bib), (pk, date_lost) in found.items():
+			if date_lost is None:
+				bib_count[bib] += 1
+				counts['skipped'] += 1
+		
+		# Lost entries are reissued before new entries are created.
+		reissue = []
+		create = []
+		today = datetime.date.today()
+		for license_holder_id, bib in sorted( wanted, key=lambda k: (k not in found, k) ):
+			pk, date_lost = found.get( (license_holder_id, bib), (None, None) )
+			if pk is not None and date_lost is None:
+				continue
+			if bib_count[bib] >= bib_max_count[bib]:
+				counts['conflicting'] += 1
+				if pk is not None:
+					delete.append( pk )
+				continue
+			bib_count[bib] += 1
+			if pk is not None:
+				reissue.append( pk )
+			else:
+				create.append( NumberSetEntry(number_set=number_set, license_holder_id=license_holder_id, bib=bib, date_issued=today) )
+		
+		for i in range(0, len(delete), 500):
+			NumberSetEntry.objects.filter( pk__in=delete[i:i+500] ).delete()
+		for i in range(0, len(reissue), 500):
+			NumberSetEntry.objects.filter( pk__in=reissue[i:i+500] ).update( date_lost=None, date_issued=today )
+		NumberSetEntry.objects.bulk_create( create, batch_size=500 )
+		counts['created'] = len(reissue) + len(create)
+		counts['deleted'] = len(delete)
+		
+		from .bib_index import invalidate		# import this here to avoid a circular dependency.
+		invalidate( number_set_id=self.number_set_id )
+		return counts
 	
 	def prereg_detect( self ):
 		off_site_count = prereg_count = total_count = 0
@@ -1279,41 +1418,69 @@ class Competition(models.Model):
 		verbose_name_plural = _('Competitions')
 		ordering = ['-start_date', 'name']
 
-def get_bib_query( bibs ):
-	if not bibs:
-		return Q( bib=999999 )
-		
-	bibs = sorted( set(bibs) )
-	standalone_bibs = []	# List of individual bibs not in a range.
+#-------------------------------------------------------------------
+# Bib queries.
+#
+# Contiguous bibs become BETWEEN ranges and the rest go into one IN list.
+# Every OR adds a level to the SQLite expression tree (limited to 1000 levels), so only the
+# longest ranges stay as BETWEEN and the others are listed.  Long lists are written as literals
+# as they would exceed the limit on query parameters.
+# If the gaps between the bibs are simpler than the bibs themselves, the query excludes the gaps instead.
+#
+BibQueryMaxRanges = 64
+BibQueryMaxParams = 500
+
+class BibValues( Expression ):
+	# A literal list of bibs for an IN lookup.
+	def __init__( self, bibs ):
+		super().__init__( output_field=models.IntegerField() )
+		self.bibs = bibs
+	
+	def as_sql( self, compiler, connection ):
+		return u','.join( str(int(b)) for b in self.bibs ), []
+
+def get_intervals_plan( intervals, max_ranges ):
+	# Returns the ranges to query with BETWEEN and the bibs to list with IN.
+	ranges = [(a, b) for a, b in intervals if a != b]
+	values = [a for a, b in intervals if a == b]
+	if len(ranges) > max_ranges:
+		ranges.sort( key=lambda r: r[0] - r[1] )		# Longest first.
+		for a, b in ranges[max_ranges:]:
+			values.extend( range(a, b+1) )
+		ranges = sorted( ranges[:max_ranges] )
+		values.sort()
+	return ranges, values
+
+def get_intervals_query( ranges, values ):
+	query = Q()
+	for a, b in ranges:
+		query |= Q(bib__range=(a,b))
+	if len(values) == 1:
+		query |= Q(bib=values[0])
+	elif len(values) > BibQueryMaxParams:
+		query |= Q(bib__in=BibValues(values))
+	elif values:
+		query |= Q(bib__in=values)
+	return query
 
-	def add_range( query, a, b ):
-		if a == b:
-			standalone_bibs.append( a )
-			return query
-		try:
-			return query | Q(bib__range=(a,b))
-		except TypeError:
-			return Q(bib__range=(a,b))
-
-	query = None
-	a = b = bibs[0]
-	for n in bibs[1:]:
-		if n - 1 == b: # Part of the group, bump the end
-			b = n
-		else: # Not part of the group, process current group and start a new
-			query = add_range( query, a, b )
-			a = b = n
-	query = add_range( query, a, b )
-	
-	if standalone_bibs:
-		q = Q( bib=standalone_bibs[0] ) if len(standalone_bibs) == 1 else Q( bib__in=standalone_bibs )
-		try:
-			query |= q
-		except TypeError:
-			query = q
+def get_bib_intervals_query( intervals, max_ranges=BibQueryMaxRanges ):
+	if not intervals:
+		return Q( bib=999999 )
 	
-	return query
+	ranges, values = get_intervals_plan( intervals, max_ranges )
+	
+	if len(intervals) > 1:
+		gaps = [(intervals[i][1]+1, intervals[i+1][0]-1) for i in range(len(intervals)-1)]
+		gap_ranges, gap_values = get_intervals_plan( gaps, max_ranges - 1 )
+		if len(gap_ranges) + len(gap_values) < len(ranges) + len(values):
+			return Q(bib__range=(intervals[0][0], intervals[-1][1])) & ~get_intervals_query( gap_ranges, gap_values )
+	
+	return get_intervals_query( ranges, values )
+
+def get_bib_query( bibs, max_ranges=BibQueryMaxRanges ):
+	return get_bib_intervals_query( minimal_intervals.set_to_intervals(set(bibs)), max_ranges )
 
+@functools.lru_cache( maxsize=1024 )
 def validate_range_str( range_str ):
 	r = range_str.upper()
 	r = re.sub( r'\s', ',', r, flags=re.UNICODE )	# Replace spaces with commas.
@@ -1357,8 +1524,8 @@ def validate_range_str( range_str ):
 	
 	return u', '.join( pairs )
 
-def get_numbers( range_str ):
-	include = set()
+def get_range_intervals( range_str ):
+	intervals = []
 	for p in range_str.split(','):
 		p = p.strip()
 		if not p:
@@ -1373,27 +1540,46 @@ def get_numbers( range_str ):
 		pair = p.split( '-' )
 		if len(pair) == 1:
 			n = max(1, int(pair[0]))
-			if exclude:
-				include.discard( n )
-			else:
-				include.add( n )
+			nBegin, nEnd = n, n
 		elif len(pair) >= 2:
 			nBegin, nEnd = [int(v) for v in pair[:2]]
 			nBegin, nEnd = max(nBegin, 1), min(nEnd, 99999)
-			if exclude:
-				include.difference_update( range(nBegin, nEnd+1) )
-			else:
-				include.update( range(nBegin, nEnd+1) )
+		
+		if exclude:
+			intervals = minimal_intervals.difference( intervals, [(nBegin, nEnd)] )
+		else:
+			intervals = minimal_intervals.union( intervals, [(nBegin, nEnd)] )
 	
-	return include
+	return intervals
+
+def get_numbers( range_str ):
+	return set( minimal_intervals.interval_numbers(get_range_intervals(range_str)) )
+
+#-------------------------------------------------------------------
+# Parsed bib ranges are shared by the whole process.
+# They are keyed by the range strings themselves, so an edited range is just a new key
+# and the cache never has to be invalidated.
+#
+class BibRanges( object ):
+	def __init__( self, intervals ):
+		self.intervals = intervals
+		self.numbers = frozenset( minimal_intervals.interval_numbers(intervals) )
+		self.query = get_bib_intervals_query( intervals )
+
+@functools.lru_cache( maxsize=1024 )
+def get_bib_ranges( range_str, number_set_range_str=None ):
+	intervals = get_range_intervals( validate_range_str(range_str) )
+	range_events = get_range_events( number_set_range_str )
+	if range_events:
+		# Only keep the bibs allowed by the NumberSet.
+		intervals = minimal_intervals.intersection( intervals, minimal_intervals.coverage_intervals(range_events) )
+	return BibRanges( intervals )
 	
 class CategoryNumbers( models.Model ):
 	competition = models.ForeignKey( Competition, db_index = True, on_delete=models.CASCADE )
 	categories = models.ManyToManyField( Category )
 	range_str = models.TextField( default = '1-99,120-129,-50-60,181,-87', verbose_name=_('Range') )
 	
-	numCache = None
-	
 	@property
 	def category_list( self ):
 		return u', '.join( c.code_gender for c in self.get_category_list() )
@@ -1422,25 +1608,16 @@ class CategoryNumbers( models.Model ):
 		self.range_str = validate_range_str( self.range_str )
 		return self.range_str
 	
-	def getNumbersWorker( self ):
+	def get_bib_ranges( self ):
 		self.validate()
-		include = get_numbers( self.range_str )
-		if self.competition.number_set:
-			number_set = self.competition.number_set
-			range_events = number_set.get_range_events()
-			is_bib_valid = number_set.is_bib_valid
-			include = set( bib for bib in include if is_bib_valid(bib, range_events) )
-		include.discard( 0 )
-		return include
+		number_set = self.competition.number_set
+		return get_bib_ranges( self.range_str, number_set.range_str if number_set else None )
 	
 	def get_numbers( self ):
-		if self.numCache is None or getattr(self, 'range_str_cache', None) != self.range_str:
-			self.numCache = self.getNumbersWorker()
-			self.range_str_cache = self.range_str
-		return self.numCache
+		return self.get_bib_ranges().numbers
 		
 	def get_bib_query( self ):
-		return get_bib_query( self.get_numbers() )
+		return self.get_bib_ranges().query
 	
 	def __contains__( self, n ):
 		return n in self.get_numbers()
@@ -1544,7 +1721,8 @@ class Event( models.Model ):
 		return self.get_result_class().objects.filter( event=self )
 		
 	def add_laps_to_results_query( self, results ):
-		return results.annotate( laps=Count(self.get_race_time_class().__name__.lower()) )
+		# Packed results have no RaceTime rows.  Count their race times from the packed length.
+		return results.annotate( laps=Count(self.get_race_time_class().__name__.lower()) + Coalesce(Length('race_times_packed'), 0) / 8 )
 
 	def has_results( self ):
 		return self.get_results().exists()
@@ -1637,22 +1815,21 @@ class Event( models.Model ):
 		potential_duplicates = []
 		category_numbers = list( category_numbers )
 		for i, cnLeft in enumerate(category_numbers):
-			numbersLeft = cnLeft.get_numbers()
+			intervalsLeft = cnLeft.get_bib_ranges().intervals
 			for cnRight in category_numbers[i+1:]:
-				numbersRight = cnRight.get_numbers()
-				numbersConflict = numbersLeft & numbersRight
-				if numbersConflict:
+				intervalsConflict = minimal_intervals.intersection( intervalsLeft, cnRight.get_bib_ranges().intervals )
+				if intervalsConflict:
 					potential_duplicates.append( (
 						u', '.join( c.code for c in cnLeft.categories.all() ),
 						u', '.join( c.code for c in cnRight.categories.all() ),
-						sorted(numbersConflict)
+						list( minimal_intervals.interval_numbers(intervalsConflict) )
 					))						
 		return potential_duplicates
 
 	def get_categories_with_wave( self ):
 		category_lookup = set( Category.objects.filter(format = self.competition.category_format).values_list('pk', flat=True) )
 		categories = []
-		for wave in self.get_wave_set().all():
+		for wave in self.get_wave_set().all().prefetch_related('categories'):
 			categories.extend( list(c for c in wave.categories.all() if c.pk in category_lookup) )
 		return sorted( set(categories), key = lambda c: c.sequence )
 	
@@ -1886,10 +2063,10 @@ class WaveBase( models.Model ):
 			if any( c in my_categories for c in categories_cur ):
 				my_category_numbers.add( cn )
 		
-		other_bibs = set.union( *[c.get_numbers() for c in other_category_numbers] ) if other_category_numbers else set()
-		my_bibs = set.union( *[c.get_numbers() for c in my_category_numbers] ) if my_category_numbers else set()
+		other_bibs = minimal_intervals.union( *[c.get_bib_ranges().intervals for c in other_category_numbers] )
+		my_bibs = minimal_intervals.union( *[c.get_bib_ranges().intervals for c in my_category_numbers] )
 		
-		return sorted( other_bibs & my_bibs )
+		return list( minimal_intervals.interval_numbers(minimal_intervals.intersection(other_bibs, my_bibs)) )
 	
 	def get_participant_options( self ):
 		return ParticipantOption.objects.filter(
@@ -2343,6 +2520,11 @@ class LicenseHolder(models.Model):
 
 	SearchTextLength = 256
 	search_text = models.CharField( max_length=SearchTextLength, blank=True, default='', db_index=True )
+	indexed = models.BooleanField( default=False, db_index=True )	# True if in the search and duplicate indexes (see license_holder_index.py).
+	
+	# Fields the search and duplicate indexes are built from.  Saves that do not change them do not re-index.
+	# Holders written without save (eg. bulk_create) keep indexed=False until index_license_holders adds them.
+	IndexFields = ('search_text', 'last_name', 'first_name', 'gender', 'date_of_birth', 'uci_id')
 	
 	eligible = models.BooleanField( default=True, verbose_name=_('Eligible to Compete'), db_index=True )
 	note = models.TextField( null=True, blank=True, verbose_name=_('LicenseHolder Note') )
@@ -2356,6 +2538,16 @@ class LicenseHolder(models.Model):
 
 	objects = LicenseHolderManager()
 
+	def get_index_values( self ):
+		return tuple( getattr(self, f) for f in self.IndexFields )
+	
+	@classmethod
+	def from_db( cls, db, field_names, values ):
+		instance = super(LicenseHolder, cls).from_db( db, field_names, values )
+		if instance.__dict__.get('indexed') and all( f in instance.__dict__ for f in cls.IndexFields ):
+			instance._index_values = instance.get_index_values()
+		return instance
+
 	@property
 	def is_eligible( self ):
 		if self.eligible:
@@ -2463,7 +2655,22 @@ class LicenseHolder(models.Model):
 
 		self.search_text = self.get_search_text()[:self.SearchTextLength]
 		
-		super(LicenseHolder, self).save( *args, **kwargs )
+		index_values = self.get_index_values()
+		index_values_last = getattr( self, '_index_values', None )
+		if index_values == index_values_last:
+			super(LicenseHolder, self).save( *args, **kwargs )
+		else:
+			# New, not indexed yet, or an indexed field changed.
+			if index_values_last is None:
+				fields_changed = set( self.IndexFields )
+			else:
+				fields_changed = set( f for f, v, v_last in zip(self.IndexFields, index_values, index_values_last) if v != v_last )
+			from .license_holder_index import index_license_holder		# import this here to avoid a circular dependency.
+			with transaction.atomic():
+				self.indexed = True
+				super(LicenseHolder, self).save( *args, **kwargs )
+				index_license_holder( self, fields_changed )
+		self._index_values = index_values
 		
 	@property
 	def is_temp_license( self ):
@@ -2607,6 +2814,19 @@ class LicenseHolder(models.Model):
 	def first_last_short( self ):
 		return u'. '.join( f for f in (self.first_name[:1], self.last_name) if f )
 		
+	@staticmethod
+	def get_name_search_text( prefix='' ):
+		# Expression for the leading "last" "first" part of search_text (see get_search_text).
+		# A field separator is appended so the end of each name is always found.
+		search_text = Concat( F(prefix + 'search_text'), Value('" "') )
+		last_end = StrIndex( search_text, Value('" "') )
+		first_end = last_end + 2 + StrIndex( Substr(search_text, last_end + 3), Value('" "') )
+		return Case(
+			When( then=Substr(search_text, 1, last_end), **{prefix + 'first_name':''} ),
+			default=Substr( search_text, 1, first_end ),
+			output_field=models.CharField(),
+		)
+	
 	def get_search_text( self ):
 		return utils.get_search_text( [
 				self.last_name, self.first_name,
@@ -2694,48 +2914,8 @@ class LicenseHolder(models.Model):
 	
 	@classmethod
 	def get_duplicates( cls ):
-		duplicates = defaultdict( list )
-		for last_name, first_name, gender, date_of_birth, uci_id, pk in LicenseHolder.objects.values_list(
-				'last_name','first_name','gender','date_of_birth','uci_id','pk'):
-			
-			name_initial = u'{}, {}'.format(utils.removeDiacritic(last_name).upper(), utils.removeDiacritic(first_name[:1]).upper())
-			key = (
-				name_initial,
-				gender,
-				date_of_birth
-			)
-			duplicates[key].append( pk )
-			if uci_id:
-				duplicates[(u'{} UCIID'.format(u' '.join( uci_id[i:i+3] for i in range(0, len(uci_id), 3) )),None,None)].append( pk )
-			
-			# Check for reversed day/month
-			if date_of_birth.day != date_of_birth.month and date_of_birth.day <= 12:
-				key = (
-					name_initial,
-					gender,
-					datetime.date(year=date_of_birth.year, month=date_of_birth.day, day=date_of_birth.month)
-				)
-				if key in duplicates:
-					duplicates[key].append( pk )
-			
-			# Check for improper gender
-			key = (
-				name_initial,
-				1 - gender,
-				date_of_birth
-			)
-			if key in duplicates:
-				duplicates[key].append( pk )
-		
-		duplicates = [{
-				'key': key,
-				'duplicateIds': u','.join(u'{}'.format(pk) for pk in pks),
-				'license_holders': LicenseHolder.objects.filter(pk__in=pks).order_by('search_text'),
-				'license_holders_len': len(pks),
-			} for key, pks in duplicates.items() if len(pks) > 1]
-			
-		duplicates.sort( key=lambda r: r['key'] )
-		return duplicates
+		from .duplicates import get_duplicates		# import this here to avoid a circular dependency.
+		return get_duplicates()
 
 	@classmethod
 	def get_errors( cls ):
@@ -2823,6 +3003,38 @@ class LicenseHolder(models.Model):
 		verbose_name_plural = _('LicenseHolders')
 		ordering = ['search_text']
 
+class LicenseHolderTrigram(models.Model):
+	# Inverted index of the three character substrings of LicenseHolder.search_text (see search_index.py).
+	license_holder = models.ForeignKey( 'LicenseHolder', on_delete=models.CASCADE )
+	trigram = models.CharField( max_length=3 )
+	
+	class Meta:
+		unique_together = (
+			('trigram', 'license_holder'),
+		)
+
+class LicenseHolderDuplicateKey(models.Model):
+	# Blocking keys for finding duplicate LicenseHolders (see duplicates.py).
+	license_holder = models.ForeignKey( 'LicenseHolder', on_delete=models.CASCADE )
+	key = models.CharField( max_length=96 )
+	
+	class Meta:
+		unique_together = (
+			('key', 'license_holder'),
+		)
+
+class LicenseHolderDuplicate(models.Model):
+	# A pair of LicenseHolders that are likely the same person (license_holder has the lower pk).
+	license_holder = models.ForeignKey( 'LicenseHolder', related_name='+', on_delete=models.CASCADE )
+	duplicate = models.ForeignKey( 'LicenseHolder', related_name='+', on_delete=models.CASCADE )
+	score = models.FloatField()
+	reasons = models.CharField( max_length=128, blank=True, default='' )
+	
+	class Meta:
+		unique_together = (
+			('license_holder', 'duplicate'),
+		)
+
 def add_name_to_tag( competition, tag ):
 	s = [tag]
 	lh = None
@@ -2892,6 +3104,11 @@ class Result(models.Model):
 	time_bonus = DurationField.DurationField( null=True, blank=True, verbose_name=_('Time Bonus') )
 	
 	relegated = models.BooleanField( default=False, verbose_name=_('Relegated') )
+	
+	# Race times and lap speeds packed as little-endian doubles (see pack_floats).
+	# If None, the race times are in the RaceTime rows.
+	race_times_packed = models.BinaryField( null=True, blank=True, default=None, editable=False )
+	lap_kmh_packed = models.BinaryField( null=True, blank=True, default=None, editable=False )
 
 	@property
 	def adjusted_finish_time( self ):
@@ -2950,13 +3167,34 @@ class Result(models.Model):
 		wave = self.event.get_wave_for_category( self.participant.category )
 		return self.wave_result_html if wave.rank_categories_together else self.category_result_html
 	
+	@property
+	def is_packed( self ):
+		return self.race_times_packed is not None
+	
+	def get_packed_race_times( self ):
+		return unpack_floats( self.race_times_packed )
+	
+	def get_packed_lap_kmh( self ):
+		# Same length as the race times.  The first entry is always 0.0, as with RaceTime rows.
+		return unpack_floats( self.lap_kmh_packed )
+	
 	def has_race_times( self ):
+		if self.is_packed:
+			return bool( self.race_times_packed )
 		return self.get_race_time_query().exists()
 	
-	def set_race_times( self, race_times, lap_speeds=[], do_create=True ):
-		self.delete_race_times()
+	def set_race_times( self, race_times, lap_speeds=[], do_create=True, do_delete=True, pack=False ):
+		if do_delete:
+			self.delete_race_times()
 		if len(lap_speeds) < len(race_times)-1:
 			lap_speeds.extend( [0.0] * (len(race_times) - 1 - len(lap_speeds) ) )
+		if pack:
+			race_times = race_times if len(race_times) >= 2 else []
+			self.race_times_packed = pack_floats( race_times )
+			self.lap_kmh_packed = pack_floats( [0.0] + lap_speeds[:len(race_times)-1] if race_times else [] )
+			if do_create:
+				self.save( update_fields=['race_times_packed', 'lap_kmh_packed'] )
+			return None
 		if len(race_times) >= 2:
 			RTC = self.get_race_time_class()
 			rtcs = [
@@ -2971,28 +3209,68 @@ class Result(models.Model):
 			else:
 				return rtcs
 		return None
-			
+	
+	def pack_race_times( self ):
+		# Move the RaceTime rows into the packed fields.
+		if self.is_packed:
+			return
+		rts = list( self.get_race_time_query().values_list('race_time', 'lap_kmh') )
+		self.race_times_packed = pack_floats( [rt.total_seconds() for rt, lk in rts] )
+		self.lap_kmh_packed = pack_floats( [0.0 if i == 0 else (lk or 0.0) for i, (rt, lk) in enumerate(rts)] )
+		with transaction.atomic():
+			self.save( update_fields=['race_times_packed', 'lap_kmh_packed'] )
+			self.get_race_time_query().delete()
+	
+	def unpack_race_times( self ):
+		# Move the packed race times back into RaceTime rows.
+		if not self.is_packed:
+			return
+		race_times, lap_kmh = self.get_packed_race_times(), self.get_packed_lap_kmh()
+		self.race_times_packed = self.lap_kmh_packed = None
+		with transaction.atomic():
+			self.save( update_fields=['race_times_packed', 'lap_kmh_packed'] )
+			self.set_race_times( race_times, lap_kmh[1:] )
+	
 	def set_lap_times( self, lap_times, lap_speeds=[] ):
 		race_times = [0.0]
 		for lt in lap_times:
 			race_times.append( race_times[-1] + lt )
-		self.set_race_times( race_times, lap_speeds )
+		self.set_race_times( race_times, lap_speeds, pack=self.is_packed )
 	
 	def add_race_time( self, rt, lk=0.0 ):
+		if self.is_packed:
+			race_times, lap_kmh = self.get_packed_race_times(), self.get_packed_lap_kmh()
+			race_times.append( rt )
+			lap_kmh.append( lk if len(race_times) > 1 else 0.0 )
+			self.race_times_packed, self.lap_kmh_packed = pack_floats( race_times ), pack_floats( lap_kmh )
+			self.save( update_fields=['race_times_packed', 'lap_kmh_packed'] )
+			return
 		self.get_race_time_class()( result=self, race_time=DurationField.formatted_timedelta(seconds=rt), lap_kmh=lk ).save()
 		
 	def add_lap_time( self, lt, lk=0.0 ):
+		if self.is_packed:
+			race_times = self.get_packed_race_times()
+			self.add_race_time( (race_times[-1] if race_times else 0.0) + lt, lk )
+			return
 		rt = self.get_race_query().order_by('-race_time').first()
 		rt_last = rt.race_time if rt else 0.0
 		self.add_race_time( rt_last + lt, lk )
 	
 	def delete_race_times( self ):
+		if self.is_packed:
+			self.race_times_packed = self.lap_kmh_packed = None
+			if self.pk:
+				self.save( update_fields=['race_times_packed', 'lap_kmh_packed'] )
 		self.get_race_time_query().delete()
 		
 	def get_race_times( self ):
+		if self.is_packed:
+			return self.get_packed_race_times()
 		return [ rt.total_seconds() for rt in self.get_race_time_query().values_list('race_time',flat=True) ]
 		
 	def get_num_laps( self ):
+		if self.is_packed:
+			return len(self.race_times_packed) // 8 - 1
 		return self.get_race_time_query().count() - 1
 	
 	def get_num_laps_fast( self ):
@@ -3003,6 +3281,9 @@ class Result(models.Model):
 			return self._num_laps
 	
 	def get_lap_kmh( self ):
+		if self.is_packed:
+			lap_kmh = self.get_packed_lap_kmh()[1:]
+			return lap_kmh if all( lap_kmh ) else []
 		lap_kmh = []
 		for lk in self.get_race_time_query().values_list('lap_kmh',flat=True)[1:]:
 			if not lk:
@@ -3011,6 +3292,11 @@ class Result(models.Model):
 		return lap_kmh
 		
 	def get_lap_km( self ):
+		if self.is_packed:
+			race_times, lap_kmh = self.get_packed_race_times(), self.get_packed_lap_kmh()
+			if not all( lap_kmh[1:] ):
+				return []
+			return [lk * (t_cur - t_last)/(60.0*60.0) for t_last, t_cur, lk in zip(race_times, race_times[1:], lap_kmh[1:])]
 		lap_km = []
 		t_last = None
 		for rt in self.get_race_time_query():
@@ -3025,22 +3311,17 @@ class Result(models.Model):
 		return lap_km
 	
 	def get_info_by_lap( self ):
-		race_times = []
-		lap_kmh = []
-		lap_km = []
-		t_last = None
-		for rt in self.get_race_time_query():
-			t_cur = rt.race_time.total_seconds()
-			race_times.append( t_cur )
-			if t_last is None:
-				t_last = t_cur
-				continue
-			lap_kmh.append( rt.lap_kmh or 0.0 )
-			lap_km.append( lap_kmh[-1] * (t_cur - t_last)/(60.0*60.0) )
-				
-		return {'race_times':race_times, 'lap_kmh':lap_kmh if any(lap_kmh) else None, 'lap_km':lap_km if any(lap_km) else None}
+		if self.is_packed:
+			return get_info_by_lap( zip(self.get_packed_race_times(), self.get_packed_lap_kmh()) )
+		return get_info_by_lap( (rt.race_time.total_seconds(), rt.lap_kmh) for rt in self.get_race_time_query() )
 	
 	def get_race_time( self, lap ):
+		if self.is_packed:
+			return self.get_race_time_class()(
+				result=self,
+				race_time=DurationField.formatted_timedelta(seconds=self.get_packed_race_times()[lap]),
+				lap_kmh=self.get_packed_lap_kmh()[lap],
+			)
 		return self.get_race_time_query()[lap]
 	
 	def get_lap_times( self ):
@@ -3048,6 +3329,9 @@ class Result(models.Model):
 		return tuple( b - a for b, a in zip(race_times[1:], race_times) )
 	
 	def get_lap_time( self, lap ):
+		if self.is_packed:
+			race_times = self.get_packed_race_times()
+			return race_times[lap] - race_times[lap-1]
 		race_times = list( self.get_race_time_query()[lap-1:lap] )
 		return race_times[1] - race_times[0]
 	
@@ -3083,6 +3367,59 @@ class ResultTT(Result):
 
 #---------------------------------------------------------------
 
+def get_info_by_lap( race_times_lap_kmh ):
+	# race_times_lap_kmh is a sequence of (race_time seconds, lap_kmh) in race_time order.
+	race_times = []
+	lap_kmh = []
+	lap_km = []
+	t_last = None
+	for t_cur, lk in race_times_lap_kmh:
+		race_times.append( t_cur )
+		if t_last is None:
+			t_last = t_cur
+			continue
+		lap_kmh.append( lk or 0.0 )
+		lap_km.append( lap_kmh[-1] * (t_cur - t_last)/(60.0*60.0) )
+			
+	return {'race_times':race_times, 'lap_kmh':lap_kmh if any(lap_kmh) else None, 'lap_km':lap_km if any(lap_km) else None}
+
+def get_info_by_lap_for_results( results ):
+	# Returns the same as [rr.get_info_by_lap() for rr in results] with one RaceTime query for each Result class.
+	race_times_lap_kmh = defaultdict( list )
+	results_by_class = defaultdict( list )
+	for rr in results:
+		if rr.pk is not None and not rr.is_packed:
+			results_by_class[rr.get_race_time_class()].append( rr )
+	
+	for RTC, rrs in results_by_class.items():
+		result_pks = set( rr.pk for rr in rrs )
+		if len(result_pks) <= 900:
+			race_time_query = RTC.objects.filter( result_id__in=result_pks )
+		else:
+			# Avoid exceeding the database's query parameter limit.  Select by event and skip the extras.
+			race_time_query = RTC.objects.filter( result__event_id__in=set(rr.event_id for rr in rrs) )
+		for result_id, race_time, lap_kmh in race_time_query.order_by('result_id', 'race_time').values_list('result_id', 'race_time', 'lap_kmh'):
+			if result_id in result_pks:
+				race_times_lap_kmh[(RTC, result_id)].append( (race_time.total_seconds(), lap_kmh) )
+	
+	return [
+		rr.get_info_by_lap() if rr.is_packed else get_info_by_lap( race_times_lap_kmh.get((rr.get_race_time_class(), rr.pk), []) )
+			for rr in results
+	]
+
+def pack_floats( values ):
+	a = array.array( 'd', values )
+	if sys.byteorder != 'little':
+		a.byteswap()
+	return a.tobytes()
+
+def unpack_floats( b ):
+	a = array.array( 'd' )
+	a.frombytes( b )
+	if sys.byteorder != 'little':
+		a.byteswap()
+	return a.tolist()
+
 class RaceTime(models.Model):
 	race_time = DurationField.DurationField( verbose_name=_('Race Time') )
 	lap_kmh = models.FloatField( blank=True, default=0.0, verbose_name=_('Lap km/h') )
@@ -3164,7 +3501,7 @@ class CustomCategory( Sequence ):
 		q = Q()
 		self.validate()
 		if self.range_str:
-			q &= get_bib_query( get_numbers(self.range_str) )
+			q &= get_bib_ranges( self.range_str ).query
 		if self.gender != 2:
 			q &= Q(license_holder__gender=self.gender)
 		if self.competitive_age_minimum:
@@ -3316,6 +3653,7 @@ class TeamHint(models.Model):
 	@staticmethod
 	def set_all_disciplines( license_holder, team ):
 		TeamHint.objects.filter(license_holder=license_holder, team=team).delete()
+		RegistrationProfile.invalidate( [license_holder] )
 		effective_date = timezone.localtime(timezone.now()).date()
 		TeamHint.objects.bulk_create( 
 			[TeamHint(license_holder=license_holder, discipline=discipline, team=team, effective_date=effective_date)
@@ -3359,6 +3697,7 @@ def update_team_hints():
 	
 	# Update the TeamHints with the latest team information by discipline.
 	TeamHint.objects.all().delete()
+	RegistrationProfile.objects.all().delete()
 	with BulkSave() as b:
 		for (license_holder, discipline), (effective_date, team) in most_recent.items():
 			th = TeamHint()
@@ -3402,6 +3741,7 @@ def update_category_hints():
 	
 	# Update the CategoryHints with the latest category information by discipline.
 	CategoryHint.objects.all().delete()
+	RegistrationProfile.objects.all().delete()
 	with BulkSave() as b:
 		for (license_holder, category_format, discipline), (effective_date, category) in most_recent.items():
 			ch = CategoryHint()
@@ -3441,71 +3781,189 @@ class FormatTimeDelta( datetime.timedelta ):
 		return u'{}'.format( self.__repr__() )
 
 class ParticipantDefaultValues( object ):
-	def __init__( self, competition ):
-		self.competition = competition
-		self.category_format = self.competition.category_format
+	def __init__( self, category_format_id ):
+		self.category_format_id = category_format_id
 		self.category_init_date = datetime.date(1920,1,1)
-		self.category = None
+		self.category_id = None
 		self.team_init_date = datetime.date(1920,1,1)
-		self.team = None
+		self.team_id = None
 		self.role_init_date = datetime.date(1920,1,1)
 		self.role = None
-		self.est_kmh_init_date = datetime.date(1920,1,1)
 		self.est_kmh = None
 		
 	def done( self ):
-		return self.team and self.role and self.category
+		return self.team_id and self.role and self.category_id
 		
-	def update_participant( self, pp ):
-		if not pp:
-			return
-			
-		if not self.est_kmh and pp.est_kmh:
-			self.est_kmh = pp.est_kmh
+	def update_participant( self, start_date, category_format_id, category_id, team_id, role, est_kmh ):
+		if not self.est_kmh and est_kmh:
+			self.est_kmh = est_kmh
 		
-		if pp.competition.start_date > self.category_init_date and pp.category and pp.competition.category_format == self.competition.category_format:
-			self.category = pp.category
-			self.category_init_date = pp.competition.start_date
+		if start_date > self.category_init_date and category_id and category_format_id == self.category_format_id:
+			self.category_id = category_id
+			self.category_init_date = start_date
 		
-		if pp.competition.start_date > self.team_init_date:
-			self.team = pp.team
-			self.team_init_date = pp.competition.start_date
+		if start_date > self.team_init_date:
+			self.team_id = team_id
+			self.team_init_date = start_date
 		
-		if pp.competition.start_date > self.role_init_date:
-			self.role = pp.role
-			self.role_init_date = pp.competition.start_date
+		if start_date > self.role_init_date:
+			self.role = role
+			self.role_init_date = start_date
 		
 		return self.done()
 
-	def update_team_hint( self, th ):
-		if th and th.effective_date > self.team_init_date:
-			self.team = th.team
-			self.team_init_date = th.effective_date
+	def update_team_hint( self, team_id, effective_date ):
+		if effective_date > self.team_init_date:
+			self.team_id = team_id
+			self.team_init_date = effective_date
 		return self.done()
 			
-	def update_category_hint( self, ch ):
-		if ch and ch.category.format == self.category_format and ch.effective_date > self.category_init_date:
-			self.category = ch.category
-			self.category_init_date = ch.effective_date
+	def update_category_hint( self, category_id, category_format_id, effective_date ):
+		if category_format_id == self.category_format_id and effective_date > self.category_init_date:
+			self.category_id = category_id
+			self.category_init_date = effective_date
 		return self.done()
-		
-	def update_results_avg_kmh( self, license_holder ):
-		ave_kmh = sorted( ResultTT.objects.filter(
-			status=Result.cFinisher,
-			participant__license_holder=license_holder,
-			event__competition__discipline=self.competition.discipline,
-			ave_kmh__isnull=False,
-			).exclude( ave_kmh__lte=0.0,
-			).order_by('-event__date_time',
-			)[:3].values_list( 'ave_kmh', flat=True )
+	
+	@staticmethod
+	def get_avg_kmh( ave_kmh ):
+		# Median of the most recent time trial speeds.
+		if not ave_kmh:
+			return None
+		ave_kmh = sorted( ave_kmh )
+		lak = len(ave_kmh)
+		if lak & 1:
+			return ave_kmh[lak//2]
+		m = lak // 2
+		return (ave_kmh[m-1] + ave_kmh[m]) / 2.0
+
+#---------------------------------------------------------------
+# Registration defaults for a license holder by discipline and category format.
+# Built from past participants, TeamHints, CategoryHints and time trial results so init_default_values only needs one read.
+# Profiles are deleted when their sources change and rebuilt when next needed (or by the build_registration_profiles command).
+#
+class RegistrationProfile( models.Model ):
+	license_holder = models.ForeignKey( 'LicenseHolder', on_delete=models.CASCADE )
+	discipline = models.ForeignKey( 'Discipline', on_delete=models.CASCADE )
+	category_format = models.ForeignKey( 'CategoryFormat', on_delete=models.CASCADE )
+	
+	team = models.ForeignKey( 'Team', null=True, on_delete=models.CASCADE )
+	category = models.ForeignKey( 'Category', null=True, on_delete=models.CASCADE )
+	role = models.PositiveSmallIntegerField( null=True )
+	est_kmh = models.FloatField( default=0.0 )
+	est_kmh_tt = models.FloatField( null=True )		# Used if the Competition has time trials.
+	
+	@classmethod
+	def build( cls, keys ):
+		# keys is [(license_holder_id, discipline_id, category_format_id)].  Returns unsaved profiles in key order.
+		license_holder_ids = sorted( set(k[0] for k in keys) )
+		discipline_ids = sorted( set(k[1] for k in keys) )
+		
+		team_hints, category_hints, participants, ave_kmh = {}, {}, defaultdict(list), defaultdict(list)
+		for i in range(0, len(license_holder_ids), 500):
+			ids = license_holder_ids[i:i+500]
+			for license_holder, discipline, team, effective_date in TeamHint.objects.filter(
+					license_holder__in=ids, discipline__in=discipline_ids).order_by('-effective_date').values_list(
+					'license_holder', 'discipline', 'team', 'effective_date'):
+				team_hints.setdefault( (license_holder, discipline), (team, effective_date) )
+			
+			for license_holder, discipline, category, category_format, effective_date in CategoryHint.objects.filter(
+					license_holder__in=ids, discipline__in=discipline_ids).order_by('-effective_date').values_list(
+					'license_holder', 'discipline', 'category', 'category__format', 'effective_date'):
+				category_hints.setdefault( (license_holder, discipline, category_format), (category, category_format, effective_date) )
+			
+			for license_holder, discipline, start_date, category_format, category, team, role, est_kmh in Participant.objects.filter(
+					license_holder__in=ids, competition__discipline__in=discipline_ids, category__isnull=False).order_by(
+					'-competition__start_date', 'category__sequence', 'pk').values_list(
+					'license_holder', 'competition__discipline', 'competition__start_date', 'competition__category_format',
+					'category', 'team', 'role', 'est_kmh'):
+				participants[(license_holder, discipline)].append( (start_date, category_format, category, team, role, est_kmh) )
+			
+			for license_holder, discipline, kmh in ResultTT.objects.filter(
+					status=Result.cFinisher, participant__license_holder__in=ids, event__competition__discipline__in=discipline_ids,
+					ave_kmh__isnull=False).exclude(ave_kmh__lte=0.0).order_by('-event__date_time', 'pk').values_list(
+					'participant__license_holder', 'event__competition__discipline', 'ave_kmh'):
+				if len(ave_kmh[(license_holder, discipline)]) < 3:
+					ave_kmh[(license_holder, discipline)].append( kmh )
+		
+		profiles = []
+		for license_holder, discipline, category_format in keys:
+			pdv = ParticipantDefaultValues( category_format )
+			
+			# Unconditionally get the team based on the hint.
+			if (license_holder, discipline) in team_hints:
+				pdv.update_team_hint( *team_hints[(license_holder, discipline)] )
+			
+			# Initialize from past participants of the same discipline and category_format,
+			# then relax the category format, then the role.
+			pps = participants.get( (license_holder, discipline), [] )
+			for is_match in (
+					lambda pp: pp[1] == category_format and pp[4] == Participant.Competitor,
+					lambda pp: pp[4] == Participant.Competitor,
+					lambda pp: True ):
+				if pdv.done():
+					break
+				for pp in [pp for pp in pps if is_match(pp)][:8]:
+					if pdv.update_participant( *pp ):
+						break
+			
+			if not pdv.category_id and pdv.role == Participant.Competitor and (license_holder, discipline, category_format) in category_hints:
+				pdv.update_category_hint( *category_hints[(license_holder, discipline, category_format)] )
+			
+			profiles.append( cls(
+				license_holder_id=license_holder, discipline_id=discipline, category_format_id=category_format,
+				team_id=pdv.team_id, category_id=pdv.category_id, role=pdv.role, est_kmh=pdv.est_kmh or 0.0,
+				est_kmh_tt=ParticipantDefaultValues.get_avg_kmh( ave_kmh.get((license_holder, discipline)) ),
+			) )
+		return profiles
+	
+	@classmethod
+	def get_profile( cls, license_holder_id, discipline_id, category_format_id ):
+		profile = cls.objects.filter(
+			license_holder_id=license_holder_id, discipline_id=discipline_id, category_format_id=category_format_id
+		).select_related('team', 'category').first()
+		if profile is None:
+			profile = cls.build( [(license_holder_id, discipline_id, category_format_id)] )[0]
+			try:
+				with transaction.atomic():
+					profile.save()
+			except IntegrityError:
+				pass		# Built by another request.
+		return profile
+	
+	@classmethod
+	def build_missing( cls, keys, chunk_size=500 ):
+		# Returns the number of profiles created.
+		keys = sorted( set(keys) )
+		created = 0
+		for i in range(0, len(keys), chunk_size):
+			chunk = keys[i:i+chunk_size]
+			existing = set( cls.objects.filter( license_holder__in=set(k[0] for k in chunk) ).values_list(
+				'license_holder', 'discipline', 'category_format') )
+			missing = [k for k in chunk if k not in existing]
+			if missing:
+				cls.objects.bulk_create( cls.build(missing), ignore_conflicts=True )
+				created += len(missing)
+		return created
+	
+	@classmethod
+	def invalidate( cls, license_holders ):
+		# license_holders is a list or query of LicenseHolders or ids.
+		if isinstance(license_holders, models.QuerySet):
+			cls.objects.filter( license_holder__in=license_holders ).delete()
+			return
+		license_holders = list( license_holders )
+		for i in range(0, len(license_holders), 500):
+			cls.objects.filter( license_holder__in=license_holders[i:i+500] ).delete()
+	
+	def __str__( self ):
+		return u'{}, {}, {}'.format( self.license_holder_id, self.discipline_id, self.category_format_id )
+	
+	class Meta:
+		unique_together = (
+			('license_holder', 'discipline', 'category_format'),
 		)
-		if ave_kmh:
-			lak = len(ave_kmh)
-			if lak & 1:
-				self.est_kmh = ave_kmh[lak//2]
-			else:
-				m = lak // 2
-				self.est_kmh = (ave_kmh[m-1] + ave_kmh[m]) / 2.0
+		verbose_name = _('RegistrationProfile')
+		verbose_name_plural = _('RegistrationProfiles')
 		
 class ParticipantManager(models.Manager):
 	def get_queryset( self ):
@@ -3673,6 +4131,19 @@ class Participant(models.Model):
 	def category_name( self ):
 		return self.category.code_gender if self.category else u''
 	
+	# Fields shown on the Hub pages.  Saves that do not change them do not bump the ResultsVersion.
+	HubFields = ('competition', 'license_holder', 'team', 'bib', 'category', 'role')
+	
+	def get_hub_values( self ):
+		return tuple( getattr(self, self._meta.get_field(f).attname) for f in self.HubFields )
+	
+	@classmethod
+	def from_db( cls, db, field_names, values ):
+		instance = super(Participant, cls).from_db( db, field_names, values )
+		if all( cls._meta.get_field(f).attname in instance.__dict__ for f in cls.HubFields ):
+			instance._hub_values = instance.get_hub_values()
+		return instance
+	
 	def save( self, *args, **kwargs ):
 		license_holder_update = kwargs.pop('license_holder_update', True)
 		number_set_update = kwargs.pop('number_set_update', True)
@@ -3907,62 +4378,17 @@ class Participant(models.Model):
 		return [w for w in waves if w.get_participant_count() > w.max_participants]
 	
 	def init_default_values( self ):
-		pdv = ParticipantDefaultValues( self.competition )
-	
-		self.role = 0
+		competition = self.competition
+		profile = RegistrationProfile.get_profile( self.license_holder_id, competition.discipline_id, competition.category_format_id )
 		
-		# Unconditionally get the team based on the hint.
-		if (pdv.role or 0) < 200:
-			pdv.update_team_hint( TeamHint.objects.filter(license_holder=self.license_holder, discipline=self.competition.discipline).order_by(
-				'-effective_date').first()
-			)
-		
-		# Initialize from past participants of the same discipline and category_format.
-		for pp in Participant.objects.filter(
-					license_holder=self.license_holder,
-					competition__discipline=self.competition.discipline,
-					competition__category_format=self.competition.category_format,
-					role=Participant.Competitor,
-				).exclude(category__isnull=True).defer('signature').select_related('competition').order_by(
-					'-competition__start_date','category__sequence')[:8]:
-			if pdv.update_participant( pp ):
-				break
-
-		# Initialize from past participants of the same discipline (relax category format).
-		if not pdv.done():
-			for pp in Participant.objects.filter(
-						license_holder=self.license_holder,
-						competition__discipline=self.competition.discipline,
-						role=Participant.Competitor,
-					).exclude(category__isnull=True).defer('signature').select_related('competition').order_by(
-						'-competition__start_date','category__sequence')[:8]:
-				if pdv.update_participant( pp ):
-					break			
-				
-		# Initialize from past participants of any discipline, category format or role.
-		if not pdv.done():
-			for pp in Participant.objects.filter(
-						license_holder=self.license_holder,
-						competition__discipline=self.competition.discipline,
-					).exclude(category__isnull=True).select_related('competition').order_by(
-						'-competition__start_date','category__sequence')[:8]:
-				if pdv.update_participant( pp ):
-					break			
-		
-		if not pdv.category and pdv.role == self.Competitor:
-			pdv.update_category_hint( CategoryHint.objects.filter(
-				license_holder=self.license_holder, discipline=self.competition.discipline, category__format=self.competition.category_format
-				).order_by('-effective_date').first()
-			)
+		self.category	= profile.category
+		self.team		= profile.team
+		self.role		= profile.role or self.Competitor
+		self.est_kmh	= profile.est_kmh or 0.0
 		
 		# If there are time trial events, initialize from past time trials results.
-		if EventTT.objects.filter( competition=self.competition ).exists():
-			pdv.update_results_avg_kmh( self.license_holder )
-		
-		self.category	= pdv.category
-		self.team		= pdv.team
-		self.role		= pdv.role or self.Competitor
-		self.est_kmh	= pdv.est_kmh or 0.0
+		if profile.est_kmh_tt is not None and EventTT.objects.filter( competition=competition ).exists():
+			self.est_kmh = profile.est_kmh_tt
 		
 		# If we have a category, check the bib number.
 		if self.category:
@@ -4013,6 +4439,8 @@ class Participant(models.Model):
 	def good_eligible( self ):		return not self.is_competitor or self.license_holder.is_eligible
 	
 	def can_start( self ):
+		if hasattr(self, 'db_can_start'):		# Computed by annotate_can_start.
+			return self.db_can_start
 		return (
 			self.good_eligible() and
 			self.good_waiver() and
@@ -4024,22 +4452,186 @@ class Participant(models.Model):
 			self.good_signature()
 		)
 		
+	#-----------------------------------------------------------------------
+	# Queries matching the good_* checks, is_done and has_any_events above.
+	# They let Participant lists be filtered in the database instead of object-by-object.
+	#
+	QTrue = Q(pk__isnull=False)
+	QFalse = Q(pk__in=[])
+	
 	@classmethod
-	def get_can_start_query( cls, competition ):
-		q_ineligible = Q(license_holder__eligible=False) & (Q(license_holder__ineligible_on_date_time__isnull=True) | Q(license_holder__ineligible_on_date_time__ge=timezone.now()))
-		q = Q(
-			role=Participant.Competitor,
-			bib__isnull=False,
-			category__isnull=False,
-			paid=True,
-		) & ~q_ineligible
-		
-		if competition.using_tags:
-			q &= Q( tag__isnull=False )
-		if competition.show_signature:
-			q &= ~Q( signature='' )
+	def get_event_queries( cls, competition ):
+		# Returns [(event, category ids, Q of the Participants entered in the event)] (see Event.is_participating).
+		event_categories = defaultdict( set )
+		for event_type, WaveClass in enumerate((Wave, WaveTT)):
+			for event_id, category_id in WaveClass.categories.through.objects.filter(
+					**{WaveClass.__name__.lower() + '__event__competition':competition}
+				).values_list( WaveClass.__name__.lower() + '__event', 'category' ):
+				event_categories[(event_type, event_id)].add( category_id )
+		
+		event_queries = []
+		for events in (competition.eventmassstart_set.all(), competition.eventtt_set.all()):
+			for event in events:
+				categories = event_categories.get( (event.event_type, event.pk) )
+				if not categories:
+					continue
+				q = Q( category__in=categories )
+				if event.option_id:
+					q &= Q( pk__in=ParticipantOption.objects.filter(competition=competition, option_id=event.option_id).values('participant') )
+				event_queries.append( (event, categories, q) )
+		return event_queries
+	
+	@classmethod
+	def get_has_any_events_query( cls, competition, event_queries=None ):
+		if event_queries is None:
+			event_queries = cls.get_event_queries( competition )
+		q = cls.QFalse
+		for event, categories, q_event in event_queries:
+			q |= q_event if event.optional else Q( category__in=categories )
 		return q
+	
+	@classmethod
+	def get_has_tt_events_query( cls, competition, event_queries=None ):
+		if event_queries is None:
+			event_queries = cls.get_event_queries( competition )
+		q = cls.QFalse
+		for event, categories, q_event in event_queries:
+			if event.event_type == 1:
+				q |= q_event
+		return q
+	
+	@classmethod
+	def get_check_queries( cls, competition, event_queries=None ):
+		# Returns {check: Q} for the good_* checks (except good_uci_code).
+		q_competitor = Q( role=cls.Competitor )
 		
+		legal_entity = competition.legal_entity
+		if not legal_entity or legal_entity.waiver_expiry_date == datetime.date(1970,1,1):
+			q_waiver = cls.QTrue
+		else:
+			q_waiver = Q( license_holder__in=Waiver.objects.filter(
+				legal_entity=legal_entity, date_signed__gte=legal_entity.waiver_expiry_date).values('license_holder') )
+		
+		if not competition.report_label_license_check:
+			q_license_check = cls.QTrue
+		else:
+			# Checked in this Competition, or in another in the same year, or recorded in LicenseCheckState.
+			year_start = datetime.date(competition.start_date.year, 1, 1)
+			q_license_check = (
+				Q( license_checked=True ) |
+				~Q( category__in=CompetitionCategoryOption.objects.filter(
+					competition=competition, license_check_required=True).values('category') ) |
+				Q( pk__in=Participant.objects.filter(
+					competition=competition,
+					license_holder__participant__category=F('category'),
+					license_holder__participant__license_checked=True,
+					license_holder__participant__competition__discipline=competition.discipline_id,
+					license_holder__participant__competition__start_date__range=(year_start, competition.start_date),
+					license_holder__participant__competition__report_label_license_check=competition.report_label_license_check,
+				).values('pk') ) |
+				Q( pk__in=Participant.objects.filter(
+					competition=competition,
+					license_holder__licensecheckstate__category=F('category'),
+					license_holder__licensecheckstate__discipline=competition.discipline_id,
+					license_holder__licensecheckstate__report_label_license_check=competition.report_label_license_check,
+					license_holder__licensecheckstate__check_date__range=(year_start, competition.start_date),
+				).values('pk') )
+			)
+		
+		if not competition.using_tags:
+			q_tag = cls.QTrue
+		else:
+			tag_field = 'license_holder__existing_tag' if competition.use_existing_tags else 'tag'
+			q_tag = Q( **{tag_field + '__isnull':False} ) & ~Q( **{tag_field:''} )
+			if competition.do_tag_validation:
+				q_tag &= Q( tag_checked=True )
+			q_tag = ~q_competitor | q_tag
+		
+		return {
+			'good_license':				~Q(license_holder__license_code__regex=r'^(TEMP|_)'),	# Case sensitive, unlike startswith on SQLite.
+			'good_emergency_contact':	~Q(license_holder__emergency_contact_name='') & ~Q(license_holder__emergency_contact_phone=''),
+			'good_bib':					q_competitor & Q(bib__isnull=False) & ~Q(bib=0),
+			'good_category':			q_competitor & Q(category__isnull=False),
+			'good_license_check':		q_license_check,
+			'good_tag':					q_tag,
+			'good_team':				q_competitor & Q(team__isnull=False),
+			'good_paid':				q_competitor & Q(paid=True),
+			'good_signature':			~Q(signature='') if competition.show_signature else cls.QTrue,
+			'good_est_kmh':				~Q(est_kmh=0.0) | ~cls.get_has_tt_events_query(competition, event_queries),
+			'good_waiver':				q_waiver,
+			'good_eligible':			~q_competitor | Q(license_holder__eligible=True) | Q(license_holder__ineligible_on_date_time__gt=timezone.now()),
+		}
+	
+	CanStartChecks = (
+		('good_eligible',		_('Ineligible to Compete')),
+		('good_waiver',			_('Missing/Expired Insurance Waiver')),
+		('good_paid',			_('Missing Payment')),
+		('good_category',		_('Missing Category')),
+		('good_license_check',	_('Unchecked License')),
+		('good_bib',			_('Missing Bib Number')),
+		('good_tag',			_('Unchecked Tag')),
+		('good_signature',		_('Missing Signature')),
+	)
+	
+	@classmethod
+	def get_can_start_query( cls, competition, check_queries=None ):
+		if check_queries is None:
+			check_queries = cls.get_check_queries( competition )
+		q = cls.QTrue
+		for check, message in cls.CanStartChecks:
+			q &= check_queries[check]
+		return q
+	
+	@classmethod
+	def get_can_start_annotations( cls, competition, check_queries=None ):
+		# Returns {name: boolean expression} for each can_start check (the reasons) and for can_start and is_done.
+		if check_queries is None:
+			check_queries = cls.get_check_queries( competition )
+		def boolean( q ):
+			return Case( When(q, then=Value(True)), default=Value(False), output_field=models.BooleanField() )
+		annotations = { 'db_' + check: boolean(check_queries[check]) for check, message in cls.CanStartChecks }
+		annotations['db_can_start'] = boolean( cls.get_can_start_query(competition, check_queries) )
+		annotations['db_is_done'] = boolean( cls.get_is_done_query(competition, check_queries) )
+		return annotations
+	
+	@classmethod
+	def annotate_can_start( cls, participants, competition, check_queries=None ):
+		# Annotate a Participant query so can_start, is_done and get_can_start_reasons do not need further queries.
+		return participants.annotate( **cls.get_can_start_annotations(competition, check_queries) )
+	
+	@classmethod
+	def set_can_start( cls, participants, competition ):
+		# Same as annotate_can_start for a list of Participants, in one query for the Competition.
+		annotations = cls.get_can_start_annotations( competition )
+		values = { v[0]:v[1:] for v in Participant.objects.filter(competition=competition).order_by().annotate(
+			**annotations).values_list('pk', *annotations.keys()) }
+		for p in participants:
+			if p.pk in values:
+				for name, value in zip(annotations.keys(), values[p.pk]):
+					setattr( p, name, value )
+		return participants
+	
+	def get_can_start_reasons( self ):
+		# Messages for the failed can_start checks.
+		reasons = []
+		for check, message in self.CanStartChecks:
+			ok = getattr(self, 'db_' + check) if hasattr(self, 'db_' + check) else getattr(self, check)()
+			if not ok:
+				reasons.append( message )
+		return reasons
+	
+	@classmethod
+	def get_is_done_query( cls, competition, check_queries=None ):
+		if check_queries is None:
+			check_queries = cls.get_check_queries( competition )
+		q_competitor = Q( role=cls.Competitor )
+		return (
+			(q_competitor & cls.get_can_start_query(competition, check_queries) &
+				check_queries['good_license'] & check_queries['good_emergency_contact'] & check_queries['good_est_kmh']) |
+			(~q_competitor & Q(role__lt=200) & Q(team__isnull=False)) |
+			Q( role__gte=200 )
+		)
+	
 	def can_tt_start( self ):
 		return (
 			self.good_eligible() and
@@ -4060,6 +4652,8 @@ class Participant(models.Model):
 	
 	@property
 	def is_done( self ):
+		if hasattr(self, 'db_is_done'):			# Computed by annotate_can_start.
+			return self.db_is_done
 		if self.is_competitor:
 			return (
 				self.can_start() and
@@ -4312,88 +4906,15 @@ class Participant(models.Model):
 	def get_available_numbers( self ):
 		if not self.category:
 			return [], {}, [], False
-			
-		competition      = self.competition
-		category         = self.category
-		number_set       = competition.number_set
-		category_numbers = competition.get_category_numbers( category )
-		
-		if category_numbers:
-			available_numbers = sorted( category_numbers.get_numbers() )
-			bib_query = category_numbers.get_bib_query()
-			category_numbers_defined = True
-		else:
-			available_numbers = []
-			bib_query = None
-			category_numbers_defined = False
-		
-		allocated_numbers = {}
-		lost_bibs = {}
-		
-		# Find available category numbers.
-		
-		# First, add all numbers allocated to this event (includes pre-reg).
-		if available_numbers:
-			participants = Participant.objects.filter( competition=competition )
-			participants = participants.filter( category__in=category_numbers.categories.all() ).filter( bib_query ).order_by()
-			participants = participants.select_related('license_holder')
-			allocated_numbers = { p.bib: p.license_holder for p in participants }
-		
-		# If there is a NumberSet, add allocated numbers from there.
-		if number_set and available_numbers:
-			# Exclude available numbers not allowed in the number set.
-			range_events = number_set.get_range_events()
-			available_numbers = [bib for bib in available_numbers if number_set.is_bib_valid(bib, range_events)]
-			
-			# Exclude existing bib numbers of all license holders if using existing bibs.
-			# For duplicate license holders, check whether the duplicate has ever raced this category before.
-			# We don't know if the existing license holders will show up.
-			
-			bib_max = number_set.get_bib_max_count_all()
-			bib_available_all = number_set.get_bib_available_all( bib_query )
-			
-			# Get all the bibs of license holders that match the category_numbers of this category.
-			current_bibs = defaultdict( set )
-			nses = number_set.numbersetentry_set.filter( date_lost__isnull=True ).filter( bib_query )
-			nses = nses.select_related('license_holder')
-			for nse in nses:
-				current_bibs[nse.license_holder].add( nse.bib )
-			
-			# Handle the case of only one bib in the number set.
-			for lh, bibs in current_bibs.items():
-				if len(bibs) == 1:
-					bib = next(iter(bibs))
-					if bib_max.get(bib, 0) == 1:
-						allocated_numbers[bib] = lh
-						
-			# Otherwise, scan past participants to check if a license holder in this category owns the bib.
-			pprevious = Participant.objects.filter( competition__number_set=number_set, category__in=category_numbers.categories.all() )
-			pprevious = pprevious.filter( bib_query )
-			pprevious = pprevious.exclude( bib__in=list(allocated_numbers.keys())[:200] )
-			pprevious = pprevious.order_by('-competition__start_date')
-			
-			for p in pprevious.exclude(license_holder=self.license_holder).select_related('license_holder'):
-				if p.bib not in allocated_numbers and p.bib in current_bibs[p.license_holder]:
-					allocated_numbers[p.bib] = p.license_holder
-			
-			nses = number_set.numbersetentry_set.exclude( date_lost__isnull=True ).filter( bib_query )
-			lost_bibs = { bib:date_lost
-				for bib, date_lost in nses.order_by('date_lost').values_list('bib','date_lost')
-					if bib_available_all.get(bib,-1) == 0
-			}
-		else:
-			lost_bibs = {}
-			
-		return available_numbers, allocated_numbers, lost_bibs, category_numbers_defined
-
-	def get_bib_auto( self ):
+		from .bib_index import get_available_numbers		# import this here to avoid a circular dependency.
+		return get_available_numbers( self )
+	
+	def get_bib_auto( self, reserve=True ):
+		# Reserve the bib so other desks do not get it while this participant is saved.
 		if self.bib:
 			return self.bib
-		available_numbers, allocated_numbers, lost_bibs, category_numbers_defined = self.get_available_numbers()
-		for bib in available_numbers:
-			if bib not in allocated_numbers and bib not in lost_bibs:
-				return bib
-		return None
+		from .bib_index import next_free_bib		# import this here to avoid a circular dependency.
+		return next_free_bib( self, reserve )
 	
 	@staticmethod
 	def most_recent():
@@ -4638,7 +5159,8 @@ class EventTT( Event ):
 		return sum( 1 for p in self.get_participants_seeded() if p.start_time is None ) if self.create_seeded_startlist else 0
 	
 	def get_bad_start_count( self ):
-		return sum( wave_tt.get_bad_start_count() for wave_tt in self.wavett_set.all() )
+		check_queries = Participant.get_check_queries( self.competition )
+		return sum( wave_tt.get_bad_start_count(check_queries) for wave_tt in self.wavett_set.all() )
 	
 	def has_unseeded( self ):
 		if not self.create_seeded_startlist:
@@ -4734,7 +5256,7 @@ class WaveTT( WaveBase ):
 	def get_sequence_key( self ):
 		if self.sequence_option == self.series_decreasing and self.series_for_seeding:
 			
-			from .series_results import get_results_for_category		# import this here to avoid a circular dependency.
+			from .series_standings import get_results_for_category		# import this here to avoid a circular dependency.
 
 			licence_holder_series_rank = {}
 			categories_seen = set()
@@ -4887,8 +5409,8 @@ class WaveTT( WaveBase ):
 		)
 		return [p for p in self.get_participants_unsorted() if p.pk not in has_start_time]
 		
-	def get_bad_start_count( self ):
-		return sum( 1 for p in self.get_participants_unsorted() if not p.can_start() )
+	def get_bad_start_count( self, check_queries=None ):
+		return self.get_participants_unsorted().exclude( Participant.get_can_start_query(self.event.competition, check_queries) ).count()
 	
 	def get_sequence_option_str( self ):
 		if self.sequence_option == self.series_decreasing:
@@ -5473,7 +5995,237 @@ class SeriesUpgradeCategory( Sequence ):
 	class Meta( Sequence.Meta ):
 		verbose_name = _("SeriesUpgradeCategory")
 		verbose_name_plural = _("SeriesUpgradeCategories")
+
+#-----------------------------------------------------------------------
+class SeriesStandings( models.Model ):
+	# Materialized Series standings for a category group or a custom category.
+	# Marked stale when results are uploaded or the Series definition changes, then rebuilt in the background.
+	series = models.ForeignKey( Series, db_index=True, on_delete=models.CASCADE )
+	group_key = models.CharField( max_length=40, verbose_name=_('Group Key') )		# Hash of group_name.
+	group_name = models.TextField( default='', verbose_name=_('Group Name') )		# Sorted category pks or CustomPrefix + custom category name.
+
+	version = models.PositiveIntegerField( default=0, verbose_name=_('Version') )
+	is_stale = models.BooleanField( default=True, db_index=True, verbose_name=_('Stale') )
+	standings = models.TextField( default='', blank=True, verbose_name=_('Standings') )
+	updated = models.DateTimeField( auto_now=True, verbose_name=_('Updated') )
+
+	CustomPrefix = u'custom:'
+
+	@staticmethod
+	def get_key( group_name ):
+		return hashlib.sha1( group_name.encode() ).hexdigest()
+
+	@staticmethod
+	def get_group_name( categories ):
+		return u','.join( u'{}'.format(pk) for pk in sorted(c.pk for c in categories) )
+
+	@classmethod
+	def get_custom_group_name( cls, custom_category_name ):
+		return cls.CustomPrefix + custom_category_name
+
+	@property
+	def custom_category_name( self ):
+		return self.group_name[len(self.CustomPrefix):] if self.group_name.startswith(self.CustomPrefix) else None
+
+	@property
+	def category_pks( self ):
+		return [] if self.custom_category_name is not None else [int(pk) for pk in self.group_name.split(u',') if pk]
+
+	@classmethod
+	def invalidate_series( cls, series_ids ):
+		ResultsVersion.bump_series( series_ids )
+		if not cls.objects.filter( series__in=series_ids ).update( is_stale=True, version=F('version')+1 ):
+			return
+		from .series_standings import rebuild_standings_in_background		# import this here to avoid a circular dependency.
+		transaction.on_commit( rebuild_standings_in_background )
+
+	@classmethod
+	def invalidate_event( cls, event ):
+		q = Q(event_mass_start=event) if event.event_type == 0 else Q(event_tt=event)
+		cls.invalidate_series( list(SeriesCompetitionEvent.objects.filter(q).values_list('series', flat=True).distinct()) )
+
+	def __str__( self ):
+		return u'{}: {} v{}{}'.format( self.series.name, self.group_name, self.version, u' (stale)' if self.is_stale else u'' )
+
+	class Meta:
+		unique_together = (
+			('series', 'group_key'),
+		)
+		verbose_name = _("SeriesStandings")
+		verbose_name_plural = _("SeriesStandings")
+
+@receiver( [post_save, post_delete], sender=Series )
+def invalidate_series_standings( sender, **kwargs ):
+	series = kwargs.get('instance', None)
+	if series and series.pk:
+		SeriesStandings.invalidate_series( [series.pk] )
+
+@receiver( [post_save, post_delete], sender=SeriesPointsStructure )
+@receiver( [post_save, post_delete], sender=SeriesCompetitionEvent )
+@receiver( [post_save, post_delete], sender=SeriesIncludeCategory )
+@receiver( [post_save, post_delete], sender=CategoryGroup )
+@receiver( [post_save, post_delete], sender=SeriesUpgradeProgression )
+def invalidate_series_standings_element( sender, **kwargs ):
+	element = kwargs.get('instance', None)
+	if element and element.series_id:
+		SeriesStandings.invalidate_series( [element.series_id] )
+
+@receiver( [post_save, post_delete], sender=CategoryGroupElement )
+def invalidate_series_standings_category_group( sender, **kwargs ):
+	element = kwargs.get('instance', None)
+	if element:
+		SeriesStandings.invalidate_series( list(CategoryGroup.objects.filter(pk=element.category_group_id).values_list('series', flat=True)) )
+
+@receiver( [post_save, post_delete], sender=SeriesUpgradeCategory )
+def invalidate_series_standings_upgrade_progression( sender, **kwargs ):
+	element = kwargs.get('instance', None)
+	if element:
+		SeriesStandings.invalidate_series( list(SeriesUpgradeProgression.objects.filter(pk=element.upgrade_progression_id).values_list('series', flat=True)) )
+
+#-----------------------------------------------------------------------
+# Version counters for the Hub result pages.
+# The Hub uses them for ETags and to key its rendered page cache (see hub.py).
+#
+class ResultsVersion( models.Model ):
+	key = models.CharField( max_length=32, unique=True )
+	version = models.PositiveIntegerField( default=0 )
+	updated = models.DateTimeField( default=timezone.now )
 	
+	@staticmethod
+	def competition_key( competition_id ):
+		return u'competition-{}'.format( competition_id )
+	
+	@staticmethod
+	def event_key( event_type, event_id ):
+		return u'event-{}-{}'.format( event_type, event_id )
+	
+	@staticmethod
+	def series_key( series_id ):
+		return u'series-{}'.format( series_id )
+	
+	@classmethod
+	def get_versions( cls, keys ):
+		# Returns [(key, version, updated)] in key order.
+		def fetch( keys, chunk_size=500 ):
+			for i in range(0, len(keys), chunk_size):
+				versions.update( (rv.key, rv) for rv in cls.objects.filter(key__in=keys[i:i+chunk_size]) )
+		versions = {}
+		fetch( keys )
+		missing = [key for key in keys if key not in versions]
+		if missing:
+			cls.objects.bulk_create( [cls(key=key) for key in missing], ignore_conflicts=True )
+			fetch( missing )
+		return [(key, versions[key].version, versions[key].updated) for key in keys]
+	
+	@classmethod
+	def bump( cls, keys ):
+		# Keys that have never been read do not need a version yet.
+		if keys:
+			cls.objects.filter( key__in=keys ).update( version=F('version')+1, updated=timezone.now() )
+	
+	@classmethod
+	def bump_event( cls, event ):
+		# Also bump the Series that include this Event.
+		q = Q(event_mass_start=event) if event.event_type == 0 else Q(event_tt=event)
+		keys = [cls.event_key(event.event_type, event.pk), cls.competition_key(event.competition_id)]
+		keys.extend( cls.series_key(series_id) for series_id in SeriesCompetitionEvent.objects.filter(q).values_list('series', flat=True).distinct() )
+		cls.bump( keys )
+	
+	@classmethod
+	def bump_competition( cls, competition_id ):
+		# Bump the Competition and all its Events.
+		keys = [cls.competition_key(competition_id)]
+		for event_type, EventClass in enumerate((EventMassStart, EventTT)):
+			keys.extend( cls.event_key(event_type, pk) for pk in EventClass.objects.filter(competition_id=competition_id).values_list('pk', flat=True) )
+		cls.bump( keys )
+	
+	@classmethod
+	def bump_participant( cls, participant ):
+		# Bump the Competition, the Events the Participant has Results in, and the Events without Results
+		# (their pages show the pre-registered Participants).
+		keys = [cls.competition_key(participant.competition_id)]
+		for event_type, (EventClass, ResultClass) in enumerate(((EventMassStart, ResultMassStart), (EventTT, ResultTT))):
+			keys.extend( cls.event_key(event_type, pk) for pk in EventClass.objects.filter( competition_id=participant.competition_id ).filter(
+				Q(pk__in=ResultClass.objects.filter(participant=participant).values('event')) |
+				~Q(pk__in=ResultClass.objects.filter(event__competition_id=participant.competition_id).values('event'))
+			).values_list('pk', flat=True) )
+		cls.bump( keys )
+	
+	@classmethod
+	def bump_series( cls, series_ids ):
+		cls.bump( [cls.series_key(series_id) for series_id in series_ids] )
+	
+	def __str__( self ):
+		return u'{} v{}'.format( self.key, self.version )
+	
+	class Meta:
+		verbose_name = _("ResultsVersion")
+		verbose_name_plural = _("ResultsVersions")
+
+@receiver( [post_save, post_delete], sender=EventMassStart )
+@receiver( [post_save, post_delete], sender=EventTT )
+def bump_results_version_event( sender, **kwargs ):
+	event = kwargs.get('instance', None)
+	if event and event.pk:
+		ResultsVersion.bump_event( event )
+
+@receiver( [post_save, post_delete], sender=Wave )
+@receiver( [post_save, post_delete], sender=WaveTT )
+@receiver( [post_save, post_delete], sender=CustomCategoryMassStart )
+@receiver( [post_save, post_delete], sender=CustomCategoryTT )
+def bump_results_version_event_element( sender, **kwargs ):
+	element = kwargs.get('instance', None)
+	if element:
+		try:
+			event = element.event
+		except ObjectDoesNotExist:
+			return		# The event is being deleted.
+		ResultsVersion.bump_event( event )
+
+@receiver( [post_save, post_delete], sender=Competition )
+def bump_results_version_competition( sender, **kwargs ):
+	instance = kwargs.get('instance', None)
+	if instance:
+		ResultsVersion.bump_competition( instance.pk )
+
+@receiver( post_save, sender=Participant )
+def bump_results_version_participant( sender, **kwargs ):
+	participant = kwargs.get('instance', None)
+	if not participant:
+		return
+	update_fields = kwargs.get('update_fields', None)
+	if update_fields is not None and not any( f in update_fields or f + '_id' in update_fields for f in Participant.HubFields ):
+		return
+	hub_values = participant.get_hub_values()
+	if getattr(participant, '_hub_values', None) != hub_values:
+		participant._hub_values = hub_values
+		ResultsVersion.bump_participant( participant )
+
+@receiver( pre_delete, sender=Participant )
+def bump_results_version_participant_delete( sender, **kwargs ):
+	# Before the delete cascades to the Results.
+	participant = kwargs.get('instance', None)
+	if participant:
+		ResultsVersion.bump_participant( participant )
+
+#-----------------------------------------------------------------------
+# Registration profiles are rebuilt from their sources when next needed.
+# Hint deletes and bulk changes call RegistrationProfile.invalidate directly.
+#
+@receiver( [post_save, post_delete], sender=Participant )
+@receiver( post_save, sender=TeamHint )
+def invalidate_registration_profile( sender, **kwargs ):
+	instance = kwargs.get('instance', None)
+	if instance:
+		RegistrationProfile.invalidate( [instance.license_holder_id] )
+
+@receiver( post_save, sender=Competition )
+def invalidate_registration_profile_competition( sender, **kwargs ):
+	# The discipline, category format or date may have changed.
+	competition = kwargs.get('instance', None)
+	if competition and not kwargs.get('created', False):
+		RegistrationProfile.invalidate( Participant.objects.filter(competition=competition).values('license_holder') )
+
 #-----------------------------------------------------------------------
 #-----------------------------------------------------------------------
 
@@ -5851,12 +6603,18 @@ def fix_nation_code():
 			if lh.uci_code[:3].upper() in uci_country_codes_set:
 				bs.append( lh )
 
+def fix_license_holder_indexes():
+	safe_print( u'fix_license_holder_indexes...' )
+	from .license_holder_index import index_license_holders		# import this here to avoid a circular dependency.
+	index_license_holders()
+
 def models_fix_data():
 	fix_bad_license_codes()
 	fix_nation_code()
 	fix_non_unique_number_set_entries()
 	fix_bad_category_hints()
 	fix_phone_numbers()
+	fix_license_holder_indexes()
 
 
 
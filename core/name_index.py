@@ -0,0 +1,153 @@
+#-----------------------------------------------------------------------
+# In-process fuzzy name index.
+#
+# The license holder searches only find exact substrings, so a misspelled name finds no one.
+# This index keeps the normalized last names of all LicenseHolders in a BK-tree, so the
+# names within a few edits of a misspelling are found without computing the distance to
+# every name.  The first names of the holders with those last names are then compared directly.
+#
+# The index is read in one pass when the server starts (warm) or the first time it is needed,
+# and kept current from the LicenseHolder signals.  Call invalidate() after changing names without save().
+#
+# The lock is only held to build or replace the index and to change it.  Searches do not take it:
+# changes only add tree nodes and add or remove dict entries, which a search sees either before or after.
+#
+import sys
+import threading
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import *
+from . import utils
+from .WriteLog import logException
+from .bk_tree import levenshtein, levenshtein_from, BKTree
+
+MaxWords = 4		# Longer search texts are not split into last and first names.
+
+lock = threading.RLock()
+name_index = None
+
+def normalize_name( name ):
+	return u' '.join( utils.normalizeSearch(name or u'').split() )
+
+def get_max_distance( s ):
+	# Edits allowed for a typed name.  Swapped letters are two edits.
+	return 0 if len(s) <= 2 else 1 if len(s) <= 4 else 2
+
+class NameIndex( object ):
+	def __init__( self ):
+		self.tree = BKTree( levenshtein )
+		self.last_names = defaultdict( dict )	# Key: last name, Data: {license_holder_id: first name}
+		self.holders = {}						# Key: license_holder_id, Data: last name
+		self.max_words = 1						# Most words in a last name.
+		for pk, last_name, first_name in LicenseHolder.objects.values_list('pk', 'last_name', 'first_name').iterator():
+			self.add_holder( pk, last_name, first_name )
+
+	def add_holder( self, pk, last_name, first_name ):
+		self.remove_holder( pk )
+		last_name = normalize_name( last_name )
+		if not last_name:
+			return
+		self.tree.add( last_name )
+		self.max_words = max( self.max_words, last_name.count(u' ') + 1 )
+		self.last_names[last_name][pk] = normalize_name( first_name )
+		self.holders[pk] = last_name
+
+	def remove_holder( self, pk ):
+		# The last name stays in the tree.  It matches no one if it has no holders.
+		last_name = self.holders.pop( pk, None )
+		if last_name is not None:
+			self.last_names[last_name].pop( pk, None )
+
+	def get_name_splits( self, words ):
+		# (last name, first name) for the ways the words could be "last first" or "first last".
+		splits = []
+		if len(words) <= self.max_words:
+			splits.append( (u' '.join(words), u'') )
+		if len(words) <= MaxWords:
+			for i in range(1, len(words)):
+				for last, first in ((words[:i], words[i:]), (words[i:], words[:i])):
+					if len(last) <= self.max_words:
+						splits.append( (u' '.join(last), u' '.join(first)) )
+		return splits
+
+	def search( self, search_text, max_distance=None ):
+		# Returns {license_holder_id: distance} for the holders with names close to search_text.
+		words = normalize_name( search_text ).split()
+		distances = {}
+		for last_name, first_name in self.get_name_splits( words ):
+			max_last = get_max_distance( last_name ) if max_distance is None else max_distance
+			# First names are only compared within the matching last names, so allow one more edit.
+			max_first = min( get_max_distance(first_name) + 1, 2 ) if max_distance is None else max_distance
+			first_distance = levenshtein_from( first_name )
+			for d_last, key in self.tree.search( last_name, max_last ):
+				for pk, first in list( self.last_names.get(key, {}).items() ):
+					if first_name:
+						# Allow the first name to be abbreviated.
+						d_first = min( first_distance(first), first_distance(first[:len(first_name)]) + 1 )
+						if d_first > max_first:
+							continue
+					else:
+						d_first = 0
+					d = d_last + d_first
+					if d < distances.get( pk, d + 1 ):
+						distances[pk] = d
+		return distances
+
+#-----------------------------------------------------------------------
+
+def get_name_index():
+	global name_index
+	index = name_index
+	if index is None:
+		with lock:
+			if name_index is None:
+				name_index = NameIndex()
+			index = name_index
+	return index
+
+def warm_worker():
+	try:
+		get_name_index()
+	except Exception as e:
+		logException( e, sys.exc_info() )
+	finally:
+		connection.close()
+
+def warm():
+	# Build the index in the background so the first search does not wait for it.
+	thread = threading.Thread( target=warm_worker, name='NameIndexWarm' )
+	thread.daemon = True
+	thread.start()
+
+def invalidate():
+	global name_index
+	with lock:
+		name_index = None
+
+def get_suggestions( search_text, max_distance=None, limit=10 ):
+	# Returns the LicenseHolders with names close to search_text, closest first.
+	distances = get_name_index().search( search_text, max_distance )
+	pks = sorted( distances.keys(), key=lambda pk: distances[pk] )[:limit]
+	return sorted( LicenseHolder.objects.in_bulk(pks).values(), key=lambda lh: (distances[lh.pk], lh.search_text) )
+
+#-----------------------------------------------------------------------
+# Keep the index current.
+#
+@receiver( post_save, sender=LicenseHolder )
+def update_license_holder( sender, **kwargs ):
+	if name_index is not None:
+		instance = kwargs['instance']
+		with lock:
+			if name_index is not None:
+				name_index.add_holder( instance.pk, instance.last_name, instance.first_name )
+
+@receiver( post_delete, sender=LicenseHolder )
+def delete_license_holder( sender, **kwargs ):
+	if name_index is not None:
+		with lock:
+			if name_index is not None:
+				name_index.remove_holder( kwargs['instance'].pk )
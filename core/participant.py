@@ -19,7 +19,7 @@ from .gs_cmd import gs_cmd
 from .ReadWriteTag import ReadTag, WriteTag
 
 def get_participant( participantId ):
-	participant = get_object_or_404( Participant, pk=participantId )
+	participant = get_object( Participant, participantId )
 	return participant.enforce_tag_constraints()
 
 @autostrip
@@ -90,7 +90,7 @@ class ParticipantSearchForm( Form ):
 def Participants( request, competitionId ):
 	ParticipantsPerPage = 25
 	
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	
 	pfKey = 'participant_filter_{}'.format( competitionId )
 	pageKey = 'participant_filter_page_{}'.format( competitionId )
@@ -167,6 +167,7 @@ def Participants( request, competitionId ):
 			for n in names:
 				q |= Q(license_holder__search_text__contains = n)
 			participants = participants.filter( q ).select_related('team', 'license_holder')
+			participants = Participant.annotate_can_start( participants, competition )
 			participants, paginator = getPaginator( participants )
 			return render( request, 'participant_list.html', locals() )
 	
@@ -201,32 +202,30 @@ def Participants( request, competitionId ):
 	
 	participants = participants.select_related('team', 'license_holder')
 	
-	object_checks = []
-
 	if participant_filter.get('name_text','').strip():
 		name_text = utils.normalizeSearch( participant_filter['name_text'] )
 		names = name_text.split()
 		if names:
+			# Match the names only (search_text also includes the license code, city, etc.).
+			participants = participants.annotate( name_search_text=LicenseHolder.get_name_search_text('license_holder__') )
 			for n in names:
-				participants = participants.filter( license_holder__search_text__contains=n )
-			def name_filter( p ):
-				lh_name = utils.removeDiacritic(p.license_holder.full_name()).lower()
-				return all(n in lh_name for n in names)
-			object_checks.append( name_filter )
+				participants = participants.filter( license_holder__search_text__contains=n, name_search_text__contains=n )
 
-	# Create a search function so we get a closure for the search text in the iterator.
+	# Match the search text against the distinct field values of this competition's license holders.
 	def search_license_holder( search_text, field ):
 		search_fields = utils.normalizeSearch( search_text ).split()
-		if search_fields:
-			object_checks.append( lambda p: utils.matchSearchFields(search_fields, getattr(p.license_holder, field)) )
+		if not search_fields:
+			return Q()
+		values = LicenseHolder.objects.filter( participant__competition=competition ).values_list( field, flat=True ).distinct()
+		return Q( **{'license_holder__{}__in'.format(field): [v for v in values if utils.matchSearchFields(search_fields, v)]} )
 		
 	for field in ('city', 'state_prov', 'nationality'):
 		search_field = field + '_text'
 		if participant_filter.get(search_field,'').strip():
-			search_license_holder(
+			participants = participants.filter( search_license_holder(
 				participant_filter[search_field],
 				field
-			)
+			) )
 	
 	team_search = participant_filter.get('team_text','').strip()
 	if team_search:
@@ -238,14 +237,15 @@ def Participants( request, competitionId ):
 			for t in team_search.split():
 				q &= Q( team__search_text__contains=t )
 			participants = participants.filter( q )
-		
+	
+	event_queries = None
 	if 0 <= int(participant_filter.get('complete',-1) or 0) <= 1:
-		complete = bool(int(participant_filter['complete']))
-		if complete:
-			participants = participants.filter( Participant.get_can_start_query(competition) )
+		event_queries = Participant.get_event_queries( competition )
+		q_is_done = Participant.get_is_done_query( competition, Participant.get_check_queries(competition, event_queries) )
+		if bool(int(participant_filter['complete'])):
+			participants = participants.filter( q_is_done )
 		else:
-			participants = participants.exclude( Participant.get_can_start_query(competition) )
-		object_checks.append( lambda p: bool(p.is_done) == complete )
+			participants = participants.exclude( q_is_done )
 		
 	if competition.using_tags and participant_filter.get('rfid_text',''):
 		rfid = participant_filter.get('rfid_text','').upper()
@@ -259,15 +259,9 @@ def Participants( request, competitionId ):
 	
 	has_events = int(participant_filter.get('has_events',-1))
 	if has_events == 0:
-		participants = participants.filter( role = Participant.Competitor )
-		object_checks.append( lambda p: not p.has_any_events() )
+		participants = participants.filter( role = Participant.Competitor ).exclude( Participant.get_has_any_events_query(competition, event_queries) )
 	elif has_events == 1:
-		object_checks.append( lambda p: p.has_any_events() )
-	
-	if object_checks:
-		failed = [p for p in participants if not all(oc(p) for oc in object_checks)]
-		if failed:
-			participants = participants.exclude( pk__in=[p.pk for p in failed][:800] )
+		participants = participants.filter( Participant.get_has_any_events_query(competition, event_queries) )
 
 	if request.method == 'POST':
 		if 'export-excel-submit' in request.POST:
@@ -280,6 +274,7 @@ def Participants( request, competitionId ):
 		if 'emails-submit' in request.POST:
 			return show_emails( request, participants=participants )
 			
+	participants = Participant.annotate_can_start( participants, competition )
 	participants, paginator = getPaginator( participants )
 	return render( request, 'participant_list.html', locals() )
 
@@ -340,7 +335,7 @@ class BibScanForm( Form ):
 
 @access_validation()
 def ParticipantBibAdd( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	
 	add_by_bib = True
 	if request.method == 'POST':
@@ -366,7 +361,7 @@ def ParticipantBibAdd( request, competitionId ):
 
 @access_validation()
 def ParticipantManualAdd( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	
 	search_text = request.session.get('participant_new_filter', '')
 	btns = [('new-submit', 'New License Holder', 'btn btn-success')]
@@ -383,10 +378,12 @@ def ParticipantManualAdd( request, competitionId ):
 		form = SearchForm( btns, initial = {'search_text': search_text}, hide_cancel_button=True )
 	
 	search_text = utils.normalizeSearch( search_text )
-	q = Q( active = True )
+	q = Q( active = True ) & get_search_query( search_text.split() )
 	for term in search_text.split():
 		q &= Q(search_text__contains = term)
 	license_holders = LicenseHolder.objects.filter(q).order_by('search_text')[:MaxReturn]
+	if search_text and not license_holders:
+		suggestions = get_suggestions( search_text )
 	
 	# Flag which license_holders are already entered in this competition.
 	license_holders_in_competition = set( p.license_holder.id
@@ -397,7 +394,7 @@ def ParticipantManualAdd( request, competitionId ):
 
 @access_validation()
 def ParticipantAddToCompetition( request, competitionId, licenseHolderId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	license_holder = get_object_or_404( LicenseHolder, pk=licenseHolderId )
 	
 	participant = Participant( competition=competition, license_holder=license_holder, preregistered=False ).init_default_values().auto_confirm()
@@ -414,7 +411,7 @@ def ParticipantAddToCompetition( request, competitionId, licenseHolderId ):
 
 @access_validation()
 def ParticipantAddToCompetitionDifferentCategory( request, competitionId, licenseHolderId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	license_holder = get_object_or_404( LicenseHolder, pk=licenseHolderId )
 	
 	participant = Participant.objects.filter( competition=competition, license_holder=license_holder, category__isnull=True ).first()
@@ -917,6 +914,7 @@ def ParticipantTeamSelectDiscipline( request, participantId, teamId ):
 				th.save()
 			else:
 				TeamHint.objects.filter( discipline__id=id, license_holder=participant.license_holder ).delete()
+				RegistrationProfile.invalidate( [participant.license_holder] )
 		return HttpResponseRedirect(getContext(request,'pop2Url'))
 	else:
 		form = TeamDisciplineForm( initial = {'disciplines': [competition.discipline_id]} )
@@ -1598,7 +1596,7 @@ def SetSignatureWithTouchScreen( request, use_touch_screen ):
 
 @access_validation()
 def ParticipantBarcodeAdd( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	
 	add_by_barcode = True
 	if request.method == 'POST':
@@ -1627,12 +1625,12 @@ def ParticipantBarcodeAdd( request, competitionId ):
 '''	
 @access_validation()
 def ParticipantNotFoundError( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	return render( request, 'participant_not_found_error.html', locals() )
 	
 @access_validation()
 def ParticipantMultiFoundError( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	return render( request, 'participant_multi_found_error.html', locals() )
 '''
 	
@@ -1640,7 +1638,7 @@ def ParticipantMultiFoundError( request, competitionId ):
 
 @access_validation()
 def ParticipantRfidAdd( request, competitionId, autoSubmit=False ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	rfid_antenna = int(request.session.get('rfid_antenna', 0))
 	
 	status = True
@@ -1891,7 +1889,7 @@ class ParticipantNotFoundForm( Form ):
 
 @access_validation()
 def ParticipantNotFound( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	has_matches = False
 	matches = []
 	
@@ -1941,7 +1939,7 @@ def ParticipantNotFound( request, competitionId ):
 
 @access_validation()
 def ParticipantLicenseHolderFound( request, competitionId, licenseHolderId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	license_holder = get_object_or_404( LicenseHolder, pk=licenseHolderId )
 	return HttpResponseRedirect( getContext(request,'pop2Url') +
 		'ParticipantAddToCompetition/{}/{}/'.format(competition.id, license_holder.id)
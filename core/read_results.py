@@ -1,9 +1,13 @@
 import pytz
 import re
 import six
+import time
+import bisect
 import datetime
 from collections import defaultdict
 
+from django.db import transaction, connection
+
 from .models import *
 from .DurationField import formatted_timedelta
 
@@ -49,20 +53,74 @@ def get_event_from_payload( payload ):
 	info_append( u'Failure.' )
 	return None, info
 	
+class ParticipantIndex( object ):
+	# In-memory Participant lookups for a results upload.
+	# Each lookup returns the same Participant pk as the equivalent participant_set.filter(...).first() query.
+	
+	def __init__( self, competition, categories ):
+		self.by_license_code = {}
+		self.by_bib = {}
+		self.by_search_text = defaultdict( list )
+		participants = (competition.participant_set
+			.filter( category__in=categories )
+			.order_by( 'license_holder__search_text', 'pk' )
+			.values_list( 'pk', 'category_id', 'bib', 'license_holder__license_code', 'license_holder__search_text' )
+		)
+		for i, (pk, category_id, bib, license_code, search_text) in enumerate(participants):
+			self.by_license_code.setdefault( (license_code, category_id), pk )
+			if bib is not None:
+				self.by_bib.setdefault( (bib, category_id), pk )
+			self.by_search_text[category_id].append( (search_text or u'', i, pk) )
+		for search_texts in self.by_search_text.values():
+			search_texts.sort()
+	
+	def get_by_license_code( self, license_code, category ):
+		return self.by_license_code.get( (u'{}'.format(license_code), category.pk), None )
+	
+	def get_by_bib( self, bib, category ):
+		return self.by_bib.get( (bib, category.pk), None )
+	
+	def get_by_search_text_prefix( self, prefix, category ):
+		# Of all the search_text matches, return the first in participant order.
+		search_texts = self.by_search_text.get( category.pk, [] )
+		best = None
+		for i in range(bisect.bisect_left(search_texts, (prefix,)), len(search_texts)):
+			search_text, order, pk = search_texts[i]
+			if not search_text.startswith(prefix):
+				break
+			if best is None or order < best[0]:
+				best = (order, pk)
+		return best[1] if best else None
+
+def delete_by_pk( model, field, pks, chunk_size=500 ):
+	# Keep the number of query parameters within the database limits.
+	for i in range(0, len(pks), chunk_size):
+		model.objects.filter( **{field + '__in': pks[i:i+chunk_size]} ).delete()
+
+class PhaseTimer( object ):
+	def __init__( self ):
+		self.timings = []
+		self.t_last = time.perf_counter()
+	
+	def __call__( self, phase ):
+		t = time.perf_counter()
+		self.timings.append( [phase, round(t - self.t_last, 4)] )
+		self.t_last = t
+
 def read_results_crossmgr( payload ):
 	warnings = []
 	errors = []
+	phase_timer = PhaseTimer()
 
 	event, info = get_event_from_payload( payload )
+	phase_timer( 'find_event' )
 	if not event:
 		errors.append( u'Cannot find Event "{}", "{}"'.format(payload['raceNameText'], payload['raceScheduledStart']) )
-		return { 'errors': errors, 'warnings': warnings, 'info':info }
+		return { 'errors': errors, 'warnings': warnings, 'info':info, 'timings':phase_timer.timings }
 		
 	competition = event.competition
 	
-	# Remove existing results.
 	Result = event.get_result_class()
-	Result.objects.filter( event=event ).delete()
 	
 	name_to_status_code = { name:code for code,name in Result.STATUS_CODE_NAMES }
 	name_gender_to_category = { (c.code, c.gender):c for c in event.get_categories() }
@@ -135,18 +193,19 @@ def read_results_crossmgr( payload ):
 		except KeyError:
 			pass
 	
-	# Record results by start wave.
-	# To get results by wave, select all category in the wave and order by rank.
-	# To get results by category, select by that category and order by rank.
-	rtcs_cache = defaultdict( list )
-	def flush_cache():
-		for cls, objs in rtcs_cache.items():
-			cls.objects.bulk_create( objs )
-			del objs[:]
+	pack_race_times = SystemInfo.get_pack_race_times()
+	participant_index = ParticipantIndex( competition, set(bib_category.values()) )
+	phase_timer( 'index_participants' )
 	
 	prime_points = {p['winnerBib']:p['points'] for p in payload.get('primes',[]) if p.get('points',None) }
 	prime_time_bonus = {p['winnerBib']:formatted_timedelta(seconds=p['timeBonus']) for p in payload.get('primes',[]) if p.get('timeBonus',None) }
 	
+	# Record results by start wave.
+	# To get results by wave, select all category in the wave and order by rank.
+	# To get results by category, select by that category and order by rank.
+	results = []
+	results_info = []
+	participants_seen = set()
 	for cd in payload['catDetails']:
 		if cd['catType'] != 'Start Wave' or cd['name'] == 'All':
 			continue
@@ -166,22 +225,28 @@ def read_results_crossmgr( payload ):
 				warnings.append( u'Cannot find category for bib={}'.format(bib) )
 				continue
 				
-			participant = None
-			if not participant and d.get('License', ''):
-				participant = competition.participant_set.filter( license_holder__license_code=d['License'], category=category ).first()
-			if not participant:
-				participant = competition.participant_set.filter( bib=bib, category=category ).first()
-			if not participant and d.get('LastName', ''):
-				participant = competition.participant_set.filter(
-					license_holder__search_text__startswith=utils.get_search_text( [n for n in (d.get('LastName',''), d.get('FirstName','')) if n] ),
-					category=category
-				).first()
+			participant_id = None
+			if not participant_id and d.get('License', ''):
+				participant_id = participant_index.get_by_license_code( d['License'], category )
+			if not participant_id:
+				participant_id = participant_index.get_by_bib( bib, category )
+			if not participant_id and d.get('LastName', ''):
+				participant_id = participant_index.get_by_search_text_prefix(
+					utils.get_search_text( [n for n in (d.get('LastName',''), d.get('FirstName','')) if n] ),
+					category
+				)
 			
-			if not participant:
+			if not participant_id:
 				warnings.append( u'Cannot find Participant bib={} name="{}, {}", category="{}"'.format(
 					bib, d.get('LastName',''), d.get('FirstName',''), category.full_name()) )
 				continue
 			
+			if participant_id in participants_seen:
+				warnings.append( u'Cannot Create Result bib={} name="{}, {}", category="{}" ({})'.format(
+					bib, d.get('LastName',''), d.get('FirstName',''), category.full_name(), u'Participant already has a Result') )
+				continue
+			participants_seen.add( participant_id )
+			
 			race_times = d.get('raceTimes',[] )
 			if len(race_times) < 2:
 				race_times = []
@@ -199,7 +264,7 @@ def read_results_crossmgr( payload ):
 			
 			fields = dict(
 				event=event,
-				participant=participant,
+				participant_id=participant_id,
 				status=name_to_status_code.get(d['status'], 'Finisher'),
 				finish_time=formatted_timedelta(seconds=race_times[-1]) if race_times else None,
 				
@@ -223,17 +288,117 @@ def read_results_crossmgr( payload ):
 				fields['ave_kmh'] = ave_kmh
 
 			result = Result( **fields )
-			try:
-				result.save()
-				rtcs = result.set_race_times( race_times, lap_speeds, do_create=False )
-				if rtcs:
-					rtcs_cache[type(rtcs[0])].extend( rtcs )
-					if any( len(objs) >= 999 for objs in rtcs_cache.values() ):
-						flush_cache()
-			except Exception as e:
-				warnings.append( u'Cannot Create Result bib={} name="{}, {}", category="{}" ({})'.format(
-					bib, d.get('LastName',''), d.get('FirstName',''), category.full_name(), e) )
+			if pack_race_times:
+				result.set_race_times( race_times, lap_speeds, do_create=False, do_delete=False, pack=True )
+			results.append( result )
+			results_info.append( (bib, d, category, race_times, lap_speeds) )
+	phase_timer( 'build_results' )
+	
+	RaceTime = event.get_race_time_class()
+	result_fields = [f for f in Result._meta.concrete_fields if not f.primary_key]
+	changes = {
+		'results_created':0, 'results_updated':0, 'results_deleted':0, 'results_unchanged':0,
+		'race_times_created':0, 'race_times_deleted':0,
+	}
+	
+	with transaction.atomic():
+		# Compare the new results to the existing ones.  Only write what has changed.
+		# Keep the first Result of a participant and delete any others (a database loaded without the unique constraint can have them).
+		existing, results_duplicate = {}, []
+		for r in Result.objects.filter(event=event).order_by('pk'):
+			if r.participant_id in existing:
+				results_duplicate.append( r.pk )
+			else:
+				existing[r.participant_id] = r
+		existing_race_times = defaultdict( list )
+		for result_id, race_time, lap_kmh in RaceTime.objects.filter( result__event=event ).values_list( 'result_id', 'race_time', 'lap_kmh' ):
+			existing_race_times[result_id].append( (race_time.total_seconds(), lap_kmh) )
+		for race_times in existing_race_times.values():
+			race_times.sort()
+		phase_timer( 'load_existing' )
+		
+		participant_ids = set( result.participant_id for result in results )
+		results_delete = [r.pk for participant_id, r in existing.items() if participant_id not in participant_ids] + results_duplicate
+		delete_by_pk( RaceTime, 'result_id', results_delete )
+		delete_by_pk( Result, 'pk', results_delete )
+		changes['results_deleted'] = len(results_delete)
+		changes['race_times_deleted'] = sum( len(existing_race_times.get(pk, [])) for pk in results_delete )
+		
+		results_create, results_create_info = [], []
+		results_update, fields_update = [], set()
+		for result, info in zip(results, results_info):
+			r = existing.get( result.participant_id, None )
+			if r is None:
+				results_create.append( result )
+				results_create_info.append( info )
 				continue
+			result.pk = r.pk
+			changed = [f.name for f in result_fields
+				if f.get_db_prep_value(getattr(result, f.attname), connection) != f.get_db_prep_value(getattr(r, f.attname), connection)]
+			if changed:
+				results_update.append( result )
+				fields_update.update( changed )
+			else:
+				changes['results_unchanged'] += 1
+		if results_update:
+			Result.objects.bulk_update( results_update, list(fields_update) )
+		changes['results_updated'] = len(results_update)
+		phase_timer( 'update_results' )
+		
+		try:
+			with transaction.atomic():
+				Result.objects.bulk_create( results_create )
+		except Exception as e:
+			# Fall back to saving one at a time to report the failures.
+			for result, (bib, d, category, race_times, lap_speeds) in zip(results_create, results_create_info):
+				try:
+					with transaction.atomic():
+						result.save()
+				except Exception as e:
+					warnings.append( u'Cannot Create Result bib={} name="{}, {}", category="{}" ({})'.format(
+						bib, d.get('LastName',''), d.get('FirstName',''), category.full_name(), e) )
+		
+		# bulk_create does not set the pks on all databases.  Get them by participant.
+		if results_create:
+			result_pks = dict( Result.objects.filter(event=event).values_list('participant_id', 'pk') )
+			for result in results_create:
+				result.pk = result_pks.get( result.participant_id, None )
+		changes['results_created'] = sum( 1 for result in results_create if result.pk is not None )
+		phase_timer( 'create_results' )
+		
+		# Replace the race times of a result only if they have changed.
+		rtcs, race_times_delete = [], []
+		for result, (bib, d, category, race_times, lap_speeds) in zip(results, results_info):
+			if result.pk is None:
+				continue
+			if pack_race_times:
+				rtcs_result = []	# Packed in the Result.
+			else:
+				rtcs_result = result.set_race_times( race_times, lap_speeds, do_create=False, do_delete=False ) or []
+			rtcs_existing = existing_race_times.get( result.pk, [] )
+			if sorted( (rtc.race_time.total_seconds(), rtc.lap_kmh) for rtc in rtcs_result ) != rtcs_existing:
+				if rtcs_existing:
+					race_times_delete.append( result.pk )
+					changes['race_times_deleted'] += len(rtcs_existing)
+				rtcs.extend( rtcs_result )
+		delete_by_pk( RaceTime, 'result_id', race_times_delete )
+		if rtcs:
+			RaceTime.objects.bulk_create( rtcs )
+		changes['race_times_created'] = len(rtcs)
+		phase_timer( 'update_race_times' )
 
-	flush_cache()		
-	return {'errors': errors, 'warnings': warnings, 'name':u'{}-{}'.format(competition.name, event.name)}
+	if any( v for k, v in changes.items() if k != 'results_unchanged' ):
+		ResultsVersion.bump_event( event )
+		SeriesStandings.invalidate_event( event )
+		if event.event_type == 1:
+			# Time trial speeds are used for the registration defaults.
+			RegistrationProfile.invalidate( Participant.objects.filter(competition=event.competition).values('license_holder') )
+	phase_timer( 'invalidate_series' )
+	
+	return {
+		'errors': errors,
+		'warnings': warnings,
+		'name':u'{}-{}'.format(competition.name, event.name),
+		'changes':changes,
+		'timings':phase_timer.timings,
+	}
@@ -0,0 +1,95 @@
+#-----------------------------------------------------------------------
+# Request-scoped object cache.
+#
+# access_validation, the views and the models look up the same Competition, Participant and
+# SystemInfo several times while handling one request.  RequestCacheMiddleware gives each request
+# a RequestCache (in a thread local) so these are read once.  The number of lookups the cache
+# saved is returned in the X-RaceDB-Lookups-Saved response header.
+#
+# Outside a request (management commands, scripts) there is no cache and every lookup goes to the database.
+#
+import copy
+import threading
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.shortcuts import get_object_or_404
+
+from .models import *
+
+local = threading.local()
+
+class RequestCache( object ):
+	def __init__( self ):
+		self.objects = {}		# Key: (model, pk)
+		self.lookups = 0
+		self.saved = 0
+
+	def get( self, key, get_value ):
+		self.lookups += 1
+		try:
+			value = self.objects[key]
+		except KeyError:
+			value = self.objects[key] = get_value()
+			return value
+		self.saved += 1
+		return value
+
+	def add( self, obj ):
+		self.objects[(obj.__class__, obj.pk)] = obj
+
+	def discard( self, model, pk ):
+		self.objects.pop( (model, pk), None )
+
+def get_request_cache():
+	return getattr( local, 'cache', None )
+
+def get_object( model, pk ):
+	# Like get_object_or_404( model, pk=pk ), once per request.
+	cache = get_request_cache()
+	if cache is None:
+		return get_object_or_404( model, pk=pk )
+	try:
+		pk = int(pk)
+	except (TypeError, ValueError):
+		return get_object_or_404( model, pk=pk )
+	return cache.get( (model, pk), lambda: get_object_or_404(model, pk=pk) )
+
+def get_system_info( get_singleton ):
+	cache = get_request_cache()
+	if cache is None:
+		return get_singleton()
+	# Return a copy, as get_singleton does, so a caller that changes it does not change it for the rest of the request.
+	return copy.copy( cache.get( (SystemInfo, None), get_singleton ) )
+
+class RequestCacheMiddleware( object ):
+	def __init__( self, get_response ):
+		self.get_response = get_response
+
+	def __call__( self, request ):
+		local.cache = cache = RequestCache()
+		try:
+			response = self.get_response( request )
+		finally:
+			local.cache = None
+		response['X-RaceDB-Lookups-Saved'] = '{}'.format( cache.saved )
+		return response
+
+#-----------------------------------------------------------------------
+# Drop objects changed during the request so later lookups read them again.
+#
+@receiver( post_save, sender=Competition )
+@receiver( post_delete, sender=Competition )
+@receiver( post_save, sender=Participant )
+@receiver( post_delete, sender=Participant )
+def update_object( sender, **kwargs ):
+	cache = get_request_cache()
+	if cache is not None:
+		cache.discard( sender, kwargs['instance'].pk )
+
+@receiver( post_save, sender=SystemInfo )
+@receiver( post_delete, sender=SystemInfo )
+def update_system_info( sender, **kwargs ):
+	cache = get_request_cache()
+	if cache is not None:
+		cache.discard( SystemInfo, None )
@@ -1,6 +1,7 @@
 import datetime
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
+from django.db.models import prefetch_related_objects
 
 from .views_common import *
 from .views import license_holders_from_search_text
@@ -37,11 +38,12 @@ def get_payload_for_result( has_results, result_list, cat_name, cat_type, result
 	speed_unit = 'km/h' if competition.distance_unit == 0 else 'mph'
 	distance_unit = 'km' if competition.distance_unit == 0 else 'miles'
 	
-	for rr in result_list:
+	# Get all the related objects and race times with a fixed number of queries.
+	prefetch_related_objects( result_list, 'participant__license_holder', 'participant__team' )
+	for rr, info in zip(result_list, get_info_by_lap_for_results(result_list)):
 		p = rr.participant
 		h = p.license_holder
 		
-		info = rr.get_info_by_lap()
 		race_times, lap_kmh, lap_km = info['race_times'], info['lap_kmh'], info['lap_km']
 		d = {
 			'LastName': h.last_name,
@@ -0,0 +1,85 @@
+#-----------------------------------------------------------------------
+# Trigram index for LicenseHolder.search_text.
+#
+# Searching license holders filters on search_text__contains for each search term, which is a
+# full table scan on every keystroke.  LicenseHolderTrigram holds every three character substring
+# of each search_text.  A term can only be in a search_text that has all of the term's trigrams,
+# so the trigrams narrow the search to a few candidates before the contains test.
+#
+# The index is kept current with the other license holder indexes (see license_holder_index.py).
+# Searches use the original scan while any holder is not indexed.
+#
+import math
+
+from django.db import connection
+from django.db.models import Q, Count, Max
+
+from .models import LicenseHolder, LicenseHolderTrigram
+
+MaxReturn = 500			# Most holders returned by a search (as in views.py).
+RarestTrigrams = 3		# Trigrams to intersect.  The contains test checks the others.
+MinHolders = 20000		# With fewer holders the scan takes a few milliseconds anyway.
+BatchSize = 500			# Keep the query parameters under the SQLite limit.
+
+IndexFields = ('search_text',)
+
+def get_trigrams( text ):
+	return set( text[i:i+3] for i in range(len(text) - 2) )
+
+def get_term_trigrams( term ):
+	# Trigrams that cover the term without overlapping (and the last one).
+	# Fewer trigrams read fewer index entries, and the contains test checks the rest.
+	trigrams = set( term[i:i+3] for i in range(0, len(term) - 2, 3) )
+	if len(term) >= 3:
+		trigrams.add( term[-3:] )
+	return trigrams
+
+def index_license_holder( license_holder ):
+	trigrams = get_trigrams( license_holder.search_text )
+	existing = set( LicenseHolderTrigram.objects.filter(license_holder=license_holder).values_list('trigram', flat=True) )
+	if existing - trigrams:
+		LicenseHolderTrigram.objects.filter( license_holder=license_holder, trigram__in=list(existing - trigrams) ).delete()
+	if trigrams - existing:
+		LicenseHolderTrigram.objects.bulk_create(
+			[LicenseHolderTrigram(license_holder=license_holder, trigram=t) for t in trigrams - existing]
+		)
+
+def index_chunk( license_holders ):
+	pks = [lh.pk for lh in license_holders]
+	for i in range(0, len(pks), BatchSize):
+		LicenseHolderTrigram.objects.filter( license_holder__in=pks[i:i+BatchSize] ).delete()
+	sql = 'INSERT INTO {} (license_holder_id, trigram) VALUES (%s, %s)'.format( LicenseHolderTrigram._meta.db_table )
+	with connection.cursor() as cursor:
+		cursor.executemany( sql, [(lh.pk, t) for lh in license_holders for t in get_trigrams(lh.search_text)] )
+
+def clear():
+	LicenseHolderTrigram.objects.all().delete()
+
+def get_trigram_counts( trigrams, limit ):
+	# Number of holders with each trigram, counting no further than limit.
+	return { t:LicenseHolderTrigram.objects.filter(trigram=t).values('pk')[:limit].count() for t in trigrams }
+
+def get_search_query( terms ):
+	# Returns a Q that limits a LicenseHolder query to the candidates for the search terms.
+	# Returns Q() (no limit) if no term is long enough, if there are few holders, if some holders
+	# are not indexed, or if the terms are so common that the scan finds enough matches sooner.
+	trigrams = set()
+	for term in terms:
+		trigrams |= get_term_trigrams( term )
+	if not trigrams:
+		return Q()
+	holders = LicenseHolder.objects.aggregate( Max('pk') )['pk__max'] or 0
+	if holders < MinHolders or LicenseHolder.objects.filter( indexed=False ).exists():
+		return Q()
+
+	# The scan reads about holders * MaxReturn / matches rows, the index reads the holders with the rarest trigrams.
+	# Use the index when its rarest trigram has fewer than sqrt(holders * MaxReturn) holders.
+	limit = max( int(math.sqrt(holders * MaxReturn)), MaxReturn )
+	counts = get_trigram_counts( trigrams, limit )
+	trigrams = sorted( (t for t in trigrams if counts[t] < limit), key=lambda t: counts[t] )[:RarestTrigrams]
+	if not trigrams:
+		return Q()
+	return Q( pk__in=LicenseHolderTrigram.objects.filter(trigram__in=trigrams)
+		.values('license_holder').annotate(trigram_count=Count('trigram'))
+		.filter(trigram_count=len(trigrams)).values('license_holder')
+	)
@@ -7,6 +7,7 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
 
 from .views_common import *
+from . import series_standings
 
 ItemsPerPage = 25
 def getPaginator( request, page_key, items ):
@@ -156,6 +157,13 @@ def SeriesDelete( request, seriesId, confirmed=0 ):
 	target = getContext(request,'path') + '1/'
 	return render( request, 'are_you_sure.html', locals() )
 
+@access_validation()
+@user_passes_test( lambda u: u.is_superuser )
+def SeriesComputeStandings( request, seriesId ):
+	series = get_object_or_404( Series, pk=seriesId )
+	series_standings.compute_all_standings( series )
+	return HttpResponseRedirect( getContext(request,'cancelUrl') )
+
 #-----------------------------------------------------------------------
 
 class EventSelectForm( Form ):
@@ -0,0 +1,115 @@
+#-----------------------------------------------------------------------------------------------
+# Optional NumPy kernel for ranking series standings.
+#
+# Produces exactly the same ordering, values and gaps as the pure Python code in series_results.
+# The riders x events results are kept as arrays and all the tie-break rules are applied with one lexsort.
+#
+import operator
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Below this number of results the Python sort is just as fast.
+NumPyMinResults = 2000
+
+# The kernel gains least for % Winner / Time, and can be slower than the Python sort there
+# (see series_ranking_benchmark).  Only use it for the Points and Time criteria.
+NumPyRankingCriteria = (0, 1)
+
+def is_available():
+	return np is not None
+
+def use_numpy( series, eventResults ):
+	return is_available() and series.ranking_criteria in NumPyRankingCriteria and len(eventResults) >= NumPyMinResults
+
+def rank_license_holders( series, eventResults, eventSequence, lhResults, lhValue ):
+	'''
+		eventResults:  the EventResults to rank.
+		eventSequence: {event: column}
+		lhResults:     {license_holder: [EventResult or None for each event]} in first-seen order.
+		lhValue:       {license_holder: total value_for_rank of all results}
+
+		Returns (lhOrder, lhValue, lhGap) and sets "ignored" on results beyond best_results_to_consider.
+	'''
+	scoreByTime = (series.ranking_criteria == 1)
+	bestResultsToConsider = series.best_results_to_consider
+	mustHaveCompleted = series.must_have_completed
+	considerMostEventsCompleted = series.consider_most_events_completed
+	numPlacesTieBreaker = series.tie_breaking_rule
+
+	lhs = list( lhResults.keys() )
+	lhIndex = {lh:i for i, lh in enumerate(lhs)}
+	n, numEvents, m = len(lhs), len(eventSequence), len(eventResults)
+
+	# Get the (row, col) coordinates and fields of each result.
+	def get_array( values, dtype ):
+		return np.fromiter( values, dtype=dtype, count=m )
+	rows     = get_array( (lhIndex[lh] for lh in map(operator.attrgetter('license_holder'), eventResults)), np.int64 )
+	cols     = get_array( (eventSequence[e] for e in map(operator.attrgetter('event'), eventResults)), np.int64 )
+	values   = get_array( map(operator.attrgetter('value_for_rank'), eventResults), np.float64 )
+	ranks    = get_array( map(operator.attrgetter('rank'), eventResults), np.int64 )
+	statuses = get_array( map(operator.attrgetter('status'), eventResults), np.int64 )
+
+	valid = np.zeros( (n, numEvents), dtype=bool )
+	valid[rows, cols] = True
+	valueMatrix = np.zeros( (n, numEvents) )
+	valueMatrix[rows, cols] = values
+	statusRank = np.full( (n, numEvents), 9999999, dtype=np.int64 )
+	statusRank[rows, cols] = np.where( statuses == 0, ranks, 999999 )
+
+	# Start from the Python totals so the floating point sums match exactly.
+	value = np.fromiter( (lhValue[lh] for lh in lhs), dtype=np.float64, count=n )
+	eventsCompleted = valid.sum( axis=1 )
+
+	# Remove if minimum events not completed.
+	candidates = np.nonzero( eventsCompleted >= mustHaveCompleted )[0]
+
+	# Place counts include all results, even those ignored below.
+	placeCount = [np.bincount(rows[ranks == k], minlength=n) for k in range(1, numPlacesTieBreaker+1)]
+
+	# Adjust for the best results.
+	if bestResultsToConsider > 0:
+		trim = eventsCompleted > bestResultsToConsider
+		if trim.any():
+			# Order each rider's results from best to worst, ties by event.  Missing results sort last.
+			key = np.where( valid, valueMatrix if scoreByTime else -valueMatrix, np.inf )
+			order = np.argsort( key, axis=1, kind='stable' )
+			for p in range(bestResultsToConsider, numEvents):
+				drop = np.nonzero( trim & (p < eventsCompleted) )[0]
+				if not len(drop):
+					break
+				dropCols = order[drop, p]
+				value[drop] -= valueMatrix[drop, dropCols]
+				for i, j in zip(drop.tolist(), dropCols.tolist()):
+					lhResults[lhs[i]][j].ignored = True
+			eventsCompleted = np.where( trim, bestResultsToConsider, eventsCompleted )
+
+	# lexsort keys, least significant first.
+	# Ties on all else are broken by the status rank of the most recent event, then the one before, etc.
+	keys = [statusRank[:, j] for j in range(numEvents)]
+	keys.extend( -placeCount[k] for k in reversed(range(numPlacesTieBreaker)) )
+	if scoreByTime:
+		keys.append( value )
+		keys.append( -eventsCompleted )
+	else:
+		if considerMostEventsCompleted:
+			keys.append( -eventsCompleted )
+		keys.append( -value )
+	order = candidates[np.lexsort( [k[candidates] for k in keys] )]
+
+	lhOrder = [lhs[i] for i in order.tolist()]
+	lhValueOut = dict( zip(lhs, value.tolist()) )
+
+	lhGap = {}
+	if len(order):
+		leader = order[0]
+		if scoreByTime:
+			gap = (value[order] - value[leader]).tolist()
+			sameCompleted = (eventsCompleted[order] == eventsCompleted[leader]).tolist()
+			lhGap = { lh : g if s else None for lh, g, s in zip(lhOrder, gap, sameCompleted) }
+		else:
+			lhGap = dict( zip(lhOrder, (value[leader] - value[order]).tolist()) )
+
+	return lhOrder, lhValueOut, lhGap
@@ -4,33 +4,20 @@ import operator
 import datetime
 import itertools
 import random
-from copy import deepcopy
 from collections import defaultdict
 from django.utils.safestring import mark_safe
 
 from . import utils
+from . import series_ranking
 from .models import *
 
 ordinal = lambda n: "{}{}".format(n,"tsnrhtdd"[(n//10%10!=1)*(n%10<4)*n%10::4])
 
-class EventResult( object ):
+class EventResultBase( object ):
+	# Properties shared by EventResult and EventResultOverlay.
+
+	__slots__ = ()
 
-	__slots__ = ('status', 'participant', 'license_holder', 'event', 'rank', 'starters', 'value_for_rank', 'category', 'original_category', 'ignored')
-	
-	def __init__( self, result, rank, starters, value_for_rank ):
-		self.status = result.status
-		self.participant = result.participant
-		self.license_holder = result.participant.license_holder
-		self.event = result.event
-		
-		self.rank = rank
-		self.starters = starters
-		
-		self.value_for_rank = value_for_rank
-		self.original_category = self.category = result.participant.category
-		
-		self.ignored = False
-	
 	@property
 	def is_finisher( self ):
 		return self.status == Result.cFinisher
@@ -63,6 +50,60 @@ class EventResult( object ):
 			)
 		)
 
+class EventResult( EventResultBase ):
+
+	__slots__ = ('status', 'participant', 'license_holder', 'event', 'rank', 'starters', 'value_for_rank', 'category', 'original_category', 'ignored')
+	
+	def __init__( self, result, rank, starters, value_for_rank ):
+		self.status = result.status
+		self.participant = result.participant
+		self.license_holder = result.participant.license_holder
+		self.event = result.event
+		
+		self.rank = rank
+		self.starters = starters
+		
+		self.value_for_rank = value_for_rank
+		self.original_category = self.category = result.participant.category
+		
+		self.ignored = False
+
+	@classmethod
+	def from_fields( cls, status, participant, event, rank, starters, value_for_rank, category, original_category, ignored ):
+		# Reconstruct an EventResult without a Result (eg. from materialized standings).
+		er = cls.__new__( cls )
+		er.status = status
+		er.participant = participant
+		er.license_holder = participant.license_holder
+		er.event = event
+		er.rank = rank
+		er.starters = starters
+		er.value_for_rank = value_for_rank
+		er.category = category
+		er.original_category = original_category
+		er.ignored = ignored
+		return er
+
+class EventResultOverlay( EventResultBase ):
+	# Copy-on-write view of a shared EventResult.
+	# Only the fields changed by adjust_for_upgrades and series_results are stored here.
+	
+	__slots__ = ('base', 'category', 'value_for_rank', 'ignored')
+	
+	def __init__( self, base ):
+		self.base = base
+		self.category = base.category
+		self.value_for_rank = base.value_for_rank
+		self.ignored = base.ignored
+	
+	status            = property( operator.attrgetter('base.status') )
+	participant       = property( operator.attrgetter('base.participant') )
+	license_holder    = property( operator.attrgetter('base.license_holder') )
+	event             = property( operator.attrgetter('base.event') )
+	rank              = property( operator.attrgetter('base.rank') )
+	starters          = property( operator.attrgetter('base.starters') )
+	original_category = property( operator.attrgetter('base.original_category') )
+
 def extract_event_results( sce, filter_categories=None, filter_license_holders=None ):
 	series = sce.series
 	
@@ -75,8 +116,6 @@ def extract_event_results( sce, filter_categories=None, filter_license_holders=N
 	if not isinstance(filter_categories, set):
 		filter_categories = set( filter_categories )
 	
-	get_value_for_rank = sce.get_value_for_rank_func()
-	
 	# Create a map between categories and waves.
 	category_pk = [c.pk for c in filter_categories]
 	category_wave = {}
@@ -101,6 +140,11 @@ def extract_event_results( sce, filter_categories=None, filter_license_holders=N
 	for rr in event_results:
 		wave_results[category_wave[rr.participant.category]].append( rr )
 	
+	return get_wave_event_results( sce, wave_results, filter_license_holders )
+
+def get_wave_event_results( sce, wave_results, filter_license_holders=None ):
+	get_value_for_rank = sce.get_value_for_rank_func()
+	
 	# Report the results by wave.
 	eventResults = []
 	for w, results in wave_results.items():
@@ -209,7 +253,7 @@ def adjust_for_upgrades( series, eventResults ):
 	if has_zero_factor:
 		eventResults[:] = [rr for rr in eventResults if rr.value_for_rank > 0.0]
 		
-def series_results( series, categories, eventResults ):
+def series_results( series, categories, eventResults, use_numpy=None ):
 	scoreByPoints = (series.ranking_criteria == 0)
 	scoreByTime = (series.ranking_criteria == 1)
 	scoreByPercent = (series.ranking_criteria == 2)
@@ -236,6 +280,9 @@ def series_results( series, categories, eventResults ):
 	events = sorted( set(rr.event for rr in eventResults), key=operator.attrgetter('date_time') )
 	eventSequence = {e:i for i, e in enumerate(events)}
 	
+	if use_numpy is None:
+		use_numpy = series_ranking.use_numpy( series, eventResults )
+	
 	lhEventsCompleted = defaultdict( int )
 	lhPlaceCount = defaultdict( lambda : defaultdict(int) )
 	lhTeam = defaultdict( lambda: u'' )
@@ -254,58 +301,62 @@ def series_results( series, categories, eventResults ):
 		lhTeam[lh] = rr.participant.team.name if rr.participant.team else u''
 		lhResults[lh][eventSequence[rr.event]] = rr
 		lhValue[lh] += rr.value_for_rank
-		lhPlaceCount[lh][rr.rank] += 1
-		lhEventsCompleted[lh] += 1
-	
-	# Remove if minimum events not completed.
-	lhOrder = [lh for lh, results in lhResults.items() if lhEventsCompleted[lh] >= mustHaveCompleted]
-	
-	# Adjust for the best results.
-	if bestResultsToConsider > 0:
-		for lh, rrs in lhResults.items():
-			iResults = [(i, rr) for i, rr in enumerate(rrs) if rr is not None]
-			if len(iResults) > bestResultsToConsider:
-				if scoreByTime:
-					iResults.sort( key=(lambda x: (x[1].value_for_rank, x[0])) )
-				else:
-					iResults.sort( key=(lambda x: (-x[1].value_for_rank, x[0])) )
-				for i, rr in iResults[bestResultsToConsider:]:
-					lhValue[lh] -= rr.value_for_rank
-					rrs[i].ignored = True
-				lhEventsCompleted[lh] = bestResultsToConsider
-
-	lhGap = {}
-	if scoreByTime:
-		# Sort by decreasing events completed, then increasing time.
-		lhOrder.sort( key = lambda r: tuple(itertools.chain(
-				[-lhEventsCompleted[r], lhValue[r]],
-				[-lhPlaceCount[r][k] for k in range(1, numPlacesTieBreaker+1)],
-				[rr.status_rank if rr else 9999999 for rr in reversed(lhResults[r])]
-			))
-		)
-		# Compute the time gap.
-		if lhOrder:
-			leader = lhOrder[0]
-			leaderValue = lhValue[leader]
-			leaderEventsCompleted = lhEventsCompleted[leader]
-			lhGap = { r : lhValue[r] - leaderValue if lhEventsCompleted[r] == leaderEventsCompleted else None for r in lhOrder }
+		if not use_numpy:
+			lhPlaceCount[lh][rr.rank] += 1
+			lhEventsCompleted[lh] += 1
 	
+	if use_numpy:
+		lhOrder, lhValue, lhGap = series_ranking.rank_license_holders( series, eventResults, eventSequence, lhResults, lhValue )
 	else:
-		# Sort by decreasing value.
-		lhOrder.sort( key = lambda r: tuple(itertools.chain(
-				[-lhValue[r]],
-				([-lhEventsCompleted[r]] if considerMostEventsCompleted else []),
-				[-lhPlaceCount[r][k] for k in range(1, numPlacesTieBreaker+1)],
-				[rr.status_rank if rr else 9999999 for rr in reversed(lhResults[r])]
-			))
-		)
-		
-		# Compute the gap.
+		# Remove if minimum events not completed.
+		lhOrder = [lh for lh, results in lhResults.items() if lhEventsCompleted[lh] >= mustHaveCompleted]
+	
+		# Adjust for the best results.
+		if bestResultsToConsider > 0:
+			for lh, rrs in lhResults.items():
+				iResults = [(i, rr) for i, rr in enumerate(rrs) if rr is not None]
+				if len(iResults) > bestResultsToConsider:
+					if scoreByTime:
+						iResults.sort( key=(lambda x: (x[1].value_for_rank, x[0])) )
+					else:
+						iResults.sort( key=(lambda x: (-x[1].value_for_rank, x[0])) )
+					for i, rr in iResults[bestResultsToConsider:]:
+						lhValue[lh] -= rr.value_for_rank
+						rrs[i].ignored = True
+					lhEventsCompleted[lh] = bestResultsToConsider
+
 		lhGap = {}
-		if lhOrder:
-			leader = lhOrder[0]
-			leaderValue = lhValue[leader]
-			lhGap = { r : leaderValue - lhValue[r] for r in lhOrder }
+		if scoreByTime:
+			# Sort by decreasing events completed, then increasing time.
+			lhOrder.sort( key = lambda r: tuple(itertools.chain(
+					[-lhEventsCompleted[r], lhValue[r]],
+					[-lhPlaceCount[r][k] for k in range(1, numPlacesTieBreaker+1)],
+					[rr.status_rank if rr else 9999999 for rr in reversed(lhResults[r])]
+				))
+			)
+			# Compute the time gap.
+			if lhOrder:
+				leader = lhOrder[0]
+				leaderValue = lhValue[leader]
+				leaderEventsCompleted = lhEventsCompleted[leader]
+				lhGap = { r : lhValue[r] - leaderValue if lhEventsCompleted[r] == leaderEventsCompleted else None for r in lhOrder }
+	
+		else:
+			# Sort by decreasing value.
+			lhOrder.sort( key = lambda r: tuple(itertools.chain(
+					[-lhValue[r]],
+					([-lhEventsCompleted[r]] if considerMostEventsCompleted else []),
+					[-lhPlaceCount[r][k] for k in range(1, numPlacesTieBreaker+1)],
+					[rr.status_rank if rr else 9999999 for rr in reversed(lhResults[r])]
+				))
+			)
+		
+			# Compute the gap.
+			lhGap = {}
+			if lhOrder:
+				leader = lhOrder[0]
+				leaderValue = lhValue[leader]
+				lhGap = { r : leaderValue - lhValue[r] for r in lhOrder }
 				
 	# List of:
 	# license_holder, team, totalValue, gap, [list of results for each event in series]
@@ -327,6 +378,93 @@ def get_results_for_category( series, category ):
 	
 	return series_results( series, series.get_group_related_categories(category), eventResults )
 
+def get_category_groups( series ):
+	# Returns a list of (group_categories, related_categories) covering all the series categories.
+	category_groups = []
+	categories_seen = set()
+	for category in series.get_categories():
+		if category in categories_seen:
+			continue
+		group_categories = series.get_group_related_categories( category )
+		categories_seen.update( group_categories )
+		category_groups.append( (group_categories, series.get_related_categories(category)) )
+	return category_groups
+
+def get_extract_categories( series, category_groups=None ):
+	# The series categories and the upgrade progression categories related to them.
+	categories = set()
+	for group_categories, related_categories in (category_groups or get_category_groups(series)):
+		categories |= related_categories
+	return categories
+
+def extract_series_event_results( series, categories=None ):
+	# Get the results for all events in the series with one query for each event type.
+	# Returns a list of (sce, category_wave, results) for each event, with results in wave_rank order.
+	if categories is None:
+		categories = get_extract_categories( series )
+	sces = list( series.seriescompetitionevent_set.all().select_related(
+		'points_structure',
+		'event_mass_start', 'event_mass_start__competition',
+		'event_tt', 'event_tt__competition',
+	) )
+	for sce in sces:
+		sce.series = series
+
+	# Create a map between categories and waves for each event.
+	event_category_wave = defaultdict( dict )
+	event_results = defaultdict( list )
+	for event_type, WaveClass in enumerate((Wave, WaveTT)):
+		events = {sce.event.pk:sce.event for sce in sces if sce.event.event_type == event_type}
+		if not events:
+			continue
+
+		for w in WaveClass.objects.filter( event__in=list(events.keys()) ).prefetch_related('categories'):
+			for c in w.categories.all():
+				if c in categories:
+					event_category_wave[(event_type, w.event_id)][c] = w
+
+		results = events[next(iter(events))].get_result_class().objects.filter(
+			event__in=list(events.keys()),
+			participant__category__in=categories,
+		)
+		if series.ranking_criteria != 0:	# If not rank by points, compute lap counts in the query.
+			results = events[next(iter(events))].add_laps_to_results_query( results )
+		results = (results
+			.order_by('event', 'wave_rank')
+			.select_related('participant', 'participant__license_holder', 'participant__category', 'participant__team')
+		)
+		for rr in results:
+			rr.event = events[rr.event_id]
+			event_results[(event_type, rr.event_id)].append( rr )
+
+	return [
+		(sce, event_category_wave[(sce.event.event_type, sce.event.pk)], event_results[(sce.event.event_type, sce.event.pk)])
+			for sce in sces
+	]
+
+def get_results_for_all_categories( series, series_event_results=None ):
+	# Compute the results for all category groups from one extraction of the series results.
+	# Returns a list of (group_categories, (categoryResult, events)).
+	category_groups = get_category_groups( series )
+	if series_event_results is None:
+		series_event_results = extract_series_event_results( series, get_extract_categories(series, category_groups) )
+
+	all_results = []
+	for group_categories, related_categories in category_groups:
+		eventResults = []
+		for sce, category_wave, results in series_event_results:
+			wave_results = defaultdict( list )
+			for rr in results:
+				category = rr.participant.category
+				if category in related_categories and category in category_wave:
+					wave_results[category_wave[category]].append( rr )
+			eventResults.extend( get_wave_event_results(sce, wave_results) )
+		adjust_for_upgrades( series, eventResults )
+
+		all_results.append( (group_categories, series_results(series, group_categories, eventResults)) )
+
+	return all_results
+
 def get_results_for_custom_category_name( series, custom_category_name ):
 	eventResults = []
 	for sce in series.seriescompetitionevent_set.all():
@@ -360,7 +498,7 @@ def get_callups_for_wave( series, wave, eventResultsAll=None ):
 		related_categories = series.get_related_categories( c )
 	
 		if eventResultsAll:
-			eventResults = [deepcopy(er) for er in eventResultsAll if er.license_holder in license_holders]
+			eventResults = [EventResultOverlay(er) for er in eventResultsAll if er.license_holder in license_holders]
 		else:
 			eventResults = []
 			for sce in series.seriescompetitionevent_set.all():
@@ -0,0 +1,196 @@
+import sys
+import json
+import threading
+
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
+
+from .models import *
+from .WriteLog import logException
+from . import series_results
+
+#-----------------------------------------------------------------------------------------------
+# Materialized Series standings.
+#
+# Each SeriesStandings row holds the computed standings for one category group (or custom category) as json.
+# Rows are marked stale (and their version bumped) by result uploads and Series edits.
+# A write only succeeds if the version is unchanged since the computation started,
+# so a standing invalidated during a rebuild stays stale and is rebuilt again.
+#
+
+def serialize_standings( categoryResult, events ):
+	return json.dumps( {
+		'events': [[e.event_type, e.pk] for e in events],
+		'results': [
+			[lh.pk, team, value, gap, [
+				[er.status, er.participant.pk, er.rank, er.starters, er.value_for_rank, er.category.pk, er.original_category.pk, er.ignored]
+					if er else None for er in results
+			]] for lh, team, value, gap, results in categoryResult
+		],
+	} )
+
+def deserialize_standings( standings ):
+	s = json.loads( standings )
+
+	event_pks = ([], [])
+	for event_type, pk in s['events']:
+		event_pks[event_type].append( pk )
+	event_lookup = (
+		EventMassStart.objects.select_related('competition').in_bulk( event_pks[0] ),
+		EventTT.objects.select_related('competition').in_bulk( event_pks[1] ),
+	)
+	events = [event_lookup[event_type][pk] for event_type, pk in s['events']]
+
+	license_holder_pks, participant_pks, category_pks = set(), set(), set()
+	for lh_pk, team, value, gap, results in s['results']:
+		license_holder_pks.add( lh_pk )
+		for r in results:
+			if r:
+				participant_pks.add( r[1] )
+				category_pks.add( r[5] )
+				category_pks.add( r[6] )
+
+	license_holders = LicenseHolder.objects.in_bulk( license_holder_pks )
+	participants = Participant.objects.select_related('team').in_bulk( participant_pks )
+	categories = Category.objects.in_bulk( category_pks )
+	for p in participants.values():
+		p.license_holder = license_holders[p.license_holder_id]
+
+	def get_event_result( i, r ):
+		if not r:
+			return None
+		status, participant_pk, rank, starters, value_for_rank, category_pk, original_category_pk, ignored = r
+		return series_results.EventResult.from_fields(
+			status, participants[participant_pk], events[i], rank, starters, value_for_rank,
+			categories[category_pk], categories[original_category_pk], ignored
+		)
+
+	categoryResult = [
+		[license_holders[lh_pk], team, value, gap, [get_event_result(i, r) for i, r in enumerate(results)]]
+			for lh_pk, team, value, gap, results in s['results']
+	]
+	return categoryResult, events
+
+def save_standings( ss, version, categoryResult, events ):
+	# Only save if the standings have not been invalidated since the computation started.
+	return SeriesStandings.objects.filter( pk=ss.pk, version=version ).update(
+		standings=serialize_standings(categoryResult, events),
+		is_stale=False,
+		updated=timezone.now(),
+	)
+
+def compute_standings( ss, compute ):
+	version = ss.version
+	categoryResult, events = compute()
+	save_standings( ss, version, categoryResult, events )
+	return categoryResult, events
+
+def get_or_create_standings( series, group_name ):
+	group_key = SeriesStandings.get_key( group_name )
+	try:
+		with transaction.atomic():
+			return SeriesStandings.objects.create( series=series, group_key=group_key, group_name=group_name )
+	except IntegrityError:
+		return SeriesStandings.objects.get( series=series, group_key=group_key )
+
+def get_standings( series, group_name, compute ):
+	ss = SeriesStandings.objects.filter( series=series, group_key=SeriesStandings.get_key(group_name) ).first()
+	if ss and not ss.is_stale:
+		try:
+			return deserialize_standings( ss.standings )
+		except (ObjectDoesNotExist, KeyError, ValueError) as e:
+			# Something referenced by the standings is gone.  Recompute.
+			logException( e, sys.exc_info() )
+
+	return compute_standings( ss or get_or_create_standings(series, group_name), compute )
+
+def get_results_for_category( series, category ):
+	return get_standings(
+		series,
+		SeriesStandings.get_group_name( series.get_group_related_categories(category) ),
+		lambda: series_results.get_results_for_category( series, category ),
+	)
+
+def get_results_for_custom_category_name( series, custom_category_name ):
+	return get_standings(
+		series,
+		SeriesStandings.get_custom_group_name( custom_category_name ),
+		lambda: series_results.get_results_for_custom_category_name( series, custom_category_name ),
+	)
+
+def compute_all_standings( series ):
+	# Compute the standings for all category groups in one pass over the series results.
+	category_groups = series_results.get_category_groups( series )
+	group_names = set( SeriesStandings.get_group_name(group_categories) for group_categories, related_categories in category_groups )
+
+	standings = {}
+	for ss in SeriesStandings.objects.filter( series=series ):
+		if ss.custom_category_name is not None:
+			continue
+		if ss.group_name in group_names:
+			standings[ss.group_name] = ss
+		else:
+			ss.delete()		# The category group no longer exists in this form.
+	for group_name in group_names:
+		if group_name not in standings:
+			standings[group_name] = get_or_create_standings( series, group_name )
+	
+	# Record the versions before the computation starts.
+	versions = {group_name:ss.version for group_name, ss in standings.items()}
+	
+	for group_categories, (categoryResult, events) in series_results.get_results_for_all_categories( series ):
+		group_name = SeriesStandings.get_group_name( group_categories )
+		save_standings( standings[group_name], versions[group_name], categoryResult, events )
+
+def update_stale_standings( series ):
+	# Recompute all the category standings if any are missing or stale.
+	category_groups = series_results.get_category_groups( series )
+	fresh = set( SeriesStandings.objects.filter(series=series, is_stale=False).values_list('group_name', flat=True) )
+	if any( SeriesStandings.get_group_name(group_categories) not in fresh for group_categories, related_categories in category_groups ):
+		compute_all_standings( series )
+
+def rebuild_stale_standings():
+	series_stale = set()
+	for ss in list( SeriesStandings.objects.filter(is_stale=True).select_related('series') ):
+		series = ss.series
+		custom_category_name = ss.custom_category_name
+		if custom_category_name is None:
+			series_stale.add( series )
+		elif custom_category_name not in series.get_custom_category_names():
+			ss.delete()
+		else:
+			compute_standings( ss, lambda: series_results.get_results_for_custom_category_name(series, custom_category_name) )
+	
+	for series in series_stale:
+		compute_all_standings( series )
+
+#-----------------------------------------------------------------------------------------------
+rebuild_lock = threading.Lock()
+rebuild_thread = None
+rebuild_pending = False
+
+def rebuild_worker():
+	global rebuild_thread, rebuild_pending
+	try:
+		while True:
+			with rebuild_lock:
+				if not rebuild_pending:
+					rebuild_thread = None
+					return
+				rebuild_pending = False
+			try:
+				rebuild_stale_standings()
+			except Exception as e:
+				logException( e, sys.exc_info() )
+	finally:
+		connection.close()
+
+def rebuild_standings_in_background():
+	global rebuild_thread, rebuild_pending
+	with rebuild_lock:
+		rebuild_pending = True
+		if rebuild_thread is not None:
+			return
+		rebuild_thread = threading.Thread( target=rebuild_worker, name='SeriesStandingsRebuild' )
+		rebuild_thread.daemon = True
+		rebuild_thread.start()
@@ -1,3 +1,666 @@
-from django.test import TestCase
+import time
+import random
+import datetime
+import threading
+from collections import defaultdict
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import *
+from . import bib_index, minimal_intervals, search_index, duplicates, license_holder_index
+from .DurationField import formatted_timedelta
+
+#-----------------------------------------------------------------------
+# Bib allocation.
+#
+# The original implementation, used as the reference.
+#
+def get_available_numbers_reference( self ):
+	if not self.category:
+		return [], {}, [], False
+		
+	competition      = self.competition
+	category         = self.category
+	number_set       = competition.number_set
+	category_numbers = competition.get_category_numbers( category )
+	
+	if category_numbers:
+		available_numbers = sorted( category_numbers.get_numbers() )
+		bib_query = category_numbers.get_bib_query()
+		category_numbers_defined = True
+	else:
+		available_numbers = []
+		bib_query = None
+		category_numbers_defined = False
+	
+	allocated_numbers = {}
+	lost_bibs = {}
+	
+	# Find available category numbers.
+	
+	# First, add all numbers allocated to this event (includes pre-reg).
+	if available_numbers:
+		participants = Participant.objects.filter( competition=competition )
+		participants = participants.filter( category__in=category_numbers.categories.all() ).filter( bib_query ).order_by()
+		participants = participants.select_related('license_holder')
+		allocated_numbers = { p.bib: p.license_holder for p in participants }
+	
+	# If there is a NumberSet, add allocated numbers from there.
+	if number_set and available_numbers:
+		# Exclude available numbers not allowed in the number set.
+		range_events = number_set.get_range_events()
+		available_numbers = [bib for bib in available_numbers if number_set.is_bib_valid(bib, range_events)]
+		
+		# Exclude existing bib numbers of all license holders if using existing bibs.
+		# For duplicate license holders, check whether the duplicate has ever raced this category before.
+		# We don't know if the existing license holders will show up.
+		
+		bib_max = number_set.get_bib_max_count_all()
+		bib_available_all = number_set.get_bib_available_all( bib_query )
+		
+		# Get all the bibs of license holders that match the category_numbers of this category.
+		current_bibs = defaultdict( set )
+		nses = number_set.numbersetentry_set.filter( date_lost__isnull=True ).filter( bib_query )
+		nses = nses.select_related('license_holder')
+		for nse in nses:
+			current_bibs[nse.license_holder].add( nse.bib )
+		
+		# Handle the case of only one bib in the number set.
+		for lh, bibs in current_bibs.items():
+			if len(bibs) == 1:
+				bib = next(iter(bibs))
+				if bib_max.get(bib, 0) == 1:
+					allocated_numbers[bib] = lh
+					
+		# Otherwise, scan past participants to check if a license holder in this category owns the bib.
+		pprevious = Participant.objects.filter( competition__number_set=number_set, category__in=category_numbers.categories.all() )
+		pprevious = pprevious.filter( bib_query )
+		pprevious = pprevious.exclude( bib__in=list(allocated_numbers.keys())[:200] )
+		pprevious = pprevious.order_by('-competition__start_date')
+		
+		for p in pprevious.exclude(license_holder=self.license_holder).select_related('license_holder'):
+			if p.bib not in allocated_numbers and p.bib in current_bibs[p.license_holder]:
+				allocated_numbers[p.bib] = p.license_holder
+		
+		nses = number_set.numbersetentry_set.exclude( date_lost__isnull=True ).filter( bib_query )
+		lost_bibs = { bib:date_lost
+			for bib, date_lost in nses.order_by('date_lost').values_list('bib','date_lost')
+				if bib_available_all.get(bib,-1) == 0
+		}
+	else:
+		lost_bibs = {}
+		
+	return available_numbers, allocated_numbers, lost_bibs, category_numbers_defined
+
+def get_bib_auto_reference( self ):
+	if self.bib:
+		return self.bib
+	available_numbers, allocated_numbers, lost_bibs, category_numbers_defined = get_available_numbers_reference( self )
+	for bib in available_numbers:
+		if bib not in allocated_numbers and bib not in lost_bibs:
+			return bib
+	return None
+
+
+#-----------------------------------------------------------------------
+
+def make_data( riders, seed, range_str ):
+	rng = random.Random( seed )
+	name = 'Bib Check {}'.format( seed )
+	discipline = Discipline.objects.first() or Discipline.objects.create( name='Road' )
+	race_class = RaceClass.objects.first() or RaceClass.objects.create( name='Club' )
+	category_format = CategoryFormat.objects.create( name=name )
+	categories = [Category.objects.create(format=category_format, code=code, gender=0, sequence=i) for i, code in enumerate('ABCDEF')]
+	number_set = NumberSet.objects.create( name=name, range_str=range_str )
+
+	LicenseHolder.objects.bulk_create( [
+		LicenseHolder( last_name='Bib{}'.format(i), first_name='Check', date_of_birth=datetime.date(1980,1,1), license_code='BC{}'.format(i) )
+			for i in range(riders)
+	] )
+	license_holders = list( LicenseHolder.objects.order_by('pk') )
+
+	competitions = [
+		Competition.objects.create(
+			name='{} {}'.format(name, i), category_format=category_format, organizer='Bib Check',
+			start_date=datetime.date(2017 + i, 6, 1), discipline=discipline, race_class=race_class, number_set=number_set,
+		) for i in range(4)
+	]
+	competition = competitions[-1]
+	for category_ids, cn_range_str in ((categories[:2], '1-300,-50-60'), (categories[2:4], '250-600'), (categories[4:5], '1-999')):
+		CategoryNumbers.objects.create( competition=competition, range_str=cn_range_str ).categories.set( category_ids )
+
+	# Past participants.  Bibs are unique in each Competition so there are no ties.
+	participants = []
+	for c in competitions:
+		bibs = rng.sample( range(1, 1000), riders )
+		for i, lh in enumerate(license_holders):
+			if rng.random() < (0.5 if c == competition else 0.4):
+				participants.append( Participant(
+					competition=c, license_holder=lh, category=rng.choice(categories),
+					bib=bibs[i] if (c != competition or rng.random() < 0.7) else None,
+				) )
+	Participant.objects.bulk_create( participants )
+
+	# Number set entries: held, lost and reissued.
+	# Like assign_bib, only bibs allowed more than once by the NumberSet have more than one holder.
+	nses = []
+	held = set()
+	def hold( license_holder, bib ):
+		if bib not in held or 500 <= bib <= 520:
+			held.add( bib )
+			nses.append( NumberSetEntry(number_set=number_set, license_holder=license_holder, bib=bib) )
+	bibs = rng.sample( range(1, 1000), riders )
+	for i, lh in enumerate(license_holders):
+		if rng.random() < 0.6:
+			hold( lh, bibs[i] )
+			if rng.random() < 0.2:
+				nses.append( NumberSetEntry(number_set=number_set, license_holder=lh, bib=rng.randint(1, 999), date_lost=datetime.date(2019,1,1+i%28)) )
+	# Some license holders hold the bibs they raced with.
+	for p in rng.sample( [p for p in participants if p.bib], len(participants)//5 ):
+		hold( p.license_holder, p.bib )
+	NumberSetEntry.objects.bulk_create( nses )
+	return competition, number_set
+
+def get_bib_auto_peek( participant ):
+	return participant.get_bib_auto( reserve=False )
+
+def get_result( participant, get_available_numbers, get_bib_auto ):
+	available_numbers, allocated_numbers, lost_bibs, category_numbers_defined = get_available_numbers( participant )
+	return (
+		list(available_numbers), {bib:lh.pk for bib, lh in allocated_numbers.items()}, dict(lost_bibs),
+		category_numbers_defined, get_bib_auto( participant ),
+	)
+
+def compare( competition ):
+	# Returns the number of participants whose bib allocation differs from the reference.
+	participants = list( Participant.objects.filter(competition=competition).select_related('competition', 'category', 'license_holder') )
+	mismatches = 0
+	for p in participants:
+		for bib in (p.bib, None):
+			p.bib = bib
+			if get_result(p, get_available_numbers_reference, get_bib_auto_reference) != get_result(p, Participant.get_available_numbers, get_bib_auto_peek):
+				mismatches += 1
+	return mismatches
+
+def get_duplicate_bibs( competition ):
+	# Bibs used more than once in the categories sharing a CategoryNumbers.
+	duplicates = 0
+	for category_numbers in CategoryNumbers.objects.filter( competition=competition ):
+		bibs = list( Participant.objects.filter(competition=competition, category__in=category_numbers.categories.all(), bib__isnull=False).values_list('bib', flat=True) )
+		duplicates += len(bibs) - len(set(bibs))
+	return duplicates
+
+def run_desks( competition, desks ):
+	# Each desk assigns bibs to its share of the Participants without one, all at the same time.
+	pks = list( Participant.objects.filter(competition=competition, bib__isnull=True, category__isnull=False).values_list('pk', flat=True) )
+	assigned = []
+	
+	def desk( pks ):
+		try:
+			for pk in pks:
+				for attempt in range(20):
+					try:
+						p = Participant.objects.select_related('competition', 'category', 'license_holder').get( pk=pk )
+						p.bib = p.get_bib_auto()
+						p.save()
+						assigned.append( p.bib )
+						break
+					except (IntegrityError, OperationalError):
+						time.sleep( 0.01 )	# Bib taken by another desk or the database is locked.  Try again.
+		finally:
+			connection.close()
+	
+	threads = [threading.Thread(target=desk, args=(pks[i::desks],)) for i in range(desks)]
+	for th in threads:
+		th.start()
+	for th in threads:
+		th.join()
+	return len(pks), sum(1 for bib in assigned if bib)
+
+
+class BibAllocationTest( TransactionTestCase ):
+	Riders = 300
+	Seed = 1
+
+	def setUp( self ):
+		bib_index.invalidate()
+
+	def tearDown( self ):
+		bib_index.invalidate()
+
+	def check_allocation( self, range_str ):
+		competition, number_set = make_data( self.Riders, self.Seed, range_str )
+		self.assertEqual( compare(competition), 0 )
+
+		# Change the bibs through the usual model calls and check the index keeps up.
+		rng = random.Random( self.Seed )
+		participants = list( Participant.objects.filter(competition=competition).select_related('competition', 'license_holder') )
+		for p in rng.sample( participants, len(participants)//4 ):
+			op = rng.random()
+			if op < 0.4:
+				p.bib = p.get_bib_auto(reserve=False) if p.bib is None else None
+				try:
+					p.save()
+				except IntegrityError:
+					pass
+			elif op < 0.6:
+				number_set.set_lost( p.bib, p.license_holder )
+			elif op < 0.8:
+				number_set.assign_bib( p.license_holder, rng.randint(1, 999) )
+			else:
+				p.delete()
+		self.assertEqual( compare(competition), 0 )
+
+		# Several registration desks assigning bibs at the same time.
+		bib_index.invalidate()
+		duplicates_before = get_duplicate_bibs( competition )
+		count, assigned = run_desks( competition, 4 )
+		self.assertTrue( assigned > 0 )
+		self.assertEqual( get_duplicate_bibs(competition), duplicates_before )
+
+	def test_allocation( self ):
+		self.check_allocation( '' )
+
+	def test_allocation_number_set_range( self ):
+		self.check_allocation( '1-999,500-520' )
+
+#-----------------------------------------------------------------------
+# Intervals.
+#
+# The original implementations, used as the reference.
+#
+def minimal_intervals_reference( numbers ):
+	if not numbers:
+		return []
+	if len(numbers) == 1:
+		return [minimal_intervals.set_to_intervals(numbers[0])]
+
+	combineIntervalsTogether = True
+	for n in numbers:
+		if any( bib > 99999 for bib in n ):
+			combineIntervalsTogether = False
+			break
+
+	intervals = []
+
+	if combineIntervalsTogether:
+		for j, n in enumerate(numbers):
+			if not n:
+				intervals.append( [] )
+				continue
+
+			other_nums = set.union( *[nn for k, nn in enumerate(numbers) if k != j] )
+
+			nums = sorted( n )
+			intervalCur = []
+			nRange = [nums[0], nums[0]]
+			for i in range(1, len(nums)):
+				if other_nums.isdisjoint( range(nums[i-1], nums[i]+1) ):
+					nRange[1] = nums[i]
+				else:
+					if intervalCur and intervalCur[-1][1]+1 == nRange[0]:
+						intervalCur[-1] = ( intervalCur[-1][0], nRange[1] )
+					else:
+						intervalCur.append( tuple(nRange) )
+					nRange = [nums[i], nums[i]]
+			intervalCur.append( tuple(nRange) )
+
+			intervals.append( intervalCur )
+	else:
+		intervals = [minimal_intervals.set_to_intervals(n) for n in numbers]
+
+	return intervals
+
+def get_numbers_reference( range_str ):
+	include = set()
+	for p in range_str.split(','):
+		p = p.strip()
+		if not p:
+			continue
+
+		if p.startswith( '-' ):
+			exclude = True
+			p = p[1:]
+		else:
+			exclude = False
+
+		pair = p.split( '-' )
+		if len(pair) == 1:
+			n = max(1, int(pair[0]))
+			if exclude:
+				include.discard( n )
+			else:
+				include.add( n )
+		elif len(pair) >= 2:
+			nBegin, nEnd = [int(v) for v in pair[:2]]
+			nBegin, nEnd = max(nBegin, 1), min(nEnd, 99999)
+			if exclude:
+				include.difference_update( range(nBegin, nEnd+1) )
+			else:
+				include.update( range(nBegin, nEnd+1) )
+
+	return include
+
+def get_bib_ranges_reference( range_str, number_set_range_str ):
+	include = get_numbers_reference( validate_range_str(range_str) )
+	if number_set_range_str is not None:
+		number_set = NumberSet( range_str=number_set_range_str )
+		range_events = number_set.get_range_events()
+		include = set( bib for bib in include if number_set.is_bib_valid(bib, range_events) )
+	include.discard( 0 )
+	return include
+
+def to_set( intervals ):
+	return set( minimal_intervals.interval_numbers(intervals) )
+
+def is_normalized( intervals ):
+	return all( a <= b for a, b in intervals ) and all( intervals[i][1] + 1 < intervals[i+1][0] for i in range(len(intervals)-1) )
+
+def random_intervals( rng, count, span ):
+	intervals = []
+	for i in range(count):
+		a = rng.randint( 0, span )
+		intervals.append( (a, a + rng.choice((0, 0, 1, 2, rng.randint(0, span//4)))) )
+	return intervals
+
+def random_sets( rng, count, span ):
+	return [set( rng.sample(range(1, span), rng.randint(0, min(span-1, 40))) ) for i in range(count)]
+
+def random_range_str( rng, count, span ):
+	parts = []
+	for i in range(count):
+		a = rng.randint( 0, span )
+		p = u'{}'.format(a) if rng.random() < 0.3 else u'{}-{}'.format(a, a + rng.randint(-5, span//5))
+		parts.append( (u'-' if rng.random() < 0.25 else u'') + p )
+	return u','.join( parts )
+
+class IntervalTest( SimpleTestCase ):
+	Cases = 2000
+
+	def setUp( self ):
+		self.rng = random.Random( 1 )
+
+	def test_operations( self ):
+		rng = self.rng
+		for t in range(self.Cases):
+			span = rng.choice( (20, 200, 5000) )
+			left = random_intervals( rng, rng.randint(0, 12), span )
+			right = random_intervals( rng, rng.randint(0, 12), span )
+			s_left, s_right = to_set(left), to_set(right)
+			results = (
+				('normalize',    minimal_intervals.normalize(left),              s_left),
+				('union',        minimal_intervals.union(left, right),           s_left | s_right),
+				('intersection', minimal_intervals.intersection(left, right),    s_left & s_right),
+				('difference',   minimal_intervals.difference(left, right),      s_left - s_right),
+			)
+			for name, intervals, expected in results:
+				msg = u'{}: {} {} -> {}'.format(name, left, right, intervals)
+				self.assertTrue( is_normalized(intervals), msg )
+				self.assertEqual( to_set(intervals), expected, msg )
+			normalized = minimal_intervals.normalize( left )
+			for n in rng.sample( range(-1, span + span//4 + 3), 10 ):
+				self.assertEqual( minimal_intervals.contains(normalized, n), n in s_left, u'contains: {} {}'.format(left, n) )
+
+	def test_minimal_intervals( self ):
+		rng = self.rng
+		for t in range(self.Cases):
+			span = rng.choice( (30, 300, 3000, 200000) )
+			numbers = random_sets( rng, rng.randint(1, 6), span )
+			result = minimal_intervals.minimal_intervals( numbers )
+			# The original did not always merge adjacent intervals.  Compare the normalized intervals.
+			expected = [minimal_intervals.normalize(i) for i in minimal_intervals_reference(numbers)]
+			self.assertEqual( result, expected, u'{}'.format(numbers) )
+			for i, n in zip(result, numbers):
+				self.assertTrue( n <= to_set(i) )
+
+	def test_range_strs( self ):
+		rng = self.rng
+		for t in range(self.Cases):
+			range_str = random_range_str( rng, rng.randint(1, 8), rng.choice((100, 1000, 120000)) )
+			number_set_range_str = rng.choice( (None, u'', random_range_str(rng, rng.randint(1, 5), 1000), u'1-500,1-100,-50-60') )
+			validated = validate_range_str( range_str )
+			self.assertEqual( get_numbers(validated), get_numbers_reference(validated), validated )
+			self.assertEqual( get_bib_ranges(validated, number_set_range_str).numbers, get_bib_ranges_reference(range_str, number_set_range_str),
+				u'"{}" "{}"'.format(validated, number_set_range_str) )
+
+#-----------------------------------------------------------------------
+# Hub query counts.
+#
+class HubQueryCountTest( TestCase ):
+	# The hub result pages must run the same number of queries however many riders there are.
+	Riders = (5, 40)
+	Laps = 5
+
+	@classmethod
+	def setUpTestData( cls ):
+		discipline = Discipline.objects.create( name='Road' )
+		race_class = RaceClass.objects.create( name='Club' )
+		category_format = CategoryFormat.objects.create( name='Hub' )
+		cls.categories = [Category.objects.create(format=category_format, code=code, gender=0, sequence=i) for i, code in enumerate('AB')]
+		competition = Competition.objects.create(
+			name='Hub', category_format=category_format, organizer='Hub',
+			start_date=datetime.date(2020, 6, 1), discipline=discipline, race_class=race_class,
+		)
+		cls.event = EventMassStart.objects.create( competition=competition, name='Race', date_time=timezone.make_aware(datetime.datetime(2020, 6, 1, 10)) )
+		Wave.objects.create( event=cls.event, name='W1' ).categories.set( cls.categories )
+
+		cls.results = []
+		bib = 0
+		for category, riders in zip(cls.categories, cls.Riders):
+			for i in range(riders):
+				bib += 1
+				lh = LicenseHolder.objects.create( last_name='Rider{}'.format(bib), first_name='Hub', date_of_birth=datetime.date(1980, 1, 1), license_code='H{}'.format(bib) )
+				p = Participant.objects.create( competition=competition, license_holder=lh, category=category, bib=bib )
+				finish = 3600 + i * 3
+				result = ResultMassStart.objects.create(
+					event=cls.event, participant=p, status=Result.cFinisher, category_rank=i+1, wave_rank=bib,
+					category_starters=riders, wave_starters=sum(cls.Riders), finish_time=formatted_timedelta(seconds=finish),
+				)
+				RaceTimeMassStart.objects.bulk_create( [
+					RaceTimeMassStart( result=result, race_time=formatted_timedelta(seconds=finish * lap / cls.Laps), lap_kmh=35.0 if lap else 0.0 )
+						for lap in range(cls.Laps + 1)
+				] )
+				if i == 0:
+					cls.results.append( result )
+
+	def get( self, url ):
+		cache.clear()		# Render the page, not the cached response.
+		response = self.client.get( url )
+		self.assertEqual( response.status_code, 200 )
+
+	def check_query_counts( self, urls ):
+		self.get( urls[0] )	# Load anything loaded once per process.
+		with CaptureQueriesContext(connection) as queries:
+			self.get( urls[0] )
+		for url in urls[1:]:
+			with self.assertNumQueries( len(queries) ):
+				self.get( url )
+
+	def test_category_results( self ):
+		self.check_query_counts( ['/RaceDB/Hub/CategoryResults/{}/0/{}/'.format(self.event.pk, c.pk) for c in self.categories] )
+
+	def test_result_analysis( self ):
+		self.check_query_counts( ['/RaceDB/Hub/ResultAnalysis/{}/0/{}/'.format(self.event.pk, r.pk) for r in self.results] )
+
+#-----------------------------------------------------------------------
+# Applying a number set.
+#
+class Rollback( Exception ):
+	pass
+
+def apply_number_set_reference( self ):
+	# The original Competition.apply_number_set.
+	participants_changed = []
+	if self.number_set:
+		self.number_set.validate()
+		
+		participants = self.get_participants().filter( role=Participant.Competitor )
+		
+		category_nums = {}
+		for category_numbers in CategoryNumbers.objects.filter( competition=self ):
+			for c in category_numbers.categories.all():
+				category_nums[c.pk] = category_numbers.get_numbers()
+		
+		bib_last = { pk:bib for pk, bib in participants.values_list('pk', 'bib') }
+		participants.update( bib=None )
+		
+		nses = defaultdict( list )
+		for pk, bib in NumberSetEntry.objects.filter(
+				number_set=self.number_set, date_lost=None).values_list(
+				'license_holder__pk', 'bib'):
+			nses[pk].append( bib )
+			
+		for bibs in nses.values():
+			bibs.sort()
+		
+		with transaction.atomic():
+			for p in participants:
+				bib_category = None
+				if p.category:
+					for bib in nses[p.license_holder.pk]:
+						if p.category.pk in category_nums and bib in category_nums[p.category.pk]:
+							bib_category = bib
+							break
+				if p.bib != bib_category:
+					p.bib = bib_category
+					p.save()
+				if bib_last[p.pk] != p.bib:
+					participants_changed.append( p )
+	
+	participants_changed.sort( key=lambda p: (p.bib or 99999999, p.license_holder.search_text) ) 
+	return participants_changed
+
+class ApplyNumberSetTest( TestCase ):
+	Riders = 200
+	
+	def setUp( self ):
+		bib_index.invalidate()
+		rng = random.Random( 1 )
+		discipline = Discipline.objects.create( name='Road' )
+		race_class = RaceClass.objects.create( name='Club' )
+		category_format = CategoryFormat.objects.create( name='Apply' )
+		categories = [Category.objects.create(format=category_format, code=code, gender=0, sequence=i) for i, code in enumerate('ABCDE')]
+		self.number_set = NumberSet.objects.create( name='Apply', range_str='1-999' )
+		self.competition = Competition.objects.create(
+			name='Apply', category_format=category_format, organizer='Apply',
+			start_date=datetime.date(2020, 6, 1), discipline=discipline, race_class=race_class, number_set=self.number_set,
+		)
+		for category_ids, range_str in ((categories[:2], '1-300'), (categories[2:4], '200-600')):
+			CategoryNumbers.objects.create( competition=self.competition, range_str=range_str ).categories.set( category_ids )
+		
+		LicenseHolder.objects.bulk_create( [
+			LicenseHolder( last_name='Apply{}'.format(i), first_name='Number', date_of_birth=datetime.date(1980,1,1), license_code='A{}'.format(i) )
+				for i in range(self.Riders)
+		] )
+		license_holders = list( LicenseHolder.objects.order_by('pk') )
+		participants = []
+		bibs = rng.sample( range(1, 1000), self.Riders )
+		for i, lh in enumerate(license_holders):
+			# Some license holders race two categories of a CategoryNumbers with different tags.
+			for category in rng.sample( categories, rng.choice((1, 1, 1, 2)) ):
+				participants.append( Participant(
+					competition=self.competition, license_holder=lh, category=category,
+					bib=rng.choice((None, bibs[i])), tag=u'{:06X}'.format(rng.randrange(1 << 20, 1 << 24)),		# As Participant.save stores them.
+				) )
+		Participant.objects.bulk_create( participants )
+		
+		# Held bibs, some for more than one category range.
+		nses = []
+		bibs = rng.sample( range(1, 700), self.Riders * 2 )
+		for i, lh in enumerate(license_holders):
+			if rng.random() < 0.8:
+				nses.append( NumberSetEntry(number_set=self.number_set, license_holder=lh, bib=bibs[i]) )
+			if rng.random() < 0.3:
+				nses.append( NumberSetEntry(number_set=self.number_set, license_holder=lh, bib=bibs[self.Riders + i]) )
+		NumberSetEntry.objects.bulk_create( nses )
+	
+	def tearDown( self ):
+		bib_index.invalidate()
+	
+	def get_state( self ):
+		return (
+			sorted( Participant.objects.filter(competition=self.competition).values_list('pk', 'bib', 'tag', 'tag2') ),
+			sorted( NumberSetEntry.objects.filter(number_set=self.number_set).values_list('license_holder', 'bib', 'date_lost') ),
+		)
+	
+	def test_apply_number_set( self ):
+		state = self.get_state()
+		try:
+			with transaction.atomic():
+				changed_reference = [(p.pk, p.bib) for p in apply_number_set_reference( Competition.objects.get(pk=self.competition.pk) )]
+				state_reference = self.get_state()
+				raise Rollback()
+		except Rollback:
+			pass
+		self.assertEqual( self.get_state(), state )
+		
+		changed = [(p.pk, p.bib) for p in Competition.objects.get(pk=self.competition.pk).apply_number_set( dry_run=True )]
+		self.assertEqual( self.get_state(), state )
+		self.assertEqual( sorted(changed), sorted(changed_reference) )
+		
+		changed = [(p.pk, p.bib) for p in Competition.objects.get(pk=self.competition.pk).apply_number_set()]
+		self.assertEqual( sorted(changed), sorted(changed_reference) )
+		self.assertEqual( self.get_state(), state_reference )
+
+#-----------------------------------------------------------------------
+# License holder indexes.
+#
+class LicenseHolderIndexTest( TestCase ):
+	IndexTables = {
+		search_index: LicenseHolderTrigram._meta.db_table,
+		duplicates: LicenseHolderDuplicateKey._meta.db_table,
+	}
+	
+	def setUp( self ):
+		self.license_holders = [
+			LicenseHolder.objects.create( last_name=last_name, first_name='Jan', date_of_birth=datetime.date(1990, 5, 1), license_code='X{}'.format(i) )
+				for i, last_name in enumerate(('Vanderberg', 'Vandenberg', 'Schulzen'))
+		]
+	
+	def assertIndexed( self, lh ):
+		lh = LicenseHolder.objects.get( pk=lh.pk )
+		self.assertTrue( lh.indexed )
+		self.assertEqual( set(LicenseHolderTrigram.objects.filter(license_holder=lh).values_list('trigram', flat=True)), search_index.get_trigrams(lh.search_text) )
+		self.assertEqual(
+			set(LicenseHolderDuplicateKey.objects.filter(license_holder=lh).values_list('key', flat=True)),
+			duplicates.get_blocking_keys(lh.last_name, lh.first_name, lh.date_of_birth, lh.uci_id)
+		)
+	
+	def get_indexes_updated( self, lh, **fields ):
+		for f, v in fields.items():
+			setattr( lh, f, v )
+		with CaptureQueriesContext(connection) as queries:
+			lh.save()
+		self.assertIndexed( lh )
+		return set( index for index, table in self.IndexTables.items() if any(table in q['sql'] for q in queries) )
+	
+	def test_save( self ):
+		for lh in self.license_holders:
+			self.assertIndexed( lh )
+		self.assertTrue( LicenseHolderDuplicate.objects.exists() )
+		
+		lh = LicenseHolder.objects.get( pk=self.license_holders[0].pk )
+		self.assertEqual( self.get_indexes_updated(lh, phone='555-1212'), set() )
+		self.assertEqual( self.get_indexes_updated(lh, gender=1), {duplicates} )
+		self.assertEqual( self.get_indexes_updated(lh, city='Guelph'), {search_index} )
+		self.assertEqual( self.get_indexes_updated(lh, last_name='Vandenburg'), {search_index, duplicates} )
+		
+		# Without all the indexed fields, save cannot tell what changed.
+		lh = LicenseHolder.objects.only( 'pk', 'phone' ).get( pk=lh.pk )
+		self.assertEqual( self.get_indexes_updated(lh, phone='555-1313'), {search_index, duplicates} )
+	
+	def test_bulk_create( self ):
+		LicenseHolder.objects.bulk_create( [
+			LicenseHolder( last_name='Schulzen', first_name='Jan', date_of_birth=datetime.date(1990, 5, 1), license_code='B{}'.format(i),
+				search_text='SCHULZEN JAN B{}'.format(i) )
+				for i in range(3)
+		] )
+		license_holders = list( LicenseHolder.objects.filter(indexed=False) )
+		self.assertEqual( len(license_holders), 3 )
+		self.assertEqual( license_holder_index.index_license_holders(), 3 )
+		for lh in license_holders:
+			self.assertIndexed( lh )
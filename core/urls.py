@@ -194,6 +194,7 @@ urlpatterns = [
 	re_path(r'^.*ParticipantPrintEmergencyContactInfo/(?P<participantId>\d+)/$', participant.ParticipantPrintEmergencyContactInfo ),
 	
 	re_path(r'^.*LicenseHolders/$', views.LicenseHoldersDisplay),
+	re_path(r'^.*LicenseHolderSuggest/$', views.LicenseHolderSuggest),
 	re_path(r'^.*LicenseHolderNew/$', views.LicenseHolderNew),
 	re_path(r'^.*LicenseHolderBarcodeScan/$', views.LicenseHolderBarcodeScan),
 	re_path(r'^.*LicenseHolderRfidScan/$', views.LicenseHolderRfidScan),
@@ -320,6 +321,7 @@ urlpatterns = [
 	re_path(r'^.*SeriesCopy/(?P<seriesId>\d+)/$', series.SeriesCopy),
 	re_path(r'^.*SeriesEdit/(?P<seriesId>\d+)/$', series.SeriesEdit),
 	re_path(r'^.*SeriesDetailEdit/(?P<seriesId>\d+)/$', series.SeriesDetailEdit),
+	re_path(r'^.*SeriesComputeStandings/(?P<seriesId>\d+)/$', series.SeriesComputeStandings),
 	re_path(r'^.*SeriesDelete/(?P<seriesId>\d+)/$', series.SeriesDelete),
 	re_path(r'^.*SeriesDelete/(?P<seriesId>\d+)/(?P<confirmed>\d+)/$', series.SeriesDelete),
 	
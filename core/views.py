@@ -378,7 +378,7 @@ def license_holders_from_search_text( search_text ):
 
 	if not license_holders:
 		if search_text:
-			q = Q()
+			q = get_search_query( search_text.split() )
 			for n in search_text.split():
 				q &= Q( search_text__contains = n )
 			license_holders = LicenseHolder.objects.filter(q)[:MaxReturn]
@@ -448,9 +448,30 @@ def LicenseHoldersDisplay( request ):
 		form = SearchForm( btns, initial = {'search_text': search_text}, additional_buttons_on_new_row=True )
 	
 	license_holders = license_holders_from_search_text( search_text )
+	if search_text and '=' not in search_text and not license_holders:
+		suggestions = get_suggestions( search_text )
 	isEdit = True
 	return render( request, 'license_holder_list.html', locals() )
 
+@access_validation()
+def LicenseHolderSuggest( request ):
+	# "Did you mean" names for a search that found no one.
+	search_text = request.GET.get( 'search_text', '' )
+	response = {
+		'search_text': search_text,
+		'license_holders': [
+			{
+				'id': lh.id,
+				'name': lh.full_name(),
+				'license_code': lh.license_code,
+				'uci_id': lh.uci_id,
+				'date_of_birth': lh.date_of_birth.strftime('%Y-%m-%d'),
+				'location': lh.get_location(),
+			} for lh in get_suggestions( search_text )
+		],
+	}
+	return JsonResponse( response )
+
 #--------------------------------------------------------------------------
 from . import QueryUCI
 lh_uci_records = 'lh_uci_records'
@@ -887,8 +908,10 @@ def ApplyNumberSet( request, competitionId ):
 
 def InitializeNumberSet( request, competitionId ):
 	competition = get_object_or_404( Competition, pk=competitionId )
-	competition.initialize_number_set()
-	return HttpResponseRedirect(getContext(request,'cancelUrl'))
+	counts = competition.initialize_number_set()
+	title = _('Initialize Number Set')
+	target = getContext(request,'cancelUrl')
+	return render( request, 'number_set_initialized.html', locals() )
 
 @autostrip
 class CompetitionSearchForm( Form ):
@@ -974,7 +997,9 @@ def GetCompetitionForm( competition_cur = None ):
 			page_title = _('Apply Number Set')
 			message = _('This will overwrite participant bibs from the NumberSet.')
 			target = pushUrl(request, 'ApplyNumberSet', competition.id)
-			return render( request, 'are_you_sure.html', locals() )
+			participants_changed = competition.apply_number_set( dry_run=True )
+			participants_changed_count = len(participants_changed)
+			return render( request, 'apply_number_set.html', locals() )
 			
 		def initializeNumberSet( self, request, competition ):
 			page_title = _('Initialize Number Set')
@@ -1213,7 +1238,7 @@ def CompetitionDelete( request, competitionId ):
 
 @access_validation()
 def CompetitionDashboard( request, competitionId ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	events_mass_start = competition.get_events_mass_start()
 	events_tt = competition.get_events_tt()
 	category_numbers=competition.categorynumbers_set.all()
@@ -1423,7 +1448,8 @@ def get_annotated_waves( event ):
 	wave_bad_start_count = defaultdict( int )
 	wave_late_reg_count = defaultdict( int )
 	num_nationalities = defaultdict( set )
-	for p in event.get_participants().select_related('license_holder','category'):
+	participants = Participant.annotate_can_start( event.get_participants(), event.competition )
+	for p in participants.select_related('license_holder','category'):
 		w = category_wave[p.category]
 		wave_starter_count[w] += 1
 		if not p.can_start():
@@ -1447,6 +1473,7 @@ def StartListTT( request, eventTTId ):
 	time_stamp = datetime.datetime.now()
 	page_title = u'{} - {}'.format( instance.competition.title, instance.name )
 	wave_tts = get_annotated_waves( instance )
+	participants_seeded = Participant.set_can_start( instance.get_participants_seeded(), instance.competition )
 	return render( request, 'tt_start_list.html', locals() )
 
 def StartListExcelDownload( request, eventId, eventType ):
@@ -1989,7 +2016,8 @@ def SeedingEdit( request, eventTTId ):
 				instance.create_initial_seeding()
 	
 	instance.repair_seeding()
-	entry_tts=list(instance.entrytt_set.all())
+	entry_tts=list(instance.entrytt_set.all().select_related('participant', 'participant__license_holder', 'participant__team', 'participant__category'))
+	Participant.set_can_start( [e.participant for e in entry_tts], instance.competition )
 	for e in entry_tts:
 		e.clock_time = instance.date_time + e.start_time
 	adjustment_formset = AdjustmentFormSet( entry_tts=entry_tts )
@@ -2139,6 +2167,7 @@ def UploadCrossMgr( request ):
 	safe_print( u'UploadCrossMgr: processing...' )
 	if payload:
 		response = read_results.read_results_crossmgr( payload )
+		safe_print( u'UploadCrossMgr: {}'.format(u', '.join(u'{}={:.3f}s'.format(phase, seconds) for phase, seconds in response.get('timings', []))) )
 	safe_print( u'UploadCrossMgr: Done.' )
 	return JsonResponse( response )
 
@@ -2528,7 +2557,7 @@ def EventApplyToExistingParticipants( request, eventId, confirmed=False ):
 
 @access_validation()
 def LicenseHolderAddConfirm( request, competitionId, licenseHolderId, tag_checked=0 ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	license_holder = get_object_or_404( LicenseHolder, pk=licenseHolderId )
 	competition_age = competition.competition_age( license_holder )
 	try:
@@ -2539,7 +2568,7 @@ def LicenseHolderAddConfirm( request, competitionId, licenseHolderId, tag_checke
 
 @access_validation()
 def LicenseHolderConfirmAddToCompetition( request, competitionId, licenseHolderId, tag_checked=0 ):
-	competition = get_object_or_404( Competition, pk=competitionId )
+	competition = get_competition( competitionId )
 	license_holder = get_object_or_404( LicenseHolder, pk=licenseHolderId )
 	try:
 		tag_checked = int(tag_checked)
@@ -2608,6 +2637,9 @@ class SystemInfoForm( ModelForm ):
 			Row(
 				Col(Field('exclude_empty_categories', size=6), 6),
 			),
+			Row(
+				Col(Field('pack_race_times', size=6), 6),
+			),
 			Row(
 				Col(Field('reg_allow_add_multiple_categories', size=6), 6),
 			),
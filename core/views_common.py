@@ -8,6 +8,9 @@ import string
 from . import utils
 from .models import *
 from .WriteLog import logCall
+from .request_cache import get_request_cache, get_object
+from .search_index import get_search_query
+from .name_index import get_suggestions
 
 try:
 	locale.setlocale(locale.LC_ALL, "")
@@ -81,6 +84,8 @@ def access_validation( selfserve_ok=False, no_cache=True ):
 				response = HttpResponseRedirect('/RaceDB/SelfServe')
 			elif not hub_mode and not request.user.is_superuser:
 				# Unless superuser, cannot access a competition in the past.				
+				# Keep what we find in the request cache so the view does not read it again.
+				cache = get_request_cache()
 				competition = None
 				if 'competitionId' in kwargs:
 					competition = Competition.objects.filter(id=kwargs['competitionId']).first()
@@ -88,6 +93,8 @@ def access_validation( selfserve_ok=False, no_cache=True ):
 					participant = Participant.objects.filter(id=kwargs['participantId']).select_related('competition').first()
 					if participant:
 						competition = participant.competition
+						if cache:
+							cache.add( participant )
 				elif 'eventId' in kwargs and 'eventType' in kwargs:
 					try:
 						eventType = int(kwargs['eventType'])
@@ -101,6 +108,10 @@ def access_validation( selfserve_ok=False, no_cache=True ):
 						event = None
 					if event:
 						competition = event.competition
+						if cache:
+							cache.add( event )
+				if competition and cache:
+					cache.add( competition )
 				
 				if competition and competition.is_finished():
 					response = HttpResponseRedirect('/RaceDB/PastCompetition')
@@ -125,6 +136,9 @@ def access_validation( selfserve_ok=False, no_cache=True ):
 # Maximum return for large queries.
 MaxReturn = 500
 
+def get_competition( competitionId ):
+	return get_object( Competition, competitionId )
+
 #-----------------------------------------------------------------------
 
 def Container( *args ):